@@ -0,0 +1,50 @@
+'''
+CAZ checks against a local stand-in of the gov.uk checker (benchmarks/stub_caz.py) and a scratch database.
+
+    py benchmarks/bench_caz.py --regs 40
+    py benchmarks/bench_caz.py --regs 40 --latency 0.5 --workers 8
+
+Times check_caz_bulk cold (every registration walks the four-page flow over HTTP) and warm (all cached),
+and checks the parsed results match the stand-in's zones. Browser fallback is disabled.
+'''
+import argparse, os, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stub_caz import StubCAZ, ZONES
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regs", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stand-in response time per page in seconds")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubCAZ(latency = args.latency)
+    os.environ['CAZ_START_URL'] = stub.start()
+    os.environ['CAZ_BROWSER_FALLBACK'] = '0'
+    os.environ['AUTOTRADER_DB_PATH'] = str(Path(tempfile.mkdtemp()) / "bench.db")
+
+    from utils.database_utils import ensure_tables_exist
+    from utils.caz_client import check_caz_bulk, CAZ_WORKERS, CAZ_RATE_LIMIT
+    ensure_tables_exist()
+
+    # Every tenth registration is unknown to the checker
+    regs = [f"{'ZZ' if i % 10 == 9 else 'AB'}{i % 100:02}CAZ" for i in range(args.regs)]
+    workers = args.workers or CAZ_WORKERS
+
+    start = time.perf_counter()
+    results = check_caz_bulk(regs, workers = workers)
+    cold = time.perf_counter() - start
+    expected = [zone for zone, _, _ in ZONES]
+    ok = sum(1 for r in results.values() if isinstance(r, list) and [z['Zone'] for z in r] == expected)
+    failed = sum(1 for r in results.values() if isinstance(r, dict))
+    print(f"cold:   {cold:.1f}s for {len(regs)} regs ({cold / len(regs) * 1000:.0f} ms/reg, {workers} workers, {CAZ_RATE_LIMIT} pages/s limit)")
+    print(f"        {ok} parsed as expected, {failed} not found")
+
+    start = time.perf_counter()
+    check_caz_bulk(regs, workers = workers)
+    print(f"cached: {(time.perf_counter() - start) * 1000:.0f} ms (unknown registrations are re-checked)")
+    print(f"stand-in: {stub.pages_served} pages served, {stub.csrf_failures} CSRF failures")
+    stub.stop()
@@ -0,0 +1,109 @@
+'''
+Scraper-plus-server contention benchmark against a scratch database.
+
+A separate "scraper" process keeps appending and deleting batches of ads (save_to_sql / delete_ads)
+while threads in this process act like the Flask server (update_flag writes and query_ads reads).
+
+    py benchmarks/bench_db_contention.py --seconds 10 --threads 8
+    py benchmarks/bench_db_contention.py --journal-mode DELETE   # pre-WAL journaling, for comparison
+'''
+import argparse, multiprocessing, os, random, sys, tempfile, threading, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def make_ad(i):
+    return {
+        "Ad URL": f"https://www.autotrader.co.uk/car-details/{i}",
+        "Ad ID": f"bench{i:08}",
+        "Title": "Honda Jazz",
+        "Subtitle": "1.4 i-VTEC EX CVT Euro 5 5dr",
+        "Price": f"£{random.randint(800, 5000):,}",
+        "Mileage": random.randint(10000, 125000),
+        "Registered Year": f"{random.randint(2005, 2018)} (10 reg)",
+        "Distance (miles)": random.randint(1, 50),
+        "Location": "Cardiff",
+        "Ad post date": "2025-07-01",
+        "Favourited": 0,
+        "Excluded": 0,
+        "Scraped at": "2025-07-01 12:00:00",
+    }
+
+def scraper_process(seconds, batch, counter, errors):
+    sys.path.insert(0, str(ROOT))
+    from utils.database_utils import save_to_sql, delete_ads
+
+    next_id = 10_000_000
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        rows = [make_ad(next_id + k) for k in range(batch)]
+        try:
+            save_to_sql(rows)
+            delete_ads([row["Ad ID"] for row in rows[: batch // 2]])
+            with counter.get_lock():
+                counter.value += batch
+        except Exception as e:
+            with errors.get_lock():
+                errors.value += 1
+            print(f"❌ scraper: {e}")
+        next_id += batch
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--threads", type=int, default=8, help="Simulated server request threads")
+    parser.add_argument("--ads", type=int, default=10000, help="Ads seeded before the run")
+    parser.add_argument("--batch", type=int, default=200, help="Rows per scraper write")
+    parser.add_argument("--journal-mode", default="WAL")
+    args = parser.parse_args()
+
+    # Configure the scratch database before anything imports db_connection (child processes inherit it)
+    os.environ['AUTOTRADER_DB_PATH'] = str(Path(tempfile.mkdtemp()) / 'bench.db')
+    os.environ['AUTOTRADER_DB_JOURNAL_MODE'] = args.journal_mode
+    sys.path.insert(0, str(ROOT))
+    from utils.database_utils import ensure_tables_exist, save_to_sql, update_flag, query_ads
+
+    ensure_tables_exist()
+    save_to_sql([make_ad(i) for i in range(args.ads)])
+
+    scraped, scraper_errors = multiprocessing.Value('i', 0), multiprocessing.Value('i', 0)
+    scraper = multiprocessing.Process(target=scraper_process, args=(args.seconds, args.batch, scraped, scraper_errors))
+
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def server_thread():
+        deadline = time.time() + args.seconds
+        while time.time() < deadline:
+            start = time.perf_counter()
+            try:
+                if random.random() < 0.5:
+                    update_flag(f"bench{random.randrange(args.ads):08}", "Favourited", random.randint(0, 1))
+                    kind = 'writes'
+                else:
+                    query_ads({"Excluded": 0}, sort_by="Price", limit=50, page=random.randint(1, 20))
+                    kind = 'reads'
+            except Exception as e:
+                kind = 'errors'
+                print(f"❌ server: {e}")
+            with lock:
+                counts[kind] += 1
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=server_thread) for _ in range(args.threads)]
+    scraper.start()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    scraper.join()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f"journal_mode={args.journal_mode} threads={args.threads} seconds={args.seconds}")
+    print(f"server: {counts['writes'] / args.seconds:.0f} flag writes/s, {counts['reads'] / args.seconds:.0f} page reads/s, "
+          f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, {counts['errors']} errors")
+    print(f"scraper: {scraped.value / args.seconds:.0f} rows/s, {scraper_errors.value} errors")
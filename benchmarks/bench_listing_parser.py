@@ -0,0 +1,66 @@
+'''
+Compares the single-snapshot lxml parser against the per-element WebDriver path.
+
+    py benchmarks/bench_listing_parser.py --cards 1000
+    py benchmarks/bench_listing_parser.py --html saved_search.html --with-browser
+
+`--with-browser` loads the page into a headless Chrome (file:// URL) and also times
+`extract_listing_fields` over every card, which is what `--parser dom` does during a scrape.
+'''
+import argparse, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.listing_parser import parse_listings, build_ad_record
+from benchmarks.synthetic import make_search_page
+
+
+def time_html(page_source, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = [build_ad_record(fields) for fields in parse_listings(page_source)]
+        best = min(best, time.perf_counter() - start)
+    return best, records
+
+def time_dom(html_path):
+    from selenium.webdriver.common.by import By
+    from utils.scrape_utils import DRIVER_POOL, extract_listing_fields
+
+    with DRIVER_POOL.driver(Path(html_path).resolve().as_uri()) as driver:
+        start = time.perf_counter()
+        listings = driver.find_elements(By.CSS_SELECTOR, "div[data-testid='advertCard']")
+        records = [build_ad_record(extract_listing_fields(listing)) for listing in listings]
+        return time.perf_counter() - start, records
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--html", type=str, default=None, help="Saved search results page. Defaults to a synthetic page.")
+    parser.add_argument("--cards", type=int, default=1000, help="Number of cards in the synthetic page")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--with-browser", action="store_true", help="Also time the per-element WebDriver path")
+    args = parser.parse_args()
+
+    if args.html:
+        html_path = Path(args.html)
+        page_source = html_path.read_text(encoding='utf-8')
+    else:
+        page_source = make_search_page(args.cards)
+        html_path = Path(tempfile.mkdtemp()) / "search.html"
+        html_path.write_text(page_source, encoding='utf-8')
+
+    html_time, html_records = time_html(page_source, args.repeat)
+    print(f"html parser: {len(html_records)} listings in {html_time * 1000:.1f} ms (best of {args.repeat})")
+
+    if args.with_browser:
+        dom_time, dom_records = time_dom(html_path)
+        print(f"dom parser:  {len(dom_records)} listings in {dom_time * 1000:.1f} ms")
+        print(f"speed-up: {dom_time / html_time:.0f}x")
+
+        ignore = {'Scraped at'}
+        mismatched = [
+            a['Ad ID'] for a, b in zip(html_records, dom_records)
+            if {k: v for k, v in a.items() if k not in ignore} != {k: v for k, v in b.items() if k not in ignore}
+        ]
+        print(f"records differing between parsers: {len(mismatched)}")
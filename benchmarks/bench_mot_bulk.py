@@ -0,0 +1,59 @@
+'''
+MOT history backfill against a local DVSA stub (benchmarks/stub_dvsa.py) and a scratch database.
+
+    py benchmarks/bench_mot_bulk.py --regs 300
+    py benchmarks/bench_mot_bulk.py --regs 300 --latency 0.3 --revoke-every 100
+
+Times one-at-a-time lookups (the old per-click path) on a sample, then a cold and a warm
+get_mot_histories_bulk over every registration. Reports 429s from the stub and how many tokens were issued.
+'''
+import argparse, os, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stub_dvsa import StubDVSA
+
+
+def make_regs(n):
+    # Every tenth registration has no MOT record (stub answers 404)
+    return [f"{'ZZ' if i % 10 == 0 else 'AB'}{i % 100:02}{chr(65 + i // 676 % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}" for i in range(n)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--regs", type=int, default=300)
+    parser.add_argument("--serial-sample", type=int, default=20, help="Registrations timed one at a time")
+    parser.add_argument("--latency", type=float, default=0.15, help="Stub response time in seconds")
+    parser.add_argument("--revoke-every", type=int, default=None, help="Stub revokes the token after this many requests")
+    args = parser.parse_args()
+
+    stub = StubDVSA(latency = args.latency, revoke_every = args.revoke_every)
+    base_url = stub.start()
+    os.environ['TOKEN_URL'] = f"{base_url}/token"
+    os.environ['MOT_BASE_URL'] = f"{base_url}/v1/trade/vehicles/registration/"
+    os.environ['AUTOTRADER_DB_PATH'] = str(Path(tempfile.mkdtemp()) / "bench.db")
+
+    from utils.database_utils import ensure_tables_exist
+    from utils.mot_history import get_mot_history, get_mot_histories_bulk, MOT_RATE_LIMIT
+    ensure_tables_exist()
+
+    regs = make_regs(args.regs)
+
+    start = time.perf_counter()
+    for reg in regs[:args.serial_sample]:
+        get_mot_history(reg)
+    serial = (time.perf_counter() - start) / args.serial_sample
+    print(f"one at a time:   {serial * 1000:.0f} ms/reg -> ~{serial * len(regs):.1f}s for {len(regs)} regs")
+
+    start = time.perf_counter()
+    results = get_mot_histories_bulk(regs)
+    cold = time.perf_counter() - start
+    errors = sum(1 for r in results.values() if 'error' in r and '404' not in r['error'])
+    print(f"bulk (cold):     {cold:.1f}s for {len(results)} regs ({len(regs) / cold:.1f}/s, limit {MOT_RATE_LIMIT}/s), {errors} errors")
+
+    start = time.perf_counter()
+    get_mot_histories_bulk(regs)
+    print(f"bulk (cached):   {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    print(f"stub: {stub.mot_requests} MOT requests, {stub.throttled} throttled (429), {stub.unauthorised} unauthorised (401), {stub.token_requests} tokens issued")
+    stub.stop()
@@ -0,0 +1,96 @@
+'''
+Compares plate detection with and without plate-region pre-cropping.
+
+    py benchmarks/bench_plate_ocr.py --ads 20
+    py benchmarks/bench_plate_ocr.py --fixtures path/to/fixtures
+
+A fixtures folder holds `images/<ad_id>/*.jpg` plus `labels.json` ({ad_id: {"plate": "AB12 CDE", "boxes": {...}}});
+without `--fixtures` a synthetic set is generated (see benchmarks.synthetic.make_plate_fixtures).
+The proposal stage (ranking and cropping) is always timed and scored against the labelled boxes;
+the OCR comparison runs when easyocr is installed. Both OCR paths bypass the OCR cache.
+'''
+import argparse, json, os, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils.plate_regions import rank_plate_crops
+from benchmarks.synthetic import make_plate_fixtures
+
+
+def covers(box, label, tolerance = 0.1):
+    ''' True if `box` contains the labelled plate box, give or take `tolerance` of its size. '''
+    tol_x, tol_y = (label[2] - label[0]) * tolerance, (label[3] - label[1]) * tolerance
+    return box[0] <= label[0] + tol_x and box[1] <= label[1] + tol_y and box[2] >= label[2] - tol_x and box[3] >= label[3] - tol_y
+
+def ad_images(folder, ad_id):
+    return sorted((folder / 'images' / ad_id).glob('*.jpg'))
+
+def bench_proposals(folder, labels, top_images, crops_per_image):
+    found, latencies = 0, []
+    for ad_id, label in labels.items():
+        start = time.perf_counter()
+        crops = rank_plate_crops(ad_images(folder, ad_id), top_images, crops_per_image)
+        latencies.append(time.perf_counter() - start)
+        boxes = label.get('boxes', {})
+        if any(path.name in boxes and covers(box, boxes[path.name]) for path, box in crops):
+            found += 1
+    return found, latencies
+
+def bench_ocr(labels, precrop):
+    import image_ocr
+
+    engine = image_ocr.OCREngine(cache = False)
+    engine._get_reader() # Load the model before timing
+
+    found, latencies = 0, []
+    for ad_id, label in labels.items():
+        start = time.perf_counter()
+        plates = image_ocr.ocr_reg_plate(ad_id, engine, precrop = precrop)
+        latencies.append(time.perf_counter() - start)
+        if label['plate'].replace(' ', '') in {plate.replace(' ', '') for plate in plates}:
+            found += 1
+    return found, latencies
+
+def report(name, found, latencies, total):
+    latencies = sorted(latencies)
+    mean = sum(latencies) / len(latencies)
+    p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+    print(f"{name:<22} recall {found}/{total} ({found / total:.0%}) | per ad: mean {mean * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms")
+    return mean
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", type=str, default=None, help="Folder with images/<ad_id>/ and labels.json. Defaults to a synthetic set.")
+    parser.add_argument("--ads", type=int, default=20, help="Ads in the synthetic set")
+    parser.add_argument("--images-per-ad", type=int, default=8)
+    parser.add_argument("--top-images", type=int, default=4)
+    parser.add_argument("--crops-per-image", type=int, default=2)
+    parser.add_argument("--skip-ocr", action="store_true", help="Only benchmark the proposal stage")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        folder = Path(args.fixtures).resolve()
+        with open(folder / 'labels.json', encoding = 'utf-8') as f:
+            labels = json.load(f)
+    else:
+        folder = Path(tempfile.mkdtemp())
+        labels = make_plate_fixtures(folder, args.ads, args.images_per_ad)
+    total = len(labels)
+    print(f"{total} ads from {folder}")
+
+    found, latencies = bench_proposals(folder, labels, args.top_images, args.crops_per_image)
+    report("proposals (boxes)", found, latencies, total)
+
+    if args.skip_ocr:
+        sys.exit()
+    try:
+        import easyocr # noqa: F401
+    except ImportError:
+        print("easyocr isn't installed; skipping the OCR comparison")
+        sys.exit()
+
+    os.chdir(folder) # image_ocr reads galleries from ./images/<ad_id>
+    full_mean = report("full-frame OCR", *bench_ocr(labels, precrop = False), total)
+    crop_mean = report("pre-cropped OCR", *bench_ocr(labels, precrop = True), total)
+    print(f"speed-up: {full_mean / crop_mean:.1f}x")
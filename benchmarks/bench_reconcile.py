@@ -0,0 +1,104 @@
+'''
+Post-scrape stale-ad reconciliation and file cleanup on a scratch database and image folder.
+
+    py benchmarks/bench_reconcile.py --ads 100000 --stale 5000 --files 2000
+
+1. DB: the old path (upsert each live listing, load the search's Ad IDs into Python, diff, then delete row by row)
+   against reconcile_search_ads (temp-table anti-join, one transaction). Both run on identical copies.
+2. Files: `--files` removed ads with a thumbnail and gallery each, cleaned with 1 thread and with CLEANUP_WORKERS.
+3. Resume: tombstones left by an interrupted cleanup are finished by the next run.
+'''
+import argparse, os, shutil, sys, tempfile, time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def make_rows(n):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return [{'Ad URL': f'https://example.com/car-details/{i}', 'Ad ID': f'ad{i:08}', 'Title': 'Honda Jazz', 'Price': '£3,000',
+             'Mileage': 50000, 'Registered Year': '2012 (12 reg)', 'Scraped at': now} for i in range(n)]
+
+def make_files(ad_ids, images_per_ad = 8):
+    from utils.image_store import store, update_manifest
+    for ad_id in ad_ids:
+        key = store(ad_id.encode() * 64, Path('thumbnails') / f"{ad_id}.jpg")
+        update_manifest(ad_id, thumbnail = key)
+        images = {}
+        for i in range(images_per_ad):
+            images[f"{i + 1:02}.jpg"] = store(f"{ad_id}-{i}".encode() * 256, Path('images') / ad_id / f"{i + 1:02}.jpg")
+        update_manifest(ad_id, images = images)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ads", type=int, default=100000)
+    parser.add_argument("--stale", type=int, default=5000)
+    parser.add_argument("--files", type=int, default=2000, help="Removed ads given files to clean up")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp())
+    os.chdir(workdir)
+    os.environ['AUTOTRADER_DB_PATH'] = str(workdir / "bench.db")
+
+    from utils.db_connection import get_connection
+    from utils.database_utils import ensure_tables_exist, save_to_sql, save_ad_searches, get_search_ad_ids, delete_ads, reconcile_search_ads
+    from utils.file_cleaner import clean_tombstoned_files, CLEANUP_WORKERS
+    ensure_tables_exist()
+
+    ad_ids = [row['Ad ID'] for row in make_rows(args.ads)]
+    live = set(ad_ids[args.stale:])
+
+    def reset():
+        with get_connection() as conn:
+            conn.execute("DELETE FROM ads")
+            conn.execute("DELETE FROM ad_searches")
+            conn.execute("DELETE FROM file_tombstones")
+        save_to_sql(make_rows(args.ads))
+        save_ad_searches('default', ad_ids)
+
+    def old_reconcile(search, live_ad_ids):
+        with get_connection() as conn:
+            conn.executemany(
+                "INSERT INTO ad_searches (ad_id, search, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (ad_id, search) DO UPDATE SET last_seen = excluded.last_seen",
+                [(ad_id, search, 'now', 'now') for ad_id in live_ad_ids]
+            )
+        stale = get_search_ad_ids(search) - live_ad_ids
+        delete_ads(stale)
+        return stale
+
+    reset()
+    start = time.perf_counter()
+    stale = old_reconcile('default', live)
+    print(f"old (row upserts, Python diff, row deletes): {(time.perf_counter() - start) * 1000:.0f} ms for {len(stale)} of {args.ads} ads")
+
+    reset()
+    start = time.perf_counter()
+    removed = reconcile_search_ads('default', live)
+    print(f"temp-table anti-join, one transaction:       {(time.perf_counter() - start) * 1000:.0f} ms for {len(removed)} of {args.ads} ads")
+
+    files_for = sorted(removed)[:args.files]
+    with get_connection() as conn:
+        conn.execute("DELETE FROM file_tombstones WHERE ad_id NOT IN (%s)" % ",".join("?" * len(files_for)), files_for)
+
+    for workers in (1, CLEANUP_WORKERS):
+        make_files(files_for)
+        with get_connection() as conn:
+            conn.executemany("INSERT OR IGNORE INTO file_tombstones (ad_id, deleted_at) VALUES (?, ?)",
+                             [(ad_id, datetime.now().isoformat()) for ad_id in files_for])
+        start = time.perf_counter()
+        cleaned, freed, failed = clean_tombstoned_files(workers = workers)
+        print(f"cleanup, {workers} thread(s): {cleaned} ads, {freed} blobs in {time.perf_counter() - start:.2f}s")
+
+    # Interrupted run: files half removed, tombstones still there
+    make_files(files_for)
+    with get_connection() as conn:
+        conn.executemany("INSERT OR IGNORE INTO file_tombstones (ad_id, deleted_at) VALUES (?, ?)",
+                         [(ad_id, datetime.now().isoformat()) for ad_id in files_for])
+    for ad_id in files_for[::2]:
+        shutil.rmtree(Path('images') / ad_id)
+    cleaned, _, failed = clean_tombstoned_files()
+    left = sum(1 for ad_id in files_for if (Path('images') / ad_id).exists() or (Path('thumbnails') / f"{ad_id}.jpg").exists())
+    print(f"resume: {cleaned} ads cleaned, {failed} failed, {left} left with files")
+    shutil.rmtree(workdir, ignore_errors = True)
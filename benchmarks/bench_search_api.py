@@ -0,0 +1,64 @@
+'''
+Search API fetcher against a local stand-in (benchmarks/stub_search_api.py).
+
+    py benchmarks/bench_search_api.py --listings 1000
+    py benchmarks/bench_search_api.py --listings 1000 --latency 0.5 --workers 8
+
+1. Parity: the same adverts parsed from DOM markup (listing_parser) and mapped from API pages (search_api)
+   must give identical ad records.
+2. Throughput: all pages one at a time, then `workers` at a time; reported as listings per minute.
+3. Incremental: stops early once a run of already-saved listings is seen.
+4. Fixtures: pages saved with `record_dir` load back offline to the same fields.
+'''
+import argparse, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stub_search_api import StubSearchAPI
+from benchmarks.synthetic import make_search_page, make_search_api_pages
+from utils.listing_parser import parse_listings, build_ad_record
+from utils.search_api import extract_listings, map_listing, fetch_search_results, load_recorded_pages, SearchAPIError, SEARCH_API_WORKERS
+
+
+def records(fields):
+    return [{k: v for k, v in build_ad_record(f).items() if k != 'Scraped at'} for f in fields]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3, help="Stand-in response time per page in seconds")
+    parser.add_argument("--workers", type=int, default=SEARCH_API_WORKERS)
+    args = parser.parse_args()
+
+    dom = records(parse_listings(make_search_page(args.listings)))
+    api = records([map_listing(item) for page in make_search_api_pages(args.listings, args.per_page) for item in extract_listings(page)])
+    mismatched = sum(1 for a, b in zip(dom, api) if a != b) + abs(len(dom) - len(api))
+    print(f"parity:      {len(api)} API listings vs {len(dom)} DOM cards, {mismatched} records differ")
+
+    stub = StubSearchAPI(args.listings, args.per_page, args.latency)
+    stub.start()
+    template = stub.template()
+
+    for workers in (1, args.workers):
+        start = time.perf_counter()
+        fields, outcome = fetch_search_results(template, workers = workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers} worker(s): {len(fields)} listings in {elapsed:.1f}s ({len(fields) / elapsed * 60:,.0f}/min, {outcome})")
+
+    known = {r['Ad ID'] for r in dom[30:]}
+    start = time.perf_counter()
+    fields, outcome = fetch_search_results(template, workers = args.workers, known_ad_ids = known, known_run = 20)
+    print(f"incremental: {len(fields)} listings in {time.perf_counter() - start:.1f}s ({outcome}, 30 new)")
+
+    folder = Path(tempfile.mkdtemp())
+    fields, _ = fetch_search_results(template, workers = args.workers, record_dir = folder)
+    print(f"fixtures:    {len(list(folder.glob('page_*.json')))} pages recorded, replay matches: {load_recorded_pages(folder) == fields}")
+
+    try:
+        fetch_search_results({**template, 'cookies': {}})
+    except SearchAPIError as e:
+        print(f"expired:     {e}")
+    print(f"stand-in:    {stub.requests} pages served, {stub.refused} refused")
+    stub.stop()
@@ -0,0 +1,80 @@
+'''
+Compares two saved runs of the benchmark suite (pytest-benchmark JSON) and flags regressions.
+
+    py benchmarks/compare.py                                 # latest run in benchmarks/results against the one before it
+    py benchmarks/compare.py OLD.json NEW.json --threshold 15
+
+Benchmarks are matched by name and compared on their median. Exits 1 if any got slower by more than
+`--threshold` percent, so it can gate a change.
+'''
+import argparse, json, sys
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+DEFAULT_THRESHOLD = 10 # Percent slower (median) that counts as a regression
+STAT = 'median'
+
+
+def load_run(path):
+    ''' Returns: {benchmark name: median seconds} '''
+    with open(path, encoding = 'utf-8') as f:
+        data = json.load(f)
+    return {bench['fullname']: bench['stats'][STAT] for bench in data['benchmarks']}
+
+def latest_runs(folder = RESULTS_DIR, count = 2):
+    ''' The `count` most recently saved runs, oldest first (pytest-benchmark numbers them NNNN_name.json). '''
+    runs = sorted(folder.glob('*/*.json'), key = lambda path: (path.name.split('_')[0], path.stat().st_mtime))
+    return runs[-count:]
+
+def format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+def compare(old, new, threshold = DEFAULT_THRESHOLD):
+    '''
+    Prints a row per benchmark present in both runs.
+    Returns: list of names that regressed by more than `threshold` percent
+    '''
+    regressions = []
+    width = max((len(name) for name in new), default = 20)
+    print(f"{'benchmark':<{width}}  {'old':>10}  {'new':>10}  {'change':>8}")
+    for name in sorted(new):
+        if name not in old:
+            print(f"{name:<{width}}  {'-':>10}  {format_time(new[name]):>10}  {'new':>8}")
+            continue
+        change = (new[name] - old[name]) / old[name] * 100
+        flag = ""
+        if change > threshold:
+            flag = "  ❌ slower"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = "  ✅ faster"
+        print(f"{name:<{width}}  {format_time(old[name]):>10}  {format_time(new[name]):>10}  {change:>+7.1f}%{flag}")
+    for name in sorted(set(old) - set(new)):
+        print(f"{name:<{width}}  {format_time(old[name]):>10}  {'-':>10}  {'not run':>8}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("old", nargs = '?', help = "Baseline run (JSON); default: second-latest in benchmarks/results")
+    parser.add_argument("new", nargs = '?', help = "Run to check (JSON); default: latest in benchmarks/results")
+    parser.add_argument("--threshold", type = float, default = DEFAULT_THRESHOLD, help = "Percent slower that fails")
+    args = parser.parse_args()
+
+    if args.old and args.new:
+        old_path, new_path = Path(args.old), Path(args.new)
+    else:
+        runs = latest_runs()
+        if len(runs) < 2:
+            sys.exit(f"Need two saved runs in {RESULTS_DIR} (python -m pytest --benchmark-save=NAME), or pass two files")
+        old_path, new_path = runs
+    print(f"{old_path.name} -> {new_path.name} ({STAT}, threshold {args.threshold:g}%)\n")
+
+    regressions = compare(load_run(old_path), load_run(new_path), args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+    print("\n✅ No regressions")
@@ -0,0 +1,140 @@
+'''
+Local stand-in for the gov.uk Clean Air Zone vehicle checker, for offline runs of utils.caz_client.
+
+Serves the same four-page flow (what would you like to do -> enter details -> confirm details -> compliance)
+with GOV.UK-style markup, a per-session CSRF token checked on every POST, and `latency` seconds per page.
+Registrations starting 'ZZ' aren't found (the flow stops at an error page); ones starting 'EV' get an empty
+compliance table (no zones apply).
+'''
+import logging, secrets, threading, time
+from flask import Flask, abort, redirect, request, session, url_for
+from werkzeug.serving import make_server
+
+ZONES = [
+    ("Bath", "£9.00", "Yes"),
+    ("Birmingham", "£8.00", "Yes"),
+    ("Bradford", "No charge", "Yes"),
+    ("Bristol", "£9.00", "Yes"),
+    ("Portsmouth", "No charge", "Yes"),
+    ("Sheffield", "No charge", "Yes"),
+    ("Tyneside (Newcastle and Gateshead)", "No charge", "Yes"),
+]
+
+_PAGE = '''<!DOCTYPE html>
+<html lang="en" class="govuk-template"><head><title>Drive in a Clean Air Zone - GOV.UK</title></head>
+<body class="govuk-template__body"><main class="govuk-main-wrapper" id="main-content">{body}</main></body></html>'''
+
+
+class StubCAZ:
+    def __init__(self, latency = 0.2):
+        self.latency = latency
+        self.pages_served = 0
+        self.csrf_failures = 0
+        self._lock = threading.Lock()
+        self.app = self._create_app()
+        self._server = None
+
+    def _page(self, body):
+        with self._lock:
+            self.pages_served += 1
+        time.sleep(self.latency)
+        token = session.setdefault('csrf', secrets.token_urlsafe(16))
+        return _PAGE.format(body = body.replace('{csrf}', token))
+
+    def _create_app(self):
+        app = Flask(__name__)
+        app.secret_key = 'stub'
+
+        @app.before_request
+        def check_csrf():
+            if request.method == 'POST' and request.form.get('authenticity_token') != session.get('csrf'):
+                with self._lock:
+                    self.csrf_failures += 1
+                abort(422)
+
+        @app.route('/what_would_you_like_to_do', methods = ['GET', 'POST'])
+        def start():
+            if request.method == 'POST':
+                if request.form.get('journey') != 'single':
+                    abort(400)
+                return redirect(url_for('enter_details'))
+            return self._page('''
+                <form action="/what_would_you_like_to_do" method="post">
+                  <input type="hidden" name="authenticity_token" value="{csrf}">
+                  <div class="govuk-radios__item">
+                    <input class="govuk-radios__input" id="journey-1" name="journey" type="radio" value="single">
+                    <label class="govuk-label govuk-radios__label" for="journey-1"><strong>Check a vehicle</strong></label>
+                  </div>
+                  <div class="govuk-radios__item">
+                    <input class="govuk-radios__input" id="journey-2" name="journey" type="radio" value="pay">
+                    <label class="govuk-label govuk-radios__label" for="journey-2"><strong>Pay a charge</strong></label>
+                  </div>
+                  <input type="submit" value="Continue" class="govuk-button">
+                </form>''')
+
+        @app.route('/vehicle_checkers/enter_details', methods = ['GET', 'POST'])
+        def enter_details():
+            if request.method == 'POST':
+                vrn = request.form.get('vrn', '').replace(' ', '').upper()
+                if not vrn or request.form.get('registration-country') != 'UK':
+                    abort(400)
+                session['vrn'] = vrn
+                return redirect(url_for('confirm_details'))
+            return self._page('''
+                <form action="/vehicle_checkers/enter_details" method="post" novalidate>
+                  <input type="hidden" name="authenticity_token" value="{csrf}">
+                  <input class="govuk-input" id="vrn" name="vrn" type="text">
+                  <input class="govuk-radios__input" id="registration-country-1" name="registration-country" type="radio" value="UK" checked>
+                  <input class="govuk-radios__input" id="registration-country-2" name="registration-country" type="radio" value="Non-UK">
+                  <input type="submit" value="Continue" class="govuk-button">
+                </form>''')
+
+        @app.route('/vehicle_checkers/confirm_details', methods = ['GET', 'POST'])
+        def confirm_details():
+            vrn = session.get('vrn')
+            if not vrn:
+                return redirect(url_for('start'))
+            if request.method == 'POST':
+                if request.form.get('confirm-vehicle') != 'yes':
+                    abort(400)
+                return redirect(url_for('compliance'))
+            if vrn.startswith('ZZ'):
+                return self._page('<h1 class="govuk-heading-l">Vehicle details could not be found</h1>')
+            return self._page(f'''
+                <h1 class="govuk-heading-l">Are these vehicle details correct?</h1>
+                <dl class="govuk-summary-list"><dt>Registration number</dt><dd>{vrn}</dd><dt>Make</dt><dd>Honda</dd></dl>
+                <form action="/vehicle_checkers/confirm_details" method="post">
+                  <input type="hidden" name="authenticity_token" value="{{csrf}}">
+                  <input class="govuk-radios__input" id="confirm_details-1" name="confirm-vehicle" type="radio" value="yes">
+                  <input class="govuk-radios__input" id="confirm_details-2" name="confirm-vehicle" type="radio" value="no">
+                  <input type="submit" value="Confirm" class="govuk-button">
+                </form>''')
+
+        @app.route('/vehicle_checkers/compliance')
+        def compliance():
+            if not session.get('vrn'):
+                return redirect(url_for('start'))
+            rows = "".join(
+                f'''<tr class="govuk-table__row"><td class="govuk-table__cell">{zone}</td><td class="govuk-table__cell">{charge}</td>
+                    <td class="govuk-table__cell">{live}</td><td class="govuk-table__cell"><a href="/zones/{i}/map">View map</a></td>
+                    <td class="govuk-table__cell"><a href="https://www.gov.uk/caz-exemptions/{i}">Exemptions</a></td></tr>'''
+                for i, (zone, charge, live) in enumerate(ZONES if not session['vrn'].startswith('EV') else [])
+            )
+            return self._page(f'''
+                <table class="govuk-table" id="compliance-table">
+                  <thead><tr><th>Clean Air Zone</th><th>Daily charge</th><th>Live</th><th>Map</th><th>Exemptions</th></tr></thead>
+                  <tbody>{rows}</tbody>
+                </table>''')
+
+        return app
+
+    def start(self, port = 0):
+        ''' Serves in a background thread. Returns: URL of the first page '''
+        logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+        self._server = make_server('127.0.0.1', port, self.app, threaded = True)
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+        return f"http://127.0.0.1:{self._server.server_port}/what_would_you_like_to_do"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
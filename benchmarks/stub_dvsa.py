@@ -0,0 +1,86 @@
+'''
+Local stand-in for the DVSA token and MOT History endpoints, for offline runs of utils.mot_history.
+
+- POST /token issues a bearer token after `token_latency` seconds (counted, so single-flight refresh can be checked)
+- GET /v1/trade/vehicles/registration/<reg> answers after `latency` seconds; 404 for regs starting 'ZZ'
+- MOT requests beyond a token bucket of `rate_limit`/s with bursts of `burst` get a 429 with Retry-After,
+  which is how the DVSA API gateway enforces its quota
+- With `revoke_every`, tokens are invalidated after that many MOT requests (clients get a 401)
+'''
+import itertools, logging, threading, time
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+class StubDVSA:
+    def __init__(self, latency = 0.1, rate_limit = 15, burst = 10, revoke_every = None, token_latency = 0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self._bucket = burst
+        self._bucket_updated = time.monotonic()
+        self.revoke_every = revoke_every
+        self.token_requests = 0
+        self.mot_requests = 0
+        self.throttled = 0
+        self.unauthorised = 0
+        self._valid_tokens = set()
+        self._token_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.app = self._create_app()
+        self._server = None
+
+    def _create_app(self):
+        app = Flask(__name__)
+
+        @app.route('/token', methods = ['POST'])
+        def token():
+            time.sleep(self.token_latency)
+            with self._lock:
+                self.token_requests += 1
+                token = f"stub-token-{next(self._token_ids)}"
+                self._valid_tokens.add(token)
+            return jsonify({'access_token': token, 'expires_in': 3600, 'token_type': 'Bearer'})
+
+        @app.route('/v1/trade/vehicles/registration/<reg>')
+        def mot(reg):
+            token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+            with self._lock:
+                now = time.monotonic()
+                self._bucket = min(self.burst, self._bucket + (now - self._bucket_updated) * self.rate_limit)
+                self._bucket_updated = now
+                if self._bucket < 1:
+                    self.throttled += 1
+                    return jsonify({'message': 'Too Many Requests'}), 429, {'Retry-After': '1'}
+                self._bucket -= 1
+
+                if token not in self._valid_tokens:
+                    self.unauthorised += 1
+                    return jsonify({'message': 'Unauthorized'}), 401
+                self.mot_requests += 1
+                if self.revoke_every and self.mot_requests % self.revoke_every == 0:
+                    self._valid_tokens.discard(token)
+
+            time.sleep(self.latency)
+            if reg.startswith('ZZ'):
+                return jsonify({'errorCode': 'MOTH-NF-01', 'errorMessage': f'No data found for {reg}'}), 404
+            return jsonify({
+                'registration': reg,
+                'make': 'HONDA',
+                'model': 'JAZZ',
+                'motTests': [{'completedDate': '2025-03-01T10:00:00.000Z', 'testResult': 'PASSED', 'odometerValue': '81234', 'odometerUnit': 'MI', 'defects': []}],
+            })
+
+        return app
+
+    def start(self, port = 0):
+        ''' Serves in a background thread. Returns: base URL '''
+        logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+        self._server = make_server('127.0.0.1', port, self.app, threaded = True)
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
@@ -0,0 +1,70 @@
+'''
+Local stand-in for the site's search API (GraphQL gateway), for offline runs of utils.search_api.
+
+- POST /at-gateway answers with the results page named by `page` in the request body after `latency` seconds
+- Pages come from synthetic.make_search_api_pages, so they describe the same adverts as synthetic.make_search_page,
+  or from `pages` (e.g. responses recorded with search_api's `record_dir`)
+- Requests without the session cookie get a 403, like an expired captured session
+'''
+import logging, threading, time
+from flask import Flask, abort, jsonify, request
+from werkzeug.serving import make_server
+
+from benchmarks.synthetic import make_search_api_pages
+
+SESSION_COOKIE = ('bm_sv', 'stub-session')
+
+
+class StubSearchAPI:
+    def __init__(self, n_listings = 500, per_page = 10, latency = 0.3, seed = 0, pages = None):
+        self.pages = pages or make_search_api_pages(n_listings, per_page, seed)
+        self.latency = latency
+        self.requests = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+        self.app = self._create_app()
+        self._server = None
+
+    def _create_app(self):
+        app = Flask(__name__)
+
+        @app.route('/at-gateway', methods = ['POST'])
+        def gateway():
+            if request.cookies.get(SESSION_COOKIE[0]) != SESSION_COOKIE[1]:
+                with self._lock:
+                    self.refused += 1
+                abort(403)
+            with self._lock:
+                self.requests += 1
+            time.sleep(self.latency)
+            page = request.get_json()[0]['variables']['page']
+            if page > len(self.pages):
+                # Past the end: an empty page with the same envelope
+                return jsonify([{'data': {'searchResults': {'listings': [], 'page': {'number': page, 'count': len(self.pages)}}}}])
+            return jsonify(self.pages[page - 1])
+
+        return app
+
+    def template(self):
+        ''' A request template as utils.search_api.capture_search_template would record it. '''
+        return {
+            'url': f"http://127.0.0.1:{self._server.server_port}/at-gateway?opname=SearchResultsListingsGridQuery",
+            'headers': {'Content-Type': 'application/json', 'x-sauron-app-name': 'sauron-search-results-app'},
+            'body': [{
+                'operationName': 'SearchResultsListingsGridQuery',
+                'variables': {'filters': [{'filter': 'price_to', 'selected': ['5000']}], 'channel': 'cars', 'page': 1, 'sortBy': 'datedesc'},
+                'query': 'query SearchResultsListingsGridQuery(...) { ... }',
+            }],
+            'cookies': dict([SESSION_COOKIE]),
+        }
+
+    def start(self, port = 0):
+        ''' Serves in a background thread. Returns: base URL '''
+        logging.getLogger('werkzeug').setLevel(logging.ERROR) # No per-request access log
+        self._server = make_server('127.0.0.1', port, self.app, threaded = True)
+        threading.Thread(target = self._server.serve_forever, daemon = True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
@@ -0,0 +1,65 @@
+'''
+Database and API hot paths against synthetic databases of each size in BENCH_DB_SIZES.
+'''
+import json, threading
+
+from benchmarks.suite.databases import load_db
+from utils.db_connection import get_connection
+from utils.database_utils import load_ads, update_flag, get_search_ad_ids, reconcile_search_ads
+
+FLAG_THREADS = 8
+FLAG_UPDATES_PER_THREAD = 25
+STALE_FRACTION = 0.05 # Share of a search's ads that a reconciliation removes
+
+
+def bench_load_ads(benchmark, ads_db):
+    ads = benchmark(load_ads)
+    assert len(ads) == ads_db
+
+def bench_api_ads_full(benchmark, ads_db, client):
+    ''' The whole list as the frontend loads it: query, then JSON serialization of every row. '''
+    def get():
+        response = client.get('/api/ads')
+        assert response.status_code == 200
+        return response.get_data()
+    body = benchmark(get)
+    assert json.loads(body)['total'] == ads_db
+
+def bench_api_ads_page(benchmark, ads_db, client):
+    ''' One sorted, filtered page, the indexed path. '''
+    def get():
+        response = client.get('/api/ads?sortBy=Price&direction=desc&max_mileage=100000&page=3&limit=50')
+        assert response.status_code == 200
+        return response.get_data()
+    body = benchmark(get)
+    assert len(json.loads(body)['data']) == 50
+
+def bench_update_flag_concurrent(benchmark, ads_db):
+    ''' FLAG_THREADS request threads favouriting different ads at once, as through /api/fav_exc. '''
+    ad_ids = sorted(get_search_ad_ids('default'))
+
+    def run():
+        def worker(t):
+            for i in range(FLAG_UPDATES_PER_THREAD):
+                update_flag(ad_ids[(t * FLAG_UPDATES_PER_THREAD + i) % len(ad_ids)], 'Favourited', 1)
+        threads = [threading.Thread(target = worker, args = (t,)) for t in range(FLAG_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    benchmark.pedantic(run, rounds = 5, iterations = 1)
+    favourited = get_connection().execute('SELECT COUNT(*) FROM ads WHERE "Favourited" = 1').fetchone()[0]
+    assert favourited == min(FLAG_THREADS * FLAG_UPDATES_PER_THREAD, ads_db)
+
+def bench_reconcile_stale_ads(benchmark, ads_db):
+    ''' Full-sweep reconciliation removing STALE_FRACTION of the ads; the database is reloaded before each round. '''
+    ad_ids = sorted(get_search_ad_ids('default'))
+    live = set(ad_ids[int(len(ad_ids) * STALE_FRACTION):])
+
+    def setup():
+        load_db(ads_db)
+        return ('default', live), {}
+
+    removed = benchmark.pedantic(reconcile_search_ads, setup = setup, rounds = 3, iterations = 1)
+    assert len(removed) == len(ad_ids) - len(live)
@@ -0,0 +1,32 @@
+'''
+Scrape-side hot paths on saved HTML fixtures and synthetic OCR output: no browser or network.
+'''
+import pytest
+from lxml import html
+
+from benchmarks.synthetic import make_ocr_texts
+from utils.listing_parser import parse_listings, build_ad_record
+from utils.scrape_utils import extract_highest_res_images
+
+
+def bench_parse_search_page(benchmark, search_page):
+    records = benchmark(lambda: [build_ad_record(fields) for fields in parse_listings(search_page)])
+    assert records and all(record['Ad ID'] for record in records)
+
+def bench_extract_highest_res_images(benchmark, ad_page):
+    # The srcset URLs extract_gallery_urls collects from the open gallery
+    tree = html.fromstring(ad_page)
+    urls = [
+        part.strip().split(" ")[0]
+        for srcset in tree.xpath("//div[@role='dialog']//picture//source/@srcset")
+        for part in srcset.split(",") if "media" in part
+    ]
+    images = benchmark(extract_highest_res_images, urls)
+    assert images and all('/w1600/' in url for url in images)
+
+def bench_clean_and_match_plates(benchmark):
+    # image_ocr loads easyocr at import
+    image_ocr = pytest.importorskip('image_ocr', reason = "image_ocr needs easyocr")
+    texts = make_ocr_texts(5000)
+    plates = benchmark(image_ocr.clean_and_match_plates, texts)
+    assert plates
@@ -0,0 +1,36 @@
+'''
+Fixtures for the offline benchmark suite (see benchmarks/pytest.ini).
+
+Everything runs against a scratch database (see databases.py); each `ads_db` benchmark gets a fresh copy of a
+synthetic database per size. HTML fixtures are read from benchmarks/fixtures; save a real page over them to
+benchmark against it.
+'''
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from benchmarks.suite.databases import BENCH_DIR, DB_SIZES, load_db
+
+FIXTURES_DIR = BENCH_DIR / 'fixtures'
+
+
+@pytest.fixture(params = DB_SIZES, ids = lambda n: f"{n}ads")
+def ads_db(request):
+    ''' Number of ads in the freshly loaded scratch database. '''
+    return load_db(request.param)
+
+@pytest.fixture(scope = 'session')
+def search_page():
+    return (FIXTURES_DIR / 'search_results.html').read_text(encoding = 'utf-8')
+
+@pytest.fixture(scope = 'session')
+def ad_page():
+    return (FIXTURES_DIR / 'ad_page.html').read_text(encoding = 'utf-8')
+
+@pytest.fixture(scope = 'session')
+def client():
+    from server import app
+    return app.test_client()
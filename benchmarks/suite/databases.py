@@ -0,0 +1,59 @@
+'''
+Scratch and synthetic databases for the benchmark suite.
+
+Importing this sets AUTOTRADER_DB_PATH to a scratch database in a temp folder, so it must come before any utils import.
+Synthetic ads databases (BENCH_DB_SIZES, default 1k, 10k and 100k ads) are built once and cached under
+benchmarks/.cache; `load_db` copies one into the scratch database.
+'''
+import os, sqlite3, tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent.parent
+WORK_DIR = Path(tempfile.mkdtemp(prefix = 'autotrader-bench-'))
+os.environ['AUTOTRADER_DB_PATH'] = str(WORK_DIR / 'bench.db')
+
+CACHE_DIR = BENCH_DIR / '.cache'
+DB_SIZES = [int(n) for n in os.getenv('BENCH_DB_SIZES', '1000,10000,100000').split(',')]
+SCHEMA_VERSION = 1 # Bump when the ads schema changes so cached databases are rebuilt
+
+from benchmarks.synthetic import make_listings, make_ad_record
+
+
+def _build_cached_db(n, path):
+    ''' Builds a synthetic database of `n` ads in the scratch database, then copies it to `path`. '''
+    from utils.db_connection import get_connection
+    from utils.database_utils import ensure_tables_exist, save_to_sql, save_ad_searches
+    clear_db()
+    ensure_tables_exist()
+    records = [make_ad_record(listing) for listing in make_listings(n, seed = n)]
+    for i in range(0, n, 10000):
+        save_to_sql(records[i:i + 10000])
+    save_ad_searches('default', [record['Ad ID'] for record in records])
+    tmp = path.with_suffix('.tmp')
+    target = sqlite3.connect(tmp)
+    get_connection().backup(target)
+    target.close()
+    tmp.replace(path)
+
+def clear_db():
+    from utils.db_connection import get_connection
+    conn = get_connection()
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE '%fts_%'")]
+    with conn:
+        for table in tables:
+            conn.execute(f'DELETE FROM "{table}"')
+
+def load_db(n):
+    '''
+    Replaces the scratch database's contents with the cached synthetic database of `n` ads.
+    The backup API writes through SQLite, so connections already open on other threads see the new data.
+    '''
+    from utils.db_connection import get_connection
+    CACHE_DIR.mkdir(exist_ok = True)
+    path = CACHE_DIR / f"ads_{n}_v{SCHEMA_VERSION}.db"
+    if not path.exists():
+        _build_cached_db(n, path)
+    source = sqlite3.connect(path)
+    source.backup(get_connection())
+    source.close()
+    return n
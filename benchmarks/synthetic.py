@@ -0,0 +1,217 @@
+'''
+Synthetic AutoTrader-like fixtures for offline benchmarks.
+The markup mirrors the selectors used by utils.listing_parser / scrape_utils.extract_listing_fields.
+'''
+import random
+
+_MAKES = [("Honda", "Jazz"), ("Toyota", "Yaris"), ("Ford", "Fiesta"), ("Nissan", "Micra"), ("Skoda", "Fabia"), ("Mazda", "2")]
+_TOWNS = ["Cardiff", "Newport", "Caerphilly", "Bristol", "Swansea", "Porthcawl"]
+
+_CARD = '''
+<div data-testid="advertCard">
+  <a data-testid="search-listing-title" href="/car-details/{advert_id}?sort=relevance&amp;postcode=CF838TF">
+    <h3>{make} {model}</h3>
+    <p data-testid="search-listing-subtitle">{subtitle}</p>
+  </a>
+  <img class="main-image" src="https://m.atcdn.co.uk/a/media/w300/{media}.jpg" alt="">
+  <div class="at__sc-u4ap7c-12 price"><span>£{price:,}</span></div>
+  <ul>
+    <li data-testid="registered_year">{year} ({plate} reg)</li>
+    <li data-testid="mileage">{mileage:,} miles</li>
+  </ul>
+  <span data-testid="search-listing-location">{town} ({distance} miles)</span>
+</div>'''
+
+
+def make_listing(i, rng):
+    make, model = rng.choice(_MAKES)
+    year = rng.randint(2005, 2018)
+    return {
+        'advert_id': f"2025{rng.randint(1, 12):02}{rng.randint(1, 28):02}{i:07}",
+        'make': make,
+        'model': model,
+        'subtitle': f"{rng.choice(['1.2', '1.4', '1.5'])} {rng.choice(['SE', 'EX', 'Zetec', 'Icon'])} Auto Euro {rng.randint(4, 6)} 5dr",
+        'media': f"{rng.getrandbits(128):032x}",
+        'price': rng.randint(800, 5000),
+        'year': year,
+        'plate': f"{year % 100:02}",
+        'mileage': rng.randint(10000, 125000),
+        'town': rng.choice(_TOWNS),
+        'distance': rng.randint(1, 50),
+    }
+
+def make_listings(n, seed = 0):
+    rng = random.Random(seed)
+    return [make_listing(i, rng) for i in range(n)]
+
+def make_search_page(n_cards, seed = 0):
+    ''' Returns HTML for a search results page with `n_cards` advert cards. '''
+    cards = "".join(_CARD.format(**listing) for listing in make_listings(n_cards, seed))
+    return f"<html><head><title>Search</title></head><body><main>{cards}</main></body></html>"
+
+def make_ad_record(listing):
+    ''' The row `build_ad_record` would store for `listing`, without going through the parser. '''
+    return {
+        'Ad URL': f"https://www.autotrader.co.uk/car-details/{listing['advert_id']}",
+        'Ad ID': listing['advert_id'],
+        'Title': f"{listing['make']} {listing['model']}",
+        'Subtitle': listing['subtitle'],
+        'Price': f"£{listing['price']:,}",
+        'Mileage': listing['mileage'],
+        'Registered Year': f"{listing['year']} ({listing['plate']} reg)",
+        'Distance (miles)': listing['distance'],
+        'Location': listing['town'],
+        'Ad post date': f"2025-{listing['advert_id'][4:6]}-{listing['advert_id'][6:8]}",
+        'Favourited': 0,
+        'Excluded': 0,
+        'Scraped at': "2025-07-01 12:00:00",
+    }
+
+_GALLERY_WIDTHS = (320, 480, 800, 1024, 1600)
+
+def make_ad_page(n_images = 30, seed = 0):
+    '''
+    Returns HTML for an ad page with its gallery dialog open: one <picture> per image whose <source> srcsets
+    list every width, as read by scrape_utils.extract_gallery_urls.
+    '''
+    rng = random.Random(seed)
+    pictures = []
+    for _ in range(n_images):
+        media = f"{rng.getrandbits(128):032x}"
+        srcset = ", ".join(f"https://m.atcdn.co.uk/a/media/w{w}/{media}.jpg {w}w" for w in _GALLERY_WIDTHS)
+        pictures.append(
+            f'<picture><source type="image/webp" srcset="{srcset.replace(".jpg", ".webp")}">'
+            f'<source srcset="{srcset}"><img class="ImageGalleryImage__image" src="https://m.atcdn.co.uk/a/media/w480/{media}.jpg"></picture>'
+        )
+    gallery = "".join(pictures)
+    return (
+        '<html><head><title>Ad</title></head><body>'
+        '<button data-testid="open-carousel-0">View gallery</button>'
+        f'<div role="dialog">{gallery}</div></body></html>'
+    )
+
+def make_ocr_texts(n, seed = 0):
+    ''' OCR output as easyocr returns it for gallery photos: mostly noise, with plates (some misread) mixed in. '''
+    rng = random.Random(seed)
+    noise = ["AUTO", "HONDA", "i-VTEC", "5dr", "CARDIFF MOTORS", "www.cardiffmotors.co.uk", "01234 567890", "SPORT", "Hybrid", "EURO 5"]
+    texts = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.15:
+            texts.append(make_plate(rng))
+        elif roll < 0.2:
+            plate = make_plate(rng).replace(" ", "")
+            texts.append(plate[:2] + rng.choice("OIL") + plate[3:])
+        else:
+            texts.append(rng.choice(noise))
+    return texts
+
+def make_api_listing(listing):
+    ''' The same advert as `_CARD`, shaped like a listing in the site's search API (GraphQL) response. '''
+    return {
+        '__typename': 'SearchListing',
+        'advertId': listing['advert_id'],
+        'title': f"{listing['make']} {listing['model']}",
+        'subTitle': listing['subtitle'],
+        'price': f"£{listing['price']:,}",
+        'vehicleLocation': listing['town'],
+        'formattedDistance': f"{listing['distance']} miles",
+        'images': [f"https://m.atcdn.co.uk/a/media/{{resize}}/{listing['media']}.jpg"],
+        'fpaLink': f"/car-details/{listing['advert_id']}?sort=relevance&postcode=CF838TF",
+        'badges': [
+            {'type': 'REGISTERED_YEAR', 'displayText': f"{listing['year']} ({listing['plate']} reg)"},
+            {'type': 'MILEAGE', 'displayText': f"{listing['mileage']:,} miles"},
+        ],
+    }
+
+def make_search_api_pages(n_listings, per_page = 10, seed = 0):
+    ''' Returns: one search API response per page, covering the same adverts as `make_search_page(n_listings, seed)` '''
+    listings = make_listings(n_listings, seed)
+    page_count = max(1, -(-n_listings // per_page))
+    return [
+        [{'data': {'searchResults': {
+            'listings': [make_api_listing(listing) for listing in listings[(page - 1) * per_page:page * per_page]],
+            'page': {'number': page, 'count': page_count, 'results': {'count': n_listings}},
+        }}}]
+        for page in range(1, page_count + 1)
+    ]
+
+_PLATE_LETTERS = "ABCDEFGHJKLMNOPRSTUVWXYZ"
+
+def make_plate(rng):
+    letters = lambda n: "".join(rng.choice(_PLATE_LETTERS) for _ in range(n))
+    return f"{letters(2)}{rng.randint(10, 75):02} {letters(3)}"
+
+def _draw_scene(rng, size):
+    ''' Car-photo-like clutter: a vertical gradient, some panels and a slatted grille, plus sensor noise. '''
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    w, h = size
+    top, bottom = rng.randint(90, 200), rng.randint(20, 120)
+    gradient = np.linspace(top, bottom, h, dtype = np.float32)[:, None].repeat(w, axis = 1)
+    img = Image.fromarray(gradient.astype(np.uint8)).convert('RGB')
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(3, 8)):
+        x0, y0 = rng.randint(0, w - 50), rng.randint(0, h - 50)
+        colour = tuple(rng.randint(0, 255) for _ in range(3))
+        draw.rectangle((x0, y0, x0 + rng.randint(40, w // 2), y0 + rng.randint(30, h // 3)), fill = colour)
+    grille_x, grille_y = rng.randint(0, w // 2), rng.randint(h // 3, h // 2)
+    for i in range(rng.randint(4, 9)):
+        y = grille_y + i * 8
+        draw.line((grille_x, y, grille_x + w // 3, y), fill = (20, 20, 20), width = 3)
+    noise = np.asarray(img, dtype = np.int16) + np.random.default_rng(rng.getrandbits(32)).integers(-12, 12, (h, w, 3))
+    return Image.fromarray(np.clip(noise, 0, 255).astype(np.uint8))
+
+def make_plate_image(rng, size = (1024, 768), plate = None):
+    '''
+    Returns: (PIL image, plate box or None). With `plate` set, a UK-style plate is drawn on a car-like scene.
+    '''
+    from PIL import ImageDraw, ImageFont
+
+    img = _draw_scene(rng, size)
+    if not plate:
+        return img, None
+
+    w, h = size
+    plate_h = rng.randint(h // 20, h // 10)
+    plate_w = int(plate_h * 4.7)
+    x0, y0 = rng.randint(0, w - plate_w), rng.randint(h // 2, h - plate_h)
+    box = (x0, y0, x0 + plate_w, y0 + plate_h)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle(box, fill = rng.choice([(240, 240, 235), (245, 200, 30)]), outline = (0, 0, 0))
+    font = ImageFont.load_default(size = int(plate_h * 0.75))
+    draw.text((x0 + plate_w // 2, y0 + plate_h // 2), plate, fill = (10, 10, 10), font = font, anchor = 'mm')
+    return img, box
+
+def make_plate_fixtures(folder, n_ads = 20, images_per_ad = 8, seed = 0):
+    '''
+    Writes `images/<ad_id>/NN.jpg` galleries under `folder`: each ad has the plate on 1-2 exterior shots
+    and clutter-only "interior" shots otherwise. Labels go to `labels.json` as
+    {ad_id: {"plate": ..., "boxes": {filename: [x0, y0, x1, y1]}}}.
+    Returns: the labels dict.
+    '''
+    import json
+    from pathlib import Path
+
+    rng = random.Random(seed)
+    folder = Path(folder)
+    labels = {}
+    for a in range(n_ads):
+        ad_id = f"fixture{a:04}"
+        plate = make_plate(rng)
+        plate_shots = set(rng.sample(range(images_per_ad), rng.randint(1, 2)))
+        ad_folder = folder / 'images' / ad_id
+        ad_folder.mkdir(parents = True, exist_ok = True)
+        boxes = {}
+        for i in range(images_per_ad):
+            img, box = make_plate_image(rng, plate = plate if i in plate_shots else None)
+            filename = f"{i + 1:02}.jpg"
+            img.save(ad_folder / filename, 'JPEG', quality = 85)
+            if box:
+                boxes[filename] = list(box)
+        labels[ad_id] = {'plate': plate, 'boxes': boxes}
+
+    with open(folder / 'labels.json', 'w', encoding = 'utf-8') as f:
+        json.dump(labels, f, indent = 1)
+    return labels
@@ -0,0 +1,27 @@
+'''
+Fixtures for the offline tests (see benchmarks/pytest.ini): the app's clients against the local stand-ins in
+benchmarks/ and a scratch database, with no network access.
+'''
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from benchmarks.suite.databases import BENCH_DIR, clear_db
+
+FIXTURES_DIR = BENCH_DIR / 'fixtures'
+
+
+@pytest.fixture
+def db():
+    ''' An empty scratch database with every table. '''
+    from utils.database_utils import ensure_tables_exist
+    ensure_tables_exist()
+    clear_db()
+
+@pytest.fixture
+def client(db):
+    from server import app
+    return app.test_client()
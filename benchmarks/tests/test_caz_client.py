@@ -0,0 +1,108 @@
+'''
+utils.caz_client against the gov.uk checker stand-in (benchmarks/stub_caz.py): the four-page flow, table parsing,
+caching in the caz table and /api/check-caz's status codes.
+'''
+from datetime import datetime
+
+import pytest
+import requests
+from lxml import html
+
+from benchmarks.stub_caz import StubCAZ, ZONES
+from utils import caz_client
+from utils.db_connection import run_write
+from utils.database_utils import get_caz_data_bulk
+from utils.general_utils import TokenBucket
+
+ZONE_NAMES = [zone for zone, _, _ in ZONES]
+
+
+@pytest.fixture
+def caz(db, monkeypatch):
+    stub = StubCAZ(latency = 0)
+    monkeypatch.setattr(caz_client, 'CAZ_START_URL', stub.start())
+    monkeypatch.setattr(caz_client, 'CAZ_BROWSER_FALLBACK', False)
+    monkeypatch.setattr(caz_client, '_rate_limiter', TokenBucket(1000, 1000))
+    yield stub
+    stub.stop()
+
+def checked_ago(age):
+    run_write(lambda conn: conn.execute("UPDATE caz SET created_at = ?", ((datetime.now() - age).isoformat(),)))
+
+
+def test_check_carries_csrf_between_pages(caz):
+    zones = caz_client.check_caz_http('AB12CDE')
+
+    assert [zone['Zone'] for zone in zones] == ZONE_NAMES
+    assert caz.pages_served == 4
+    assert caz.csrf_failures == 0
+
+def test_stand_in_refuses_posts_without_csrf(caz):
+    session = requests.Session()
+    session.get(caz_client.CAZ_START_URL)
+    assert session.post(caz_client.CAZ_START_URL, data = {'journey': 'single'}).status_code == 422
+    assert caz.csrf_failures == 1
+
+def test_parse_compliance_table():
+    page = html.fromstring('''
+        <table id="compliance-table"><thead><tr><th>Clean Air Zone</th></tr></thead><tbody>
+          <tr><td>Bath</td><td>£9.00</td><td>Yes</td><td><a href="/zones/0/map">View map</a></td>
+              <td><a href="https://www.gov.uk/caz-exemptions/0">Exemptions</a></td></tr>
+          <tr><td>Bradford</td><td>No charge</td><td>Yes</td><td></td><td></td></tr>
+          <tr><td colspan="5">Charges correct at time of checking</td></tr>
+        </tbody></table>''', base_url = 'https://checker.example/vehicle_checkers/compliance')
+
+    assert caz_client.parse_compliance_table(page) == [
+        {'Zone': 'Bath', 'Daily Charge': '£9.00', 'Zone Live': 'Yes',
+         'Map URL': 'https://checker.example/zones/0/map', 'Exemptions URL': 'https://www.gov.uk/caz-exemptions/0'},
+        {'Zone': 'Bradford', 'Daily Charge': 'No charge', 'Zone Live': 'Yes', 'Map URL': None, 'Exemptions URL': None},
+    ]
+
+def test_parse_compliance_table_without_a_table():
+    page = html.fromstring('<h1>Something went wrong</h1>', base_url = 'https://checker.example/vehicle_checkers/compliance')
+    with pytest.raises(caz_client.CAZCheckError):
+        caz_client.parse_compliance_table(page)
+
+def test_rejected_registration_is_a_422_and_not_cached(caz, client):
+    with pytest.raises(caz_client.CAZRejected):
+        caz_client.check_caz_http('ZZ01CAZ')
+
+    response = client.get('/api/check-caz?reg=ZZ01 CAZ')
+    assert response.status_code == 422
+    assert response.get_json()['reason'] == 'rejected'
+    assert get_caz_data_bulk(['ZZ01CAZ'], datetime.min) == {}
+
+def test_invalid_registration_is_a_400_without_a_check(caz, client):
+    response = client.get('/api/check-caz?reg=NOT-A-REG!')
+    assert response.status_code == 400
+    assert response.get_json()['reason'] == 'invalid'
+    assert caz.pages_served == 0
+
+def test_checker_outage_is_a_502(caz, client):
+    caz.stop()
+    response = client.get('/api/check-caz?reg=AB12CDE')
+    assert response.status_code == 502
+    assert response.get_json()['reason'] == 'upstream'
+
+def test_no_zones_are_cached(caz, client):
+    for _ in range(2):
+        response = client.get('/api/check-caz?reg=EV01CAZ')
+        assert response.status_code == 200
+        assert response.get_json() == {'registration': 'EV01CAZ', 'zone': []}
+    assert caz.pages_served == 4
+
+def test_cache_hits_within_the_ttl_skip_the_network(caz):
+    regs = ['AB12CDE', 'AB13CDE']
+    assert [zone['Zone'] for zone in caz_client.check_caz_bulk(regs)['AB13CDE']] == ZONE_NAMES
+    assert caz.pages_served == 8
+
+    checked_ago(caz_client.CAZ_CACHE_TTL / 2)
+    assert [zone['Zone'] for zone in caz_client.check_caz_bulk(['ab12 cde'])['AB12CDE']] == ZONE_NAMES
+    assert caz.pages_served == 8
+
+    checked_ago(caz_client.CAZ_CACHE_TTL * 2)
+    caz_client.check_caz_bulk(regs)
+    assert caz.pages_served == 16
+
+    caz_client.check_caz_bulk(regs, max_age = None)
+    assert caz.pages_served == 24
@@ -0,0 +1,105 @@
+'''
+utils.mot_history against the DVSA stand-in (benchmarks/stub_dvsa.py): token refresh, the mot_cache TTLs and
+the /api/mot_history/bulk response.
+'''
+import time
+
+import pytest
+from urllib3.util.retry import Retry
+
+from benchmarks.stub_dvsa import StubDVSA
+from utils import mot_history
+from utils.db_connection import run_write
+from utils.database_utils import get_mot_cache
+from utils.general_utils import TokenBucket
+
+HOUR = 60 * 60
+
+
+@pytest.fixture
+def dvsa(db, monkeypatch):
+    stub = StubDVSA(latency = 0, rate_limit = 1000, burst = 1000)
+    base_url = stub.start()
+    monkeypatch.setattr(mot_history, 'TOKEN_URL', f"{base_url}/token")
+    monkeypatch.setattr(mot_history, 'BASE_URL', f"{base_url}/v1/trade/vehicles/registration/")
+    monkeypatch.setattr(mot_history, '_rate_limiter', TokenBucket(1000, 1000))
+    monkeypatch.setattr(mot_history, '_token_cache', {'access_token': None, 'expires_at': 0})
+    yield stub
+    stub.stop()
+
+def fetched_hours_ago(hours):
+    run_write(lambda conn: conn.execute("UPDATE mot_cache SET fetched_at = ?", (time.time() - hours * HOUR,)))
+
+
+def test_concurrent_401s_refresh_the_token_once(dvsa):
+    # Every worker starts with a token the API no longer accepts; the refresh is slow enough that all of them hit the 401
+    dvsa.token_latency = 0.3
+    mot_history._token_cache.update(access_token = 'revoked', expires_at = time.time() + HOUR)
+    regs = [f"AB{i:02}CDE" for i in range(8)]
+
+    results = mot_history.get_mot_histories_bulk(regs, workers = 8)
+
+    assert dvsa.unauthorised == 8
+    assert dvsa.token_requests == 1
+    assert all(results[reg]['registration'] == reg for reg in regs)
+
+def test_histories_are_reused_for_24_hours(dvsa):
+    mot_history.get_mot_histories_bulk(['AB12CDE'])
+    assert dvsa.mot_requests == 1
+
+    fetched_hours_ago(23)
+    assert mot_history.get_mot_histories_bulk(['ab12 cde'])['AB12CDE']['make'] == 'HONDA'
+    assert dvsa.mot_requests == 1
+
+    fetched_hours_ago(25)
+    mot_history.get_mot_histories_bulk(['AB12CDE'])
+    assert dvsa.mot_requests == 2
+
+def test_not_found_is_reused_for_an_hour(dvsa):
+    result = mot_history.get_mot_histories_bulk(['ZZ01ABC'])['ZZ01ABC']
+    assert result['error'] == 'API error 404'
+    assert get_mot_cache(['ZZ01ABC'], HOUR)['ZZ01ABC'][0] == 404
+
+    fetched_hours_ago(0.5)
+    mot_history.get_mot_histories_bulk(['ZZ01ABC'])
+    assert dvsa.mot_requests == 1
+
+    fetched_hours_ago(2)
+    mot_history.get_mot_histories_bulk(['ZZ01ABC'])
+    assert dvsa.mot_requests == 2
+
+def test_auth_failures_are_not_cached(dvsa, monkeypatch):
+    token_url = mot_history.TOKEN_URL
+    monkeypatch.setattr(mot_history, 'TOKEN_URL', token_url.replace('/token', '/no-token'))
+    assert mot_history.get_mot_histories_bulk(['AB12CDE']) == {'AB12CDE': {'error': 'Unable to authenticate'}}
+    assert get_mot_cache(['AB12CDE'], HOUR) == {}
+
+    monkeypatch.setattr(mot_history, 'TOKEN_URL', token_url)
+    assert mot_history.get_mot_histories_bulk(['AB12CDE'])['AB12CDE']['registration'] == 'AB12CDE'
+
+def test_quota_errors_are_not_cached(dvsa, monkeypatch):
+    # Quota used up: every request gets a 429, and the client's retries give up straight away
+    dvsa.burst = dvsa._bucket = 0
+    monkeypatch.setattr(mot_history._adapter, 'max_retries', Retry(total = 0, raise_on_status = False))
+
+    assert mot_history.get_mot_histories_bulk(['AB12CDE'])['AB12CDE']['error'] == 'API error 429'
+    assert dvsa.throttled == 1
+    assert get_mot_cache(['AB12CDE'], HOUR) == {}
+
+def test_bulk_endpoint(dvsa, client):
+    response = client.post('/api/mot_history/bulk', json = {'registrations': ['ab12 cde', 'ZZ01 ABC', 'AB12CDE']})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert set(results) == {'AB12CDE', 'ZZ01ABC'}
+    assert results['AB12CDE']['registration'] == 'AB12CDE'
+    assert results['AB12CDE']['motTests'][0]['testResult'] == 'PASSED'
+    assert results['ZZ01ABC']['error'] == 'API error 404'
+    assert dvsa.mot_requests == 2
+
+@pytest.mark.parametrize('body', [{}, {'registrations': []}, {'registrations': 'AB12CDE'}, {'registrations': ['AB12CDE'] * 501}])
+def test_bulk_endpoint_rejects_bad_input(dvsa, client, body):
+    response = client.post('/api/mot_history/bulk', json = body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+    assert dvsa.mot_requests == 0
@@ -0,0 +1,92 @@
+'''
+utils.search_api on recorded responses: benchmarks/fixtures/search_api holds pages saved with `record_dir` from the
+stand-in (benchmarks/stub_search_api.py), covering the same 200 adverts as fixtures/search_results.html, so no real
+adverts or sellers are in them. Re-record both from the same live search to check against the site's own payload.
+'''
+import copy, json
+
+import pytest
+
+from benchmarks.stub_search_api import StubSearchAPI
+from benchmarks.suite.databases import BENCH_DIR
+from utils import search_api
+from utils.general_utils import TokenBucket
+from utils.listing_parser import parse_listings, build_ad_record, make_ad_url, make_ad_id
+
+FIXTURES_DIR = BENCH_DIR / 'fixtures'
+RECORDED_DIR = FIXTURES_DIR / 'search_api'
+
+
+def recorded_pages():
+    return [json.loads(path.read_text(encoding = 'utf-8')) for path in sorted(RECORDED_DIR.glob("page_*.json"))]
+
+def records(fields):
+    return [{k: v for k, v in build_ad_record(f).items() if k != 'Scraped at'} for f in fields]
+
+def empty_page(page, page_count = None):
+    results = {'listings': [], 'page': {'number': page, 'count': page_count}}
+    return [{'data': {'searchResults': results}}]
+
+def without_page_count(pages):
+    pages = copy.deepcopy(pages)
+    for page in pages:
+        del page[0]['data']['searchResults']['page']['count']
+    return pages
+
+@pytest.fixture
+def api(monkeypatch):
+    ''' Stand-in serving the recorded pages; tests can edit `api.pages` before fetching. '''
+    stub = StubSearchAPI(latency = 0, pages = recorded_pages())
+    stub.start()
+    monkeypatch.setattr(search_api, '_rate_limiter', TokenBucket(1000, 1000))
+    yield stub
+    stub.stop()
+
+
+def test_recorded_pages_match_the_dom_parser():
+    dom = records(parse_listings((FIXTURES_DIR / 'search_results.html').read_text(encoding = 'utf-8')))
+    api = records(search_api.load_recorded_pages(RECORDED_DIR))
+
+    assert len(api) == len(dom) == 200
+    assert api == dom
+
+def test_all_pages_end(api):
+    fields, outcome = search_api.fetch_search_results(api.template())
+
+    assert outcome == 'end'
+    assert fields == search_api.load_recorded_pages(RECORDED_DIR)
+    assert api.requests == len(api.pages)
+
+def test_max_pages(api):
+    fields, outcome = search_api.fetch_search_results(api.template(), max_pages = 3)
+    assert outcome == 'max_scrolls'
+    assert len(fields) == 75
+
+def test_known_run_stops(api):
+    known = {make_ad_id(make_ad_url(f['href'])) for f in search_api.load_recorded_pages(RECORDED_DIR)[30:]}
+    fields, outcome = search_api.fetch_search_results(api.template(), workers = 2, known_ad_ids = known, known_run = 20)
+    assert outcome == 'stopped'
+    assert len(fields) == 50
+
+def test_error_reply_raises(api):
+    # Throttled or failed queries still come back as HTTP 200
+    api.pages[2] = [{'errors': [{'message': 'Too many requests'}], 'data': None}]
+    with pytest.raises(search_api.SearchAPIError, match = 'errors for page 3'):
+        search_api.fetch_search_results(api.template())
+
+def test_empty_page_before_the_last_raises(api):
+    api.pages[2] = empty_page(3, len(api.pages))
+    with pytest.raises(search_api.SearchAPIError, match = 'page 3 of 8'):
+        search_api.fetch_search_results(api.template())
+
+def test_empty_page_without_a_page_count_and_listings_after_it_raises(api):
+    api.pages = without_page_count(api.pages)
+    api.pages[2] = empty_page(3)
+    with pytest.raises(search_api.SearchAPIError, match = 'later pages'):
+        search_api.fetch_search_results(api.template())
+
+def test_empty_page_after_the_last_without_a_page_count_ends(api):
+    api.pages = without_page_count(api.pages) + [empty_page(9)]
+    fields, outcome = search_api.fetch_search_results(api.template())
+    assert outcome == 'end'
+    assert len(fields) == 200
@@ -1,4 +1,20 @@
-import easyocr, re, os
+import easyocr, re, os, hashlib, time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+from utils.database_utils import get_ocr_cache, save_ocr_cache, get_saved_ad_ids, ensure_tables_exist
+from utils.plate_regions import rank_plate_crops, crop_region
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+OCR_LANGUAGES = ['en']
+OCR_BATCH_SIZE = 16 # Images looked up in / written to the cache per batch
+OCR_INFERENCE_BATCH = 4 # Same-size images per readtext_batched call; the detector stacks them, so memory grows with it
+OCR_CROP_HEIGHT = 64 # Plate crops are scaled to this height (easyocr's recogniser input height) so they batch together
+DEFAULT_OCR_WORKERS = max((os.cpu_count() or 2) // 2, 1) # CPU only; each worker loads its own model
+PLATE_TOP_IMAGES = 4 # Best-scoring images whose plate crops are OCR'd before falling back to full frames
+PLATE_CROPS_PER_IMAGE = 2
 
 # Move to new 'image_ocr.py'?
 def clean_and_match_plates(ocr_texts):
@@ -27,24 +43,246 @@ def clean_and_match_plates(ocr_texts):
 
     return plate_candidates
 
-# Read registration plates from images
-def ocr_reg_plate(ad_id):
-    folder = f'images/{ad_id}'
-    reader = easyocr.Reader(['en'], gpu = True)
-    
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _cache_key(content_hash, box):
+    if box is None:
+        return content_hash
+    return f"{content_hash}:{','.join(str(v) for v in box)}"
+
+def _load_region(path, box):
+    ''' The full image at `path` as an RGB array, or its `box` as a greyscale crop OCR_CROP_HEIGHT high. '''
+    if box is None:
+        with Image.open(path) as img:
+            return np.asarray(img.convert('RGB'))
+    return crop_region(path, box, height = OCR_CROP_HEIGHT)
+
+def _pad_width(image, width):
+    ''' Pads a greyscale crop on the right to `width` with its median (background) level. '''
+    if image.shape[1] >= width:
+        return image
+    return np.pad(image, ((0, 0), (0, width - image.shape[1])), constant_values = int(np.median(image)))
+
+def _inference_batches(images):
+    '''
+    readtext_batched needs every image in a call to have the same shape: crops (all OCR_CROP_HEIGHT high) are padded
+    to the widest in their batch, full frames are grouped by resolution.
+    Returns: list of (indices into `images`, arrays)
+    '''
+    groups = {}
+    for i, image in enumerate(images):
+        key = 'crops' if image.ndim == 2 else image.shape
+        groups.setdefault(key, []).append(i)
+
+    batches = []
+    for key, indices in groups.items():
+        for start in range(0, len(indices), OCR_INFERENCE_BATCH):
+            chunk = indices[start:start + OCR_INFERENCE_BATCH]
+            arrays = [images[i] for i in chunk]
+            if key == 'crops':
+                width = max(array.shape[1] for array in arrays)
+                arrays = [_pad_width(array, width) for array in arrays]
+            batches.append((chunk, arrays))
+    return batches
+
+def _ocr_items(reader, items):
+    '''
+    OCRs (path, box) `items` with `reader`, running same-shape images through the model together.
+    Returns: a list of text lists, None where an image couldn't be read or OCR'd.
+    '''
+    results = [None] * len(items)
+    images, positions = [], []
+    for i, (path, box) in enumerate(items):
+        try:
+            images.append(_load_region(path, box))
+            positions.append(i)
+        except Exception as e:
+            print(f"Failed to process {path}: {e}")
+
+    for indices, arrays in _inference_batches(images):
+        try:
+            if len(arrays) == 1:
+                texts = [reader.readtext(arrays[0], detail = 0, paragraph = False)]
+            else:
+                texts = reader.readtext_batched(arrays, detail = 0, paragraph = False, batch_size = len(arrays))
+        except Exception as e:
+            print(f"Failed to OCR {len(arrays)} images: {e}")
+            continue
+        for i, text in zip(indices, texts):
+            results[positions[i]] = text
+    return results
+
+# ----------------------------
+# Process pool workers: each process loads the model once in its initializer
+# ----------------------------
+_worker_reader = None
+
+def _init_worker(torch_threads):
+    global _worker_reader
+    import torch
+    torch.set_num_threads(torch_threads) # Avoid every worker grabbing every core
+    _worker_reader = easyocr.Reader(OCR_LANGUAGES, gpu = False, verbose = False)
+
+def _ocr_in_worker(items):
+    return _ocr_items(_worker_reader, items)
+
+class OCREngine:
+    '''
+    Long-lived CPU OCR engine.
+
+    - `workers=0` runs in-process with a single reader; `workers>0` fans out over a process pool,
+      with one reader per process loaded once when the process starts.
+    - Images are run through the model in batches (easyocr's readtext_batched): plate crops are scaled to one height
+      and padded to a common width, full frames are batched with others of the same resolution.
+    - Raw text is cached in SQLite by image content hash (plus crop box), so unchanged images are never OCR'd twice.
+      `cache=False` skips the cache, e.g. for benchmarking.
+    '''
+    def __init__(self, workers = 0, cache = True):
+        self.workers = workers
+        self.cache = cache
+        self._reader = None
+        self._pool = None
+        self.images_ocrd = 0
+        self.cache_hits = 0
+
+    def _get_reader(self):
+        if self._reader is None:
+            self._reader = easyocr.Reader(OCR_LANGUAGES, gpu = False, verbose = False)
+        return self._reader
+
+    def _get_pool(self):
+        if self._pool is None:
+            torch_threads = max((os.cpu_count() or 1) // self.workers, 1)
+            self._pool = ProcessPoolExecutor(max_workers = self.workers, initializer = _init_worker, initargs = (torch_threads,))
+        return self._pool
+
+    def _ocr(self, items):
+        ''' Runs OCR on (path, box) `items` (no caching). Returns a list of text lists (None where OCR failed). '''
+        if not items:
+            return []
+        if self.workers:
+            # One contiguous slice per worker, so each can still batch its share
+            size = -(-len(items) // self.workers)
+            slices = [items[i:i + size] for i in range(0, len(items), size)]
+            return [result for results in self._get_pool().map(_ocr_in_worker, slices) for result in results]
+        return _ocr_items(self._get_reader(), items)
+
+    def read_regions(self, items):
+        '''
+        `items`: list of (path, box), where box is (x0, y0, x1, y1) or None for the full image.
+        Returns: {(path, box): [texts]} for every item that could be read.
+        '''
+        items = [(Path(path), tuple(box) if box else None) for path, box in items]
+        hashes = {}
+        for path, _ in items:
+            if path not in hashes:
+                hashes[path] = file_hash(path)
+        keys = {item: _cache_key(hashes[item[0]], item[1]) for item in items}
+        texts = {}
+
+        for i in range(0, len(items), OCR_BATCH_SIZE):
+            batch = items[i:i + OCR_BATCH_SIZE]
+            cached = get_ocr_cache(keys[item] for item in batch) if self.cache else {}
+
+            misses = []
+            for item in batch:
+                if keys[item] in cached:
+                    texts[item] = cached[keys[item]]
+                    self.cache_hits += 1
+                else:
+                    misses.append(item)
+
+            fresh = {}
+            for item, result in zip(misses, self._ocr(misses)):
+                if result is None:
+                    continue
+                texts[item] = result
+                fresh[keys[item]] = result
+            self.images_ocrd += len(fresh)
+            if self.cache:
+                save_ocr_cache(fresh)
+
+        return texts
+
+    def read_images(self, paths):
+        '''
+        Returns: {path: [texts]} for every readable image in `paths` (full frame).
+        '''
+        texts = self.read_regions([(path, None) for path in paths])
+        return {path: result for (path, _), result in texts.items()}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+_engine = None
+
+def get_engine():
+    ''' Shared in-process engine, so the model is loaded once and reused across ads. '''
+    global _engine
+    if _engine is None:
+        _engine = OCREngine()
+    return _engine
+
+def list_ad_images(ad_id):
+    folder = Path('images') / ad_id
+    if not folder.exists():
+        return []
+    return sorted(path for path in folder.iterdir() if path.suffix.lower() in IMAGE_EXTENSIONS)
+
+def _plates_from(texts):
     all_texts = []
-        
-    for filename in os.listdir(folder):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png")):
-            img_path = os.path.join(folder, filename)
-            try:
-                results = reader.readtext(img_path, detail = 0, paragraph = False)
-                all_texts.extend(results)
-
-            except Exception as e:
-                print(f"Failed to process {filename}: {e}")
-                
-    plate_set = clean_and_match_plates(all_texts)
-                    
-    print(f"Possible plates for {ad_id}: {plate_set}")    
-    return plate_set
\ No newline at end of file
+    for region_texts in texts.values():
+        all_texts.extend(region_texts)
+    return clean_and_match_plates(all_texts)
+
+# Read registration plates from images
+def ocr_reg_plate(ad_id, engine = None, precrop = True):
+    '''
+    With `precrop`, only the likeliest plate crops from the best-ranked images are OCR'd first;
+    every image is OCR'd full-frame only if none of those crops reads as a plate.
+    '''
+    engine = engine or get_engine()
+    paths = list_ad_images(ad_id)
+
+    plate_set = set()
+    if precrop:
+        crops = rank_plate_crops(paths, top_images = PLATE_TOP_IMAGES, crops_per_image = PLATE_CROPS_PER_IMAGE)
+        plate_set = _plates_from(engine.read_regions(crops))
+
+    if not plate_set:
+        plate_set = _plates_from(engine.read_images(paths))
+
+    print(f"Possible plates for {ad_id}: {plate_set}")
+    return plate_set
+
+def ocr_all_ads(workers = DEFAULT_OCR_WORKERS, limit = None, precrop = True):
+    '''
+    Batch mode: reads plates for every ad with downloaded images, sharing one engine.
+    Returns: {ad_id: set of plates}
+    '''
+    ensure_tables_exist()
+    ad_ids = [ad_id for ad_id, _ in get_saved_ad_ids() if ad_id and list_ad_images(ad_id)]
+    if limit:
+        ad_ids = ad_ids[:limit]
+
+    engine = OCREngine(workers = workers)
+    plates = {}
+    total_images = 0
+    start = time.perf_counter()
+    try:
+        for ad_id in ad_ids:
+            total_images += len(list_ad_images(ad_id))
+            plates[ad_id] = ocr_reg_plate(ad_id, engine, precrop)
+    finally:
+        engine.close()
+
+    elapsed = time.perf_counter() - start
+    rate = total_images / elapsed if elapsed else 0
+    print(f"🔎 OCR'd {len(ad_ids)} ads / {total_images} images in {elapsed:.1f}s "
+          f"({rate:.1f} images/s; {engine.images_ocrd} read, {engine.cache_hits} from cache)")
+    return plates
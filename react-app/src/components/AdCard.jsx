@@ -106,7 +106,7 @@ export default function AdCard({ ad }) {
 
   // Show thumbnail for each ad
   useEffect(() => {
-    setCurrentThumb(`/api/thumbnail/${ad["Ad ID"]}`);
+    setCurrentThumb(`/api/thumbnail/${ad["Ad ID"]}?w=640`); // Card is at most ~450px wide
     setThumbnailMissing(false); // Reset any missing-state
   }, [ad]);
 
@@ -117,17 +117,7 @@ export default function AdCard({ ad }) {
     setGalleryReady(false); // reset
 
     try {
-      // 🔍 Check if images already exist
-      const res = await fetch(`/api/image-count/${ad["Ad ID"]}`);
-      const { count } = await res.json();
-
-      if (count > 0) {
-        console.log("✅ Images already exist — skipping download");
-        setGalleryReady(true); // ✅ must trigger ready
-        return;
-      }
-
-      console.log("🔄 Downloading images...");
+      // The server skips the download if the images already exist
       const downloadRes = await fetch("/api/download-pictures", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
@@ -140,28 +130,10 @@ export default function AdCard({ ad }) {
       if (!downloadRes.ok) {
         throw new Error("❌ Image download failed.");
       }
+      const { skipped } = await downloadRes.json();
+      console.log(skipped ? "✅ Images already exist — skipping download" : "🔄 Downloading images...");
 
-      // ⏳ Poll until images appear
-      let tries = 0;
-      let finalCount = 0;
-      while (tries < 20) {
-        const pollRes = await fetch(`/api/image-count/${ad["Ad ID"]}`);
-        const { count: currentCount } = await pollRes.json();
-        if (currentCount > 0) {
-          finalCount = currentCount;
-          break;
-        }
-        await new Promise((r) => setTimeout(r, 500));
-        tries++;
-      }
-
-      if (finalCount === 0) {
-        alert("No images found.");
-        setModalVisible(false); // ❌ prevent stuck spinner
-        return;
-      }
-
-      setGalleryReady(true); // ✅ tell GalleryViewer to load now
+      setGalleryReady(true); // ✅ GalleryViewer streams progress and shows images as they arrive
     } catch (err) {
       console.error("❌ Error preparing gallery:", err);
       alert("Something went wrong.");
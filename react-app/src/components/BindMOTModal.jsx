@@ -53,7 +53,7 @@ export default function BindMOTModal({ adId, onClose, onBindSuccess }) {
                     {/* Reg number */}
                     <div className="font-mono">{entry.registration}</div> 
                     {/* Make and model */}
-                    <div className="text-xs text-gray-500">{entry.data?.make} {entry.data?.model}</div>
+                    <div className="text-xs text-gray-500">{entry.make} {entry.model}</div>
                 </div>
                                 
                 {/* Bind button */}
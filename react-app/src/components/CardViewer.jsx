@@ -4,7 +4,7 @@ import { FaHeart, FaTimes, FaCar } from "react-icons/fa";
 import { useDrag } from '@use-gesture/react'; // For mobile swiping
 import MOTHistoryModal from "./MOTHistoryModal";
 
-export default function CardViewer({ ads, updateFavourite, updateExclude }) {
+export default function CardViewer({ ads, updateFavourite, updateExclude, onNearEnd }) {
   const [currentIndex, setCurrentIndex] = useState(0);
   const [showMOTModal, setShowMOTModal] = useState(false);
   const [showFavouritesOnly, setShowFavouritesOnly] = useState(false);
@@ -23,6 +23,11 @@ export default function CardViewer({ ads, updateFavourite, updateExclude }) {
     if (currentIndex > 0) setCurrentIndex((i) => i - 1);
   };
 
+  // Ask the parent for more ads a few cards before the end of the loaded page
+  useEffect(() => {
+    if (onNearEnd && currentIndex >= filteredAds.length - 5) onNearEnd();
+  }, [currentIndex, filteredAds.length]);
+
   useEffect(() => {
     // Reset index if filter changes and currentIndex becomes invalid
     if (currentIndex >= filteredAds.length) {
@@ -2,6 +2,9 @@ import { useEffect, useState, useRef } from "react";
 import { useDrag } from '@use-gesture/react';
 import { useModalHistory } from "../hooks/useModalHistory"
 
+// Request a resized variant that still fills the screen (the server picks the nearest width)
+const GALLERY_WIDTH = window.innerWidth * (window.devicePixelRatio || 1) > 1280 ? 1920 : 1280;
+
 export default function GalleryViewer({ adId, onClose, onImageChange, ready }) {
     useModalHistory(onClose);
 
@@ -12,52 +15,44 @@ export default function GalleryViewer({ adId, onClose, onImageChange, ready }) {
 
     const galleryRef = useRef(null);
 
-    // Fetch gallery image URLs    
+    // Stream download progress; images are added as each one is saved
     useEffect(() => {
         if (!ready) return;
 
-        const loadImages = async () => {
-            try {
-                const res = await fetch(`/api/image-count/${adId}`);
-                const data = await res.json();
-                const count = data.count;
-
-                const urls = Array.from({ length: count }, (_, i) =>
-                    `/api/gallery-image/${adId}/${String(i + 1).padStart(2, "0")}`
-                );
+        const toUrl = (file) =>
+            `/api/gallery-image/${adId}/${file.replace(/\.jpg$/, "")}?w=${GALLERY_WIDTH}`;
+        const files = new Set();
+        const addImages = (names) => {
+            names.forEach((name) => files.add(name));
+            if (files.size === 0) return;
+            setImages([...files].sort().map(toUrl));
+            setLoading(false);
+        };
 
-                setImages(urls);
-                setLoading(false);
-            } catch (err) {
-                console.error("Failed to fetch image count", err);
+        const source = new EventSource(`/api/download-progress/${adId}/stream`);
+        source.addEventListener("snapshot", (e) => {
+            const data = JSON.parse(e.data);
+            if (data.state) setProgressStatus(data.status);
+            addImages(data.images);
+        });
+        source.addEventListener("status", (e) => setProgressStatus(JSON.parse(e.data).status));
+        source.addEventListener("progress", (e) => setProgressStatus(JSON.parse(e.data).status));
+        source.addEventListener("image", (e) => addImages([JSON.parse(e.data).file]));
+        source.addEventListener("end", () => {
+            source.close();
+            setProgressStatus("");
+            setLoading(false);
+        });
+        source.onerror = () => {
+            if (source.readyState === EventSource.CLOSED) {
+                console.error("Download progress stream closed");
                 setLoading(false);
             }
         };
 
-        loadImages();
+        return () => source.close();
     }, [adId, ready]);
 
-    
-    
-    // Poll download progress
-    useEffect(() => {
-        const interval = setInterval(async () => {
-            const res = await fetch(`/api/download-progress/${adId}`);
-            const data = await res.json();
-            setProgressStatus(data.status);
-            if (data.current === data.total && data.total !== 0) {
-                clearInterval(interval);                
-            }
-        }, 500);
-
-        const timeout = setTimeout(() => interval, 1000); // Delays start a bit
-
-        return () => {
-            clearTimeout(timeout);
-            clearInterval(interval)
-        };            
-    }, [adId]);
-
     // Keyboard navigation
     useEffect(() => {
         const handleKeyDown = (e) => {
@@ -177,6 +172,9 @@ export default function GalleryViewer({ adId, onClose, onImageChange, ready }) {
                     ▶
                     </button>
                 </div>
+                {progressStatus && (
+                <div className="text-sm text-gray-300 mt-2">{progressStatus}</div>
+                )}
             </>
         )}
         </div>
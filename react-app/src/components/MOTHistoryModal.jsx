@@ -32,6 +32,8 @@ function parseRegYear(reg) {
     const activeHistory = motHistories.find(
         (h) => h.registration === activeRegistration
     );
+    // Full test list for the selected registration (the list endpoint only returns summaries)
+    const [activeTests, setActiveTests] = useState([]);
 
     const showRegSelector = !initialReg; // Hide reg selector if history loaded from AdCard
 
@@ -66,6 +68,15 @@ function parseRegYear(reg) {
         .catch((err) => console.error("Failed to load MOT histories:", err));
     }, [adId]);
 
+    // Load the full MOT history of the selected registration
+    useEffect(() => {
+        if (!activeRegistration) return;
+        fetch(`/api/mot_history/${encodeURIComponent(activeRegistration)}`)
+        .then((res) => (res.ok ? res.json() : null))
+        .then((history) => setActiveTests(history?.data?.motTests || []))
+        .catch((err) => console.error("Failed to load MOT history:", err));
+    }, [activeRegistration, motHistories]);
+
     const handleSearchMOT = async () => {
         try {
         const res = await fetch(
@@ -344,7 +355,7 @@ function parseRegYear(reg) {
                     className="font-bold text-black"
                     style={{ fontSize: "30px" }}
                 >
-                    {activeHistory.data.make} {activeHistory.data.model}
+                    {activeHistory.make} {activeHistory.model}
                 </span>
                 {!showRegSelector && (
                     <span
@@ -378,7 +389,7 @@ function parseRegYear(reg) {
 
                 {/* All MOT tests */}
                 <div className="space-y-4">
-                {activeHistory.data.motTests?.map((test, i) => (
+                {activeTests.map((test, i) => (
                     <div
                     key={i}
                     className="p-4 border rounded bg-gray-50 space-y-2"
@@ -1,6 +1,6 @@
 import { useState, useEffect } from "react";
 import { useSearchParams } from "react-router-dom";
-import { sortAds } from "../utils/sortUtils";
+import { fetchAds } from "../utils/adsApi";
 import SortControls from "../components/SortControls";
 
 export default function Excluded() {
@@ -13,13 +13,8 @@ export default function Excluded() {
     const [sortDirection, setSortDirection] = useState(defaultDirection);
 
     useEffect(() => {
-        fetch("/api/ads")
-        .then((res) => res.json())
-        .then((data) => {
-            const onlyExcluded = data.filter((ad) => ad.Excluded === 1);
-            const sorted = sortAds(onlyExcluded, sortBy, sortDirection);
-            setAds(sorted);
-        })
+        fetchAds({ sortBy, direction: sortDirection, excluded: 1 })
+        .then(({ data }) => setAds(data))
         .catch((err) => console.error("Failed to load excluded ads:", err));
     }, [sortBy, sortDirection]);
 
@@ -1,6 +1,6 @@
 import { useState, useEffect } from "react";
 import { useSearchParams } from "react-router-dom";
-import { sortAds } from "../utils/sortUtils";
+import { fetchAds } from "../utils/adsApi";
 import SortControls from "../components/SortControls";
 
 export default function Favourites() {
@@ -13,13 +13,8 @@ export default function Favourites() {
     const [sortDirection, setSortDirection] = useState(defaultDirection);
 
     useEffect(() => {
-        fetch("/api/ads")
-        .then((res) => res.json())
-        .then((data) => {
-            const onlyFaves = data.filter((ad) => ad.Favourited === 1 && ad.Excluded !== 1);
-            const sorted = sortAds(onlyFaves, sortBy, sortDirection);
-            setAds(sorted);
-        })
+        fetchAds({ sortBy, direction: sortDirection, favourited: 1, excluded: 0 })
+        .then(({ data }) => setAds(data))
         .catch((err) => console.error("Failed to load favourites:", err));
     }, [sortBy, sortDirection]);
 
@@ -1,9 +1,11 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useRef } from "react";
 import { useSearchParams } from "react-router-dom";
 import CardViewer from "../components/CardViewer";
-import { sortAds } from "../utils/sortUtils";
+import { fetchAds } from "../utils/adsApi";
 import SortControls from "../components/SortControls";
 
+const PAGE_SIZE = 50;
+
 export default function Home() {  
 
     const [ads, setAds] = useState([]);
@@ -15,18 +17,35 @@ export default function Home() {
     const [sortBy, setSortBy] = useState(defaultSortBy);
     const [sortDirection, setSortDirection] = useState(defaultDirection);
 
+    const [total, setTotal] = useState(0);
+    const loadingMore = useRef(false);
+
+    // First page; sorting and the excluded filter are done by the server
     useEffect(() => {
-        fetch("/api/ads")
-        .then((res) => res.json())
-        .then((data) => {
-            const adsArray = Array.isArray(data) ? data : data.data;
-            console.log("Fetched ads array:", adsArray);
-            const sorted = sortAds(adsArray, sortBy, sortDirection);
-            setAds(sorted);
+        fetchAds({ sortBy, direction: sortDirection, excluded: 0, limit: PAGE_SIZE, offset: 0 })
+        .then(({ data, total }) => {
+            setAds(data);
+            setTotal(total);
         })
         .catch((err) => console.error("Failed to load ads:", err));
     }, [sortBy, sortDirection]);
 
+    // Fetch the next page when the viewer gets close to the end of what's loaded
+    const loadMore = () => {
+        if (loadingMore.current || ads.length >= total) return;
+        loadingMore.current = true;
+        fetchAds({ sortBy, direction: sortDirection, excluded: 0, limit: PAGE_SIZE, offset: ads.length })
+        .then(({ data, total }) => {
+            setAds((prevAds) => {
+                const seen = new Set(prevAds.map((ad) => ad["Ad ID"]));
+                return [...prevAds, ...data.filter((ad) => !seen.has(ad["Ad ID"]))];
+            });
+            setTotal(total);
+        })
+        .catch((err) => console.error("Failed to load more ads:", err))
+        .finally(() => { loadingMore.current = false; });
+    };
+
     // Prevent scrolling
     useEffect(() => {
         document.body.style.overflow = "hidden";
@@ -59,6 +78,7 @@ export default function Home() {
             // Immediately remove excluded ad from state
             setTimeout(() => {
                 setAds((prevAds) => prevAds.filter((ad) => ad["Ad ID"] !== adId));
+                setTotal((t) => Math.max(t - 1, 0));
             }, 200); // 200ms delay before removing the ad
             
         });
@@ -81,6 +101,7 @@ export default function Home() {
             ads={filteredAds}
             updateFavourite={updateFavourite}
             updateExclude={updateExclude}
+            onNearEnd={loadMore}
             />
         ) : (
             <p>Loading ads...</p>
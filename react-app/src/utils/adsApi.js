@@ -0,0 +1,23 @@
+// Builds an /api/ads URL. Sorting, filtering and paging all happen server-side.
+export function adsUrl({ sortBy, direction, favourited, excluded, limit, offset, page } = {}) {
+    const params = new URLSearchParams();
+    if (sortBy) params.set("sortBy", sortBy);
+    if (direction) params.set("direction", direction);
+    if (favourited !== undefined) params.set("favourited", favourited);
+    if (excluded !== undefined) params.set("excluded", excluded);
+    if (limit !== undefined) params.set("limit", limit);
+    if (offset !== undefined) params.set("offset", offset);
+    if (page !== undefined) params.set("page", page);
+    const query = params.toString();
+    return query ? `/api/ads?${query}` : "/api/ads";
+}
+
+// Returns { data: [...ads], total }
+export async function fetchAds(query) {
+    const res = await fetch(adsUrl(query));
+    const body = await res.json();
+    return {
+        data: Array.isArray(body) ? body : body.data || [],
+        total: body.total ?? 0,
+    };
+}
@@ -1,29 +1,75 @@
 
 from pathlib import Path
-from utils.scrape_utils import scrape_autotrader, download_missing_images
-from utils.database_utils import create_ads_table, save_to_sql
+from datetime import timedelta
+from utils.scrape_utils import scrape_autotrader, choose_scrape_mode, download_missing_images, with_sort, DEFAULT_PARSER, DEFAULT_SOURCE, KNOWN_RUN_TO_STOP, FULL_SWEEP_INTERVAL, MAX_API_PAGES, AUTOTRADER_URL, NEWEST_FIRST_SORT
+from utils.database_utils import create_ads_table
 
 DATA_DIR = Path('data')
-DEFAULT_MAX_SCROLLS = 1 # Maybe default should be all ads possible?
+UNLIMITED_SCROLLS = 999999
 TABLE_NAME = 'ads'
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
-    parser.add_argument("--scrape", action="store_true", help="Scrape new ads from AutoTrader")
+    parser.add_argument("--scrape", action="store_true", help="Scrape new ads from AutoTrader (incremental, with a full sweep when one is due)")
+    parser.add_argument("--full-sweep", action="store_true", help="Scroll every result and remove saved ads that are no longer listed")
+    parser.add_argument("--full-sweep-every", type=float, default = FULL_SWEEP_INTERVAL.total_seconds() / 3600, help="Hours between automatic full sweeps during `--scrape`")
+    parser.add_argument("--searches", default = None, metavar = "FILE", help="Scrape every search defined in this JSON file instead of the built-in one (see searches.example.json)")
+    parser.add_argument("--workers", type=int, default = None, help="Processes (each with its own browser) for `--searches`")
+    parser.add_argument("--known-run", type=int, default = KNOWN_RUN_TO_STOP, help="Incremental scrapes stop after this many consecutive already-saved ads")
     parser.add_argument("--download", action="store_true", help="Download images for saved ads")
+    parser.add_argument("--clean-files", action="store_true", help="Finish deleting images of removed ads (resumes an interrupted cleanup)")
     parser.add_argument("--limit", type=int, default=None, help="Limit number of missing images to download (generally just used for debugging)")
-    parser.add_argument("--max-scrolls", type=int, default = DEFAULT_MAX_SCROLLS, help = "How many times to scroll during scraping. (Alternatively, use `--scroll-until-end`)")
-    parser.add_argument("--scroll-until-end", action="store_true", help="Keep scrolling until all ads are loaded.")
+    parser.add_argument("--max-scrolls", type=int, default = None, help = "Cap on scrolls during scraping (default: until the end, or until known ads in incremental mode)")
+    parser.add_argument("--scroll-until-end", action="store_true", help="Ignore `--max-scrolls` and keep scrolling until all ads are loaded.")
+    parser.add_argument("--source", choices=["browser", "api"], default = DEFAULT_SOURCE, help = "Where listings come from: 'browser' scrolls the results page, 'api' replays the site's search API (much faster).")
+    parser.add_argument("--max-pages", type=int, default = MAX_API_PAGES, help = "Cap on search API pages with `--source api`")
+    parser.add_argument("--capture-search-api", action="store_true", help="Record a fresh search API request from the results page (done automatically on first use)")
+    parser.add_argument("--record-search-api", default = None, metavar = "DIR", help="Save the raw search API pages to DIR as offline fixtures")
+    parser.add_argument("--parser", choices=["html", "dom"], default = DEFAULT_PARSER, help = "How to read listings: 'html' parses one page snapshot, 'dom' queries each card through WebDriver.")
+    parser.add_argument("--mot-backfill", action="store_true", help="Re-fetch MOT history for every registration bound to an ad")
+    parser.add_argument("--ocr", action="store_true", help="Read registration plates from the downloaded images of every ad (use `--limit` to cap the number of ads)")
+    parser.add_argument("--ocr-full-frame", action="store_true", help="OCR every image whole instead of plate crops first")
+    parser.add_argument("--ocr-workers", type=int, default=None, help="OCR worker processes (0 runs OCR in this process)")
     
     args = parser.parse_args()
 
-    if args.scrape:
+    if args.capture_search_api or args.record_search_api:
+        from utils.search_api import capture_search_template, fetch_search_results, load_template
+        if args.capture_search_api:
+            capture_search_template(with_sort(AUTOTRADER_URL, NEWEST_FIRST_SORT))
+        if args.record_search_api:
+            fetch_search_results(load_template(url = with_sort(AUTOTRADER_URL, NEWEST_FIRST_SORT)), max_pages = args.max_pages, record_dir = args.record_search_api)
+    if args.searches:
+        from utils.multi_search import load_searches, scrape_searches, MULTI_SEARCH_WORKERS
         create_ads_table()
-        max_scrolls = 999999 if args.scroll_until_end else args.max_scrolls 
-        df = scrape_autotrader(max_scrolls = max_scrolls)
-        save_to_sql(df, TABLE_NAME)
+        max_scrolls = UNLIMITED_SCROLLS if args.scroll_until_end or args.max_scrolls is None else args.max_scrolls
+        scrape_searches(
+            load_searches(args.searches), workers = args.workers or MULTI_SEARCH_WORKERS, full_sweep = args.full_sweep,
+            full_sweep_every = timedelta(hours = args.full_sweep_every), known_run = args.known_run, source = args.source,
+            parser = args.parser, max_scrolls = max_scrolls, max_pages = args.max_pages,
+        )
+    elif args.scrape or args.full_sweep:
+        create_ads_table()
+        max_scrolls = UNLIMITED_SCROLLS if args.scroll_until_end or args.max_scrolls is None else args.max_scrolls
+        mode = 'full' if args.full_sweep else choose_scrape_mode(timedelta(hours = args.full_sweep_every))
+        # New ads are written to the database in batches while scraping
+        scrape_autotrader(max_scrolls = max_scrolls, parser = args.parser, save_to_db = True, mode = mode,
+                          known_run = args.known_run, source = args.source, max_pages = args.max_pages)
     if args.download:
         download_missing_images(limit=args.limit)    
+    if args.clean_files:
+        from utils.file_cleaner import clean_tombstoned_files
+        clean_tombstoned_files()
+    if args.mot_backfill:
+        from utils.database_utils import ensure_tables_exist
+        from utils.mot_history import refresh_bound_mot_histories
+        ensure_tables_exist()
+        refresh_bound_mot_histories()
+    if args.ocr:
+        # Imported here so scraping doesn't pay for loading easyocr/torch
+        from image_ocr import ocr_all_ads, DEFAULT_OCR_WORKERS
+        workers = DEFAULT_OCR_WORKERS if args.ocr_workers is None else args.ocr_workers
+        ocr_all_ads(workers = workers, limit = args.limit, precrop = not args.ocr_full_frame)
             
     
@@ -1,17 +1,44 @@
-from flask import Flask, request, jsonify, send_from_directory
-from utils.database_utils import create_ads_table, update_flag, load_ads, save_mot_history, get_mot_histories, delete_mot_history, bind_mot_to_ad, ensure_tables_exist, save_caz_data, get_caz_data
-from utils.mot_history import get_mot_history
-from utils.scrape_utils import download_pictures, check_caz
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.security import safe_join
+from utils.database_utils import create_ads_table, update_flag, query_ads, AD_RANGE_FILTERS, get_ads_version, get_ad_changes, get_ads_by_ids, get_ad_history, get_price_drops, PRICE_DROPS_LIMIT, search_ads, SEARCH_LIMIT, SearchUnavailable, save_mot_history, get_mot_histories, get_saved_mot_history, get_ads_with_advisories, get_mileage_clocking_suspects, delete_mot_history, bind_mot_to_ad, ensure_tables_exist, get_caz_data
+from utils.mot_history import get_mot_history_cached, get_mot_histories_bulk, MOT_CACHE_TTL
+from utils.scrape_utils import download_pictures, find_ads_missing_images
+from utils.caz_client import check_caz_bulk, CAZ_CACHE_TTL
+from utils.image_variants import pick_width, get_variant, negotiate_format, mimetype_for, source_digest
+from utils.job_queue import JobQueue, JobQueueFull, PRIORITY_INTERACTIVE, PRIORITY_BACKFILL, QUEUED, RUNNING
+from utils.db_connection import DB_WRITER
+from utils import metrics
 from pathlib import Path
-import threading
+import json, os, time
 
 app = Flask(__name__)
+metrics.instrument_app(app)
 TABLE_NAME = 'ads'
 THUMBNAIL_DIR = Path('thumbnails')
 ensure_tables_exist()
 
-# In-memory progress tracker for downloading images
-download_status = {} 
+MAX_PAGE_SIZE = 500
+IMAGE_MAX_AGE = 0 # Image URLs name an ad's picture, not its content (a re-download replaces it): always revalidate
+MAX_MOT_BULK = 500 # Registrations per /api/mot_history/bulk request
+MAX_CAZ_BULK = 100 # Registrations per /api/check-caz/bulk request
+CAZ_ERROR_STATUS = {'invalid': 400, 'rejected': 422, 'upstream': 502} # check_caz_bulk error reason -> HTTP status
+MAX_BACKFILL_JOBS = 200 # Downloads queued per /api/download-missing request
+STREAM_HEARTBEAT = 15 # Seconds between keep-alive comments on event streams
+STREAM_MAX_AGE = 600 # Event streams close after this; EventSource reconnects by itself
+
+def run_download_job(job):
+    download_pictures(job.key, job.payload['ad_url'], progress_callback = job.update)
+
+# Picture downloads run on a fixed pool of workers instead of a thread per request
+JOB_QUEUE = JobQueue()
+JOB_QUEUE.register('download_pictures', run_download_job)
+
+# Scraped at /api/metrics
+metrics.gauge('autotrader_download_jobs', "Picture download jobs by state (finished: remembered for progress lookups)", ('state',),
+              callback = lambda: {(state,): count for state, count in JOB_QUEUE.stats().items() if state != 'workers'})
+metrics.gauge('autotrader_download_workers', "Picture download worker threads", callback = lambda: JOB_QUEUE.workers)
+metrics.gauge('autotrader_db_writes_pending', "Writes waiting for the SQLite writer thread", callback = DB_WRITER.pending)
+OPEN_STREAMS = metrics.gauge('autotrader_event_streams_open', "Download progress event streams being served")
 
 @app.route('/api/fav_exc', methods = ['POST'])
 def favourite_or_exclude_ad():
@@ -41,30 +68,154 @@ def favourite_or_exclude_ad():
     update_flag(ad_id, column, value, TABLE_NAME)
     return jsonify({"status": "ok", "ad_id": ad_id, column: value})
 
+def parse_ads_query(args):
+    '''
+    Reads /api/ads query parameters.
+    Returns: dict of keyword arguments for query_ads. Raises ValueError on bad input.
+    '''
+    filters = {}
+    for column, param in (("Favourited", "favourited"), ("Excluded", "excluded")):
+        if args.get(param) not in (None, ""):
+            filters[column] = int(args.get(param))
+    for name in AD_RANGE_FILTERS:
+        if args.get(name) not in (None, ""):
+            filters[name] = int(args.get(name))
+
+    limit = args.get('limit')
+    if limit not in (None, ""):
+        limit = min(max(int(limit), 1), MAX_PAGE_SIZE)
+    else:
+        limit = None
+
+    return {
+        'filters': filters,
+        'sort_by': args.get('sortBy') or None,
+        'direction': args.get('direction') or 'asc',
+        'page': int(args.get('page') or 1),
+        'offset': int(args.get('offset')) if args.get('offset') not in (None, "") else None,
+        'limit': limit,
+    }
+
 @app.route('/api/ads', methods = ['GET'])
 def get_ads():
-    ads = load_ads('ads')
-    
-    if not ads:
-        return jsonify({"message": "No ads found", "data": []}), 200
-    return jsonify({ "data": ads or [], "message": "ok"})
+    '''
+    Optional query parameters:
+    - sortBy (Title, Price, Mileage, Registered Year, Distance, Ad post date, Scraped at) and direction (asc/desc)
+    - favourited, excluded (0 or 1)
+    - min_/max_ price, mileage, year, distance
+    - page (1-based) or offset, and limit (page size). Without limit, every matching ad is returned.
+    - since (table version): return only the ads inserted, updated or deleted after that version.
+
+    Responses carry an ETag of the table version, so unchanged reloads with If-None-Match get a 304.
+    '''
+    # Read the version before the data so a concurrent write can only make the ETag stale, never ahead
+    version = get_ads_version(TABLE_NAME)
+    etag = f"ads-v{version}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status = 304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    if request.args.get('since') not in (None, ""):
+        try:
+            since = int(request.args.get('since'))
+        except ValueError:
+            return jsonify({'error': 'since must be an integer version'}), 400
+        changes = get_ad_changes(since, TABLE_NAME)
+        if changes is None:
+            # Too old (or from the future): the client has to reload everything
+            response = jsonify({"reset": True, "version": version, "message": "Version not available; reload all ads"})
+        else:
+            changed_ids = changes['inserted'] + changes['updated']
+            response = jsonify({**changes, "data": get_ads_by_ids(changed_ids, TABLE_NAME), "message": "ok"})
+    else:
+        try:
+            query = parse_ads_query(request.args)
+            ads, total = query_ads(table_name = TABLE_NAME, **query)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        body = {"data": ads, "total": total, "page": query['page'], "limit": query['limit'], "version": version}
+        response = jsonify({**body, "message": "ok" if ads else "No ads found"})
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache' # Always revalidate; the ETag makes that cheap
+    return response
+
+@app.route('/api/search', methods = ['GET'])
+def search():
+    '''
+    Full-text search: q (words, each matched as a prefix), limit, include_excluded (0 or 1).
+    Results are ranked best first and carry a `snippet` with the matched words in <mark> tags.
+    '''
+    q = request.args.get('q', '')
+    limit = min(max(request.args.get('limit', default = SEARCH_LIMIT, type = int), 1), MAX_PAGE_SIZE)
+    include_excluded = request.args.get('include_excluded', default = 0, type = int) == 1
+    try:
+        results = search_ads(q, limit, include_excluded, TABLE_NAME)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except SearchUnavailable as e:
+        return jsonify({'error': str(e)}), 501
+    return jsonify({"data": results, "query": q, "message": "ok" if results else "No ads found"})
+
+# Price and attribute snapshots of one ad, oldest first
+@app.route('/api/ads/<ad_id>/history', methods = ['GET'])
+def get_ad_history_entries(ad_id):
+    history = get_ad_history(ad_id)
+    if not history:
+        return jsonify({'error': 'No history for this ad'}), 404
+    return jsonify({'ad_id': ad_id, 'history': history})
+
+# Saved ads whose price went down, newest first. Optional: since (ISO timestamp), min_drop (pounds), limit
+@app.route('/api/price-drops', methods = ['GET'])
+def price_drops():
+    min_drop = request.args.get('min_drop', default = 0, type = int)
+    limit = min(max(request.args.get('limit', default = PRICE_DROPS_LIMIT, type = int), 1), MAX_PAGE_SIZE)
+    return jsonify(get_price_drops(request.args.get('since'), min_drop, limit))
 
 @app.route('/api/thumbnail/<ad_id>', methods = ['GET'])
 def serve_thumbnail(ad_id):
     filename = f'{ad_id}.jpg'
-    thumb_path = THUMBNAIL_DIR / filename
-    
-    if thumb_path.exists():
-        return send_from_directory(THUMBNAIL_DIR, filename)
-    else:
-        print(f'❌ Thumbnail not found: {thumb_path}')
+    response = send_image(THUMBNAIL_DIR, filename)
+    if response is None:
+        print(f'❌ Thumbnail not found: {THUMBNAIL_DIR / filename}')
         return 'Thumbnail not found', 404
+    return response
 
 @app.route('/api/gallery-image/<ad_id>/<image_index>', methods=['GET', 'HEAD'])
 def serve_gallery_image(ad_id, image_index):
     filename = f"{str(image_index).zfill(2)}.jpg"
-    folder = Path("images") / ad_id
-    return send_from_directory(folder, filename)
+    response = send_image(Path("images") / ad_id, filename)
+    if response is None:
+        return 'Image not found', 404
+    return response
+
+def send_image(folder, filename):
+    '''
+    Sends an image, or a resized variant of it when the request has `w=<width>`.
+    Variants are WebP for browsers that accept it, JPEG otherwise.
+    Responses carry a strong ETag from the image's content, so revalidation gets a 304 until the image changes.
+    Returns: None if the image doesn't exist
+    '''
+    src_path = safe_join(str(folder), filename)
+    if src_path is None or not Path(src_path).is_file():
+        return None
+    src_path = Path(src_path)
+
+    width = pick_width(request.args.get('w', type = int))
+    path = src_path
+    if width:
+        path = get_variant(src_path, width, negotiate_format(request.headers.get('Accept')))
+    etag = path.name if path != src_path else source_digest(src_path)
+
+    response = send_file(path, mimetype = mimetype_for(path), etag = etag, max_age = IMAGE_MAX_AGE, conditional = True)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    if width:
+        response.vary.add('Accept')
+    return response
 
 # Get new MOT History through API
 @app.route('/api/mot_history/query', methods = ['GET'])
@@ -74,7 +225,9 @@ def query_mot_history():
         if not reg:
             return jsonify({'error': 'Missing registration number'}), 400
         
-        result = get_mot_history(reg.upper())
+        # `refresh=1` skips the cached response and asks the API again
+        max_age = 0 if request.args.get('refresh') == '1' else MOT_CACHE_TTL
+        result = get_mot_history_cached(reg.upper(), max_age)
         
         if 'error' in result:
             return jsonify(result), 403 if 'Forbidden' in result.get('details', '') else 500
@@ -84,6 +237,23 @@ def query_mot_history():
         print('❌ Internal server error in /api/mot_history:', str(e))
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
     
+# Look up many registrations at once (cached responses are reused; misses are fetched concurrently)
+@app.route('/api/mot_history/bulk', methods = ['POST'])
+def query_mot_history_bulk():
+    data = request.get_json(silent = True) or {}
+    regs = data.get('registrations')
+    if not isinstance(regs, list) or not regs:
+        return jsonify({'error': 'Missing registrations'}), 400
+    if len(regs) > MAX_MOT_BULK:
+        return jsonify({'error': f'At most {MAX_MOT_BULK} registrations per request'}), 400
+
+    max_age = 0 if data.get('refresh') else MOT_CACHE_TTL
+    try:
+        return jsonify({'results': get_mot_histories_bulk(regs, max_age)})
+    except Exception as e:
+        print('❌ Internal server error in /api/mot_history/bulk:', str(e))
+        return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
+
 @app.route('/api/mot_history', methods = ['POST'])
 def save_mot_entry():
     data = request.get_json()
@@ -113,6 +283,26 @@ def get_all_mot():
         print(f'❌ Error fetching MOT history: {e}')
         return jsonify({'error': 'Internal server error', 'details': str(e)}), 500
 
+# Full saved payload for one registration (the list endpoint only returns summaries)
+@app.route('/api/mot_history/<reg>', methods = ['GET'])
+def get_mot_entry(reg):
+    history = get_saved_mot_history(reg)
+    if history is None:
+        return jsonify({'error': 'MOT history not found'}), 404
+    return jsonify(history)
+
+# Bound ads whose latest MOT had more than `min` advisories
+@app.route('/api/mot_history/advisories', methods = ['GET'])
+def mot_advisories():
+    min_advisories = request.args.get('min', default = 3, type = int)
+    return jsonify(get_ads_with_advisories(min_advisories))
+
+# Registrations whose mileage went down between MOTs
+@app.route('/api/mot_history/clocking-suspects', methods = ['GET'])
+def mot_clocking_suspects():
+    min_drop = request.args.get('min_drop', default = 0, type = int)
+    return jsonify(get_mileage_clocking_suspects(min_drop))
+
 @app.route('/api/mot_history/bind', methods = ['POST'])
 def bind_mot_entry():
     data = request.get_json()
@@ -137,52 +327,119 @@ def delete_mot_entry(reg):
 
 @app.route('/api/download-progress/<ad_id>')
 def get_download_progress(ad_id):
-    return jsonify(download_status.get(ad_id, {'status': 'Idle', 'current': 0, 'total': 0}))
+    job = JOB_QUEUE.find('download_pictures', ad_id)
+    if job is None:
+        return jsonify({'status': 'Idle', 'current': 0, 'total': 0})
+    if job.state in (QUEUED, RUNNING):
+        return jsonify(job.to_dict())
+    # Finished: report idle as before, with how the last download ended
+    return jsonify({'status': 'Idle', 'current': 0, 'total': 0, 'job_id': job.id, 'state': job.state, 'error': job.error})
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def counted_stream(chunks):
+    ''' Keeps OPEN_STREAMS up to date while `chunks` is being streamed (until it ends or the client goes away). '''
+    OPEN_STREAMS.inc()
+    try:
+        yield from chunks
+    finally:
+        OPEN_STREAMS.dec()
+
+@app.route('/api/download-progress/<ad_id>/stream')
+def stream_download_progress(ad_id):
+    '''
+    Server-Sent Events for an ad's picture download, replacing the progress/image-count polling:
+    `snapshot` (job status plus images already on disk), then `state`, `status`, `progress` and
+    `image` (one per finished file) as they happen, and finally `end` once no download is running.
+    A stream that falls behind the job's (bounded) event log gets another `snapshot` in place of what it missed.
+    '''
+    job = JOB_QUEUE.find('download_pictures', ad_id)
+    cursor = job.event_cursor() if job else 0 # Taken before the directory listing, so no image is missed
+    image_dir = Path('images') / ad_id
+    list_images = lambda: sorted(p.name for p in image_dir.glob('*.jpg')) if image_dir.exists() else []
+    images = list_images()
+
+    def events():
+        nonlocal cursor
+        yield 'retry: 2000\n\n'
+        snapshot = job.to_dict() if job else {'status': 'Idle', 'current': 0, 'total': 0, 'state': None}
+        yield sse('snapshot', {**snapshot, 'images': images})
+        if job is None:
+            yield sse('end', {'state': None, 'count': len(images)})
+            return
+
+        started = time.monotonic()
+        while time.monotonic() - started < STREAM_MAX_AGE:
+            finished = job.finished # Read before waiting, so the last events are flushed before `end`
+            new_events, cursor = job.wait_events(cursor, 0 if finished else STREAM_HEARTBEAT)
+            for event, data in new_events:
+                if event == 'snapshot':
+                    # Fell behind the job's event log: resync like a fresh connection
+                    data = {**data, 'images': list_images()}
+                yield sse(event, data)
+            if finished:
+                yield sse('end', {'state': job.state, 'error': job.error, 'count': job.progress['current']})
+                return
+            if not new_events:
+                yield ': keep-alive\n\n'
+
+    return Response(counted_stream(events()), mimetype = 'text/event-stream', headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/download-pictures', methods = ['POST'])
 def api_download_pictures():
     data = request.get_json()
     ad_id = data.get('ad_id')
     ad_url = data.get('ad_url')
+    if not ad_id or not ad_url:
+        return jsonify({'error': 'Missing ad_id or ad_url'}), 400
     
     image_dir = Path('images') / ad_id
-    if image_dir.exists() and any(image_dir.glob('.jpg')):
+    if image_dir.exists() and any(image_dir.glob('*.jpg')):
         print (f'Skipping download. Images already exist for {ad_id}')
         return jsonify({'success': True, 'skipped': True})
     
-    download_status[ad_id] = {'status': 'Starting...', 'current': 0, 'total': 0}
-    
-    def progress_callback(current = None, total = None):
-        if not isinstance(download_status.get(ad_id), dict):
-            print(f"❌ WARNING: download_status[{ad_id}] corrupted. Resetting.")
-        
-        # Ensure structure is always a dict
-        if not isinstance(download_status.get(ad_id), dict):
-            download_status[ad_id] = {'status': 'Starting...', 'current': 0, 'total': 0}
-        
-        # Status string updates
-        if isinstance(current, str):
-            download_status[ad_id]['status'] = current
-        
-        # Numeric progress for images (e.g. `1/10``)
-        elif current is not None and total is not None:
-            download_status[ad_id]['current'] = current
-            download_status[ad_id]['total'] = total
-            
-            # Only update status if not already a string status
-            if 'Downloading' in download_status[ad_id].get('status', ''):
-                download_status[ad_id]['status'] = f'Downloading {current}/{total}...'
+    try:
+        job, created = JOB_QUEUE.submit('download_pictures', ad_id, {'ad_url': ad_url}, priority = PRIORITY_INTERACTIVE)
+    except JobQueueFull as e:
+        return jsonify({'error': f'Download queue is full ({e}), try again shortly'}), 503
     
-    def run_download():
+    return jsonify({'success': True, 'job_id': job.id, 'coalesced': not created})
+
+@app.route('/api/download-missing', methods = ['POST'])
+def api_download_missing():
+    ''' Queues low-priority downloads for saved ads without pictures; interactive requests still go first. '''
+    data = request.get_json(silent = True) or {}
+    limit = data.get('limit', MAX_BACKFILL_JOBS)
+    if isinstance(limit, bool) or not isinstance(limit, (int, str)) or not str(limit).isdigit():
+        return jsonify({'error': 'limit must be a non-negative integer'}), 400
+    limit = min(int(limit), MAX_BACKFILL_JOBS)
+    queued = 0
+    for ad_id, ad_url in find_ads_missing_images(limit):
         try:
-            download_pictures(ad_id, ad_url, progress_callback = progress_callback)
-        finally:
-            download_status.pop(ad_id, None)
-    
-    # Launch in background thread to avoid blocking Flask
-    threading.Thread(target = run_download).start()
-    
-    return jsonify({'success': True})
+            _, created = JOB_QUEUE.submit('download_pictures', ad_id, {'ad_url': ad_url}, priority = PRIORITY_BACKFILL)
+        except JobQueueFull:
+            break
+        queued += created
+    return jsonify({'queued': queued, **JOB_QUEUE.stats()})
+
+@app.route('/api/jobs')
+def list_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in JOB_QUEUE.active_jobs()], **JOB_QUEUE.stats()})
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    job = JOB_QUEUE.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods = ['POST'])
+def cancel_job(job_id):
+    job = JOB_QUEUE.cancel(job_id)
+    if job is None:
+        return jsonify({'error': 'Job is not queued or running'}), 404
+    return jsonify(job.to_dict())
         
     
 @app.route('/api/image-count/<ad_id>')
@@ -199,14 +456,34 @@ def api_check_caz():
     if not reg:
         return jsonify({'error': 'Missing registration'}), 400
     
-    try:
-        result = check_caz(reg)
-        save_caz_data(reg, result)
-        return jsonify({'registration': reg.upper(), 'zone': result})
-    except Exception as e:
-        print(f'❌ CAZ check failed for {reg}: {e}')
-        return jsonify({'error': str(e)}), 500
+    # Results saved within CAZ_CACHE_TTL are reused; `refresh=1` checks again
+    max_age = None if request.args.get('refresh') == '1' else CAZ_CACHE_TTL
+    result = next(iter(check_caz_bulk([reg], max_age).values()), {'error': 'Invalid registration', 'reason': 'invalid'})
+    if 'error' in result:
+        return jsonify(result), CAZ_ERROR_STATUS.get(result.get('reason'), 502)
+    return jsonify({'registration': reg.replace(" ", "").upper(), 'zone': result})
+
+# Check many registrations at once (cached results are reused; the rest run concurrently)
+@app.route('/api/check-caz/bulk', methods=['POST'])
+def api_check_caz_bulk():
+    data = request.get_json(silent = True) or {}
+    regs = data.get('registrations')
+    if not isinstance(regs, list) or not regs:
+        return jsonify({'error': 'Missing registrations'}), 400
+    if len(regs) > MAX_CAZ_BULK:
+        return jsonify({'error': f'At most {MAX_CAZ_BULK} registrations per request'}), 400
+
+    max_age = None if data.get('refresh') else CAZ_CACHE_TTL
+    return jsonify({'results': check_caz_bulk(regs, max_age)})
     
+@app.route('/api/metrics', methods = ['GET'])
+def get_metrics():
+    '''
+    Prometheus text format: request latency per route (and the share spent in SQLite), database_utils call times,
+    upstream MOT/CAZ/AutoTrader request times, download job and writer queue gauges.
+    '''
+    return Response(metrics.render(), mimetype = 'text/plain; version=0.0.4; charset=utf-8')
+
 @app.route("/api/caz", methods=["GET"])
 def get_caz():
     reg = request.args.get("reg")
@@ -221,4 +498,7 @@ def get_caz():
 
 if __name__ == '__main__':
     create_ads_table(TABLE_NAME)
+    # With the reloader, only the serving child should run jobs (submit() also starts the queue on first use)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        JOB_QUEUE.start()
     app.run(debug=True)
\ No newline at end of file
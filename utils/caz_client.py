@@ -0,0 +1,211 @@
+'''
+Browserless client for the gov.uk Clean Air Zone vehicle checker.
+
+Walks the same four pages as the Selenium version (`scrape_utils.check_caz`) with plain HTTP:
+each form is read from the page (including its CSRF token), filled in and posted on a per-check session,
+and the compliance table on the last page is parsed into the same result dicts.
+'''
+import os, re, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urljoin
+
+import requests
+from lxml import html
+from requests.adapters import HTTPAdapter
+
+from utils.general_utils import TokenBucket
+from utils.metrics import instrument_session
+from utils.db_connection import DATA_DIR
+from utils.database_utils import get_caz_data_bulk, save_caz_data
+
+CAZ_START_URL = os.getenv('CAZ_START_URL', 'https://multiple-vehiclecheck-pay.drive-clean-air-zone.service.gov.uk/what_would_you_like_to_do')
+CAZ_TIMEOUT = 20
+CAZ_WORKERS = 4 # Registrations checked at once in bulk mode
+CAZ_RATE_LIMIT = 4 # Page requests per second across all checks (each check is ~4 requests)
+CAZ_BURST = 4
+CAZ_CACHE_TTL = timedelta(days = 30) # Zone rules change rarely; re-check after this
+CAZ_BROWSER_FALLBACK = os.getenv('CAZ_BROWSER_FALLBACK', '1') == '1' # Retry with Chrome if the HTTP flow breaks
+CAZ_DEBUG_PAGES = os.getenv('CAZ_DEBUG_PAGES', '0') == '1' # Save pages that fail to parse to CAZ_DEBUG_DIR
+CAZ_DEBUG_DIR = DATA_DIR / 'caz_debug'
+VALID_REGISTRATION = re.compile(r'^[A-Z0-9]{2,7}$') # UK registrations, spaces removed
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+
+# Connection pool shared by every check's session (cookies stay per session)
+_adapter = HTTPAdapter(pool_connections = 1, pool_maxsize = CAZ_WORKERS)
+_rate_limiter = TokenBucket(CAZ_RATE_LIMIT, CAZ_BURST)
+
+
+class CAZCheckError(Exception):
+    ''' The checker returned a page we didn't expect (e.g. a changed form). '''
+
+class CAZRejected(CAZCheckError):
+    ''' The checker turned the registration down (e.g. an unknown vehicle): a form error, not an outage. '''
+
+
+def _new_session():
+    session = requests.Session()
+    session.mount('https://', _adapter)
+    session.mount('http://', _adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return instrument_session(session, 'caz')
+
+def _request(session, method, url, **kwargs):
+    _rate_limiter.acquire()
+    response = session.request(method, url, timeout = CAZ_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    return response
+
+def _parse(response):
+    return html.fromstring(response.content, base_url = response.url)
+
+def _form_fields(page, input_id):
+    '''
+    Finds the form containing input `input_id`.
+    Returns: (action URL, method, {name: value} of its hidden inputs, including the CSRF token)
+    '''
+    inputs = page.xpath(f"//input[@id='{input_id}']")
+    if not inputs:
+        raise CAZCheckError(f"Expected input '{input_id}' on {page.base_url}")
+    form = inputs[0].xpath("ancestor::form[1]")
+    if not form:
+        raise CAZCheckError(f"Input '{input_id}' on {page.base_url} isn't inside a form")
+    form = form[0]
+    fields = {el.get('name'): el.get('value', '') for el in form.xpath(".//input[@type='hidden'][@name]")}
+    action = urljoin(page.base_url, form.get('action') or page.base_url)
+    return action, (form.get('method') or 'post').lower(), fields
+
+def _choose(page, input_id, fields):
+    ''' Sets the field for radio/text input `input_id` to the input's own value. '''
+    el = page.xpath(f"//input[@id='{input_id}']")[0]
+    fields[el.get('name')] = el.get('value', '')
+
+def _submit(session, page, input_id, values = None):
+    '''
+    Posts the form containing `input_id`, with that input chosen (radios) and `values` ({input id: text}) filled in.
+    Returns: the next page
+    '''
+    action, method, fields = _form_fields(page, input_id)
+    _choose(page, input_id, fields)
+    for value_id, value in (values or {}).items():
+        el = page.xpath(f"//input[@id='{value_id}']")
+        if not el:
+            raise CAZCheckError(f"Expected input '{value_id}' on {page.base_url}")
+        fields[el[0].get('name')] = value
+    if method == 'get':
+        return _parse(_request(session, 'GET', action, params = fields))
+    return _parse(_request(session, 'POST', action, data = fields, headers = {'Referer': page.base_url}))
+
+def _raise_if_rejected(page):
+    ''' The checker turns a registration down with a form error summary, or a "could not be found" page. '''
+    summary = page.xpath("//div[contains(concat(' ', normalize-space(@class), ' '), ' govuk-error-summary ')]")
+    if summary:
+        messages = [item.text_content().strip() for item in summary[0].xpath(".//li")]
+        raise CAZRejected("; ".join(message for message in messages if message) or "Registration rejected by the checker")
+    not_found = page.xpath("//h1[contains(., 'could not be found')]")
+    if not_found:
+        raise CAZRejected(not_found[0].text_content().strip())
+
+def _label_input_id(page, label_text):
+    ids = page.xpath(f"//label[normalize-space(.)='{label_text}' or strong[normalize-space(text())='{label_text}']]/@for")
+    if not ids:
+        raise CAZCheckError(f"Expected option '{label_text}' on {page.base_url}")
+    return ids[0]
+
+def parse_compliance_table(page):
+    ''' Returns: list of {"Zone", "Daily Charge", "Zone Live", "Map URL", "Exemptions URL"} '''
+    rows = page.xpath("//table[@id='compliance-table']/tbody/tr")
+    if not page.xpath("//table[@id='compliance-table']"):
+        raise CAZCheckError(f"No compliance table on {page.base_url}")
+
+    def link(cell):
+        hrefs = cell.xpath(".//a/@href")
+        return urljoin(page.base_url, hrefs[0]) if hrefs else None
+
+    results = []
+    for row in rows:
+        cols = row.xpath("./td")
+        if len(cols) < 5:
+            continue
+        results.append({
+            "Zone": cols[0].text_content().strip(),
+            "Daily Charge": cols[1].text_content().strip(),
+            "Zone Live": cols[2].text_content().strip(),
+            "Map URL": link(cols[3]),
+            "Exemptions URL": link(cols[4]),
+        })
+    return results
+
+def save_debug_page(registration, content):
+    ''' With CAZ_DEBUG_PAGES, saves a page that failed to parse as CAZ_DEBUG_DIR/<registration>.html. '''
+    if not CAZ_DEBUG_PAGES:
+        return
+    CAZ_DEBUG_DIR.mkdir(parents = True, exist_ok = True)
+    path = CAZ_DEBUG_DIR / f"{re.sub(r'[^A-Za-z0-9]', '', registration)}.html"
+    path.write_bytes(content if isinstance(content, bytes) else content.encode('utf-8'))
+    print(f"🐞 Saved CAZ page to {path}")
+
+def check_caz_http(registration):
+    ''' Runs the checker flow for one UK registration over HTTP. Returns: list of zone result dicts '''
+    session = _new_session()
+    page = _parse(_request(session, 'GET', CAZ_START_URL))
+
+    # Page 1: "Check a vehicle"
+    page = _submit(session, page, _label_input_id(page, 'Check a vehicle'))
+    # Page 2: registration, registered in the UK
+    page = _submit(session, page, 'registration-country-1', {'vrn': registration})
+    _raise_if_rejected(page)
+    # Page 3: confirm the vehicle details
+    page = _submit(session, page, 'confirm_details-1')
+    _raise_if_rejected(page)
+    # Page 4: compliance table
+    try:
+        return parse_compliance_table(page)
+    except CAZCheckError:
+        save_debug_page(registration, html.tostring(page))
+        raise
+
+def check_caz(registration):
+    ''' HTTP check, falling back to the browser flow if the pages have changed under us. '''
+    try:
+        return check_caz_http(registration)
+    except CAZRejected:
+        raise # The browser would be turned down too
+    except (CAZCheckError, requests.RequestException) as e:
+        if not CAZ_BROWSER_FALLBACK:
+            raise
+        print(f"⚠️ HTTP CAZ check failed for {registration} ({e}); retrying in the browser")
+        from utils.scrape_utils import check_caz as check_caz_browser
+        return check_caz_browser(registration)
+
+def check_caz_bulk(registrations, max_age = CAZ_CACHE_TTL, workers = CAZ_WORKERS):
+    '''
+    Checks many registrations, reusing results saved within `max_age` (None always re-checks).
+    Fresh results (including "no zones") are saved to the caz table.
+    Returns: {registration: list of zone dicts, or {'error': ..., 'reason': 'invalid' | 'rejected' | 'upstream'}}
+    '''
+    regs = list(dict.fromkeys(reg.replace(" ", "").strip().upper() for reg in registrations if reg and reg.strip()))
+    invalid = {reg: {'error': 'Invalid registration', 'reason': 'invalid'} for reg in regs if not VALID_REGISTRATION.match(reg)}
+    regs = [reg for reg in regs if reg not in invalid]
+    results = get_caz_data_bulk(regs, datetime.now() - max_age) if max_age else {}
+
+    def check(reg):
+        try:
+            zones = check_caz(reg)
+            save_caz_data(reg, zones)
+            return zones
+        except CAZRejected as e:
+            print(f'❌ CAZ checker rejected {reg}: {e}')
+            return {'error': str(e), 'reason': 'rejected'}
+        except Exception as e:
+            print(f'❌ CAZ check failed for {reg}: {e}')
+            return {'error': str(e), 'reason': 'upstream'}
+
+    results.update(invalid)
+    misses = [reg for reg in regs if reg not in results]
+    if misses:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers = min(workers, len(misses))) as executor:
+            results.update(zip(misses, executor.map(check, misses)))
+        print(f"🌍 Checked CAZ for {len(misses)} registrations in {time.perf_counter() - start:.1f}s ({len(regs) - len(misses)} cached)")
+    return results
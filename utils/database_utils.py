@@ -1,21 +1,70 @@
-import os
 import sqlite3
+import hashlib
 import json
+import re
+import time
 from datetime import datetime
 import pandas as pd
-from pathlib import Path
 
+# Connections, pragmas and the single-writer queue live in db_connection
+from utils.db_connection import DATA_DIR, DB_PATH, transaction, run_write
+from utils.metrics import instrument_functions
 
-# SQLite location
-DATA_DIR = Path('data')
-DB_PATH = DATA_DIR / 'autotrader_listings.db'
+# Numeric forms of text columns, e.g. '£4,500' -> 4500 and '1980 (W reg)' -> 1980.
+# Indexed as expressions, so queries must use these exact strings to hit the indexes.
+PRICE_SQL = """CAST(REPLACE(REPLACE("Price", '£', ''), ',', '') AS INTEGER)"""
+YEAR_SQL = 'CAST(SUBSTR("Registered Year", 1, 4) AS INTEGER)'
 
-# Create dir if doesn't exist
-os.makedirs(DATA_DIR, exist_ok = True)
+# How many change log rows to keep for `since=` deltas; older clients get a full reload
+MAX_CHANGE_LOG_ROWS = 50000
+
+# Columns of the ads table returned to callers; "Content hash" is internal to change detection
+AD_PUBLIC_COLUMNS = (
+    "Ad URL", "Ad ID", "Title", "Subtitle", "Price", "Mileage", "Registered Year", "Distance (miles)", "Location",
+    "Ad post date", "Favourited", "Excluded", "Scraped at",
+)
+AD_COLUMNS = AD_PUBLIC_COLUMNS + ("Content hash",)
+
+# Listing fields whose changes are tracked: hashed into "Content hash", rewritten on change and kept in ad_snapshots.
+# Distance isn't tracked because it depends on which search's postcode the ad was listed under.
+TRACKED_AD_FIELDS = ("Ad URL", "Title", "Subtitle", "Price", "Mileage", "Registered Year", "Location")
+PRICE_DROPS_LIMIT = 100
+
+# Full-text search over ads (see create_ads_search_index): column weights for bm25 ranking, in table column order
+# (ad_id, title, subtitle, location, make, model), and the default number of results
+SEARCH_WEIGHTS = (0.0, 10.0, 4.0, 2.0, 6.0, 6.0)
+SEARCH_LIMIT = 50
+
+# MOT defect types that fail a test (the rest are ADVISORY, MINOR, PRS and USER ENTERED)
+MOT_FAILURE_TYPES = ('FAIL', 'MAJOR', 'DANGEROUS')
+KM_TO_MILES = 0.621371
+
+# Sort keys accepted by query_ads (same names as the frontend's sortKeyMap)
+AD_SORT_COLUMNS = {
+    "Title": '"Title"',
+    "Price": PRICE_SQL,
+    "Mileage": '"Mileage"',
+    "Registered Year": YEAR_SQL,
+    "Distance": '"Distance (miles)"',
+    "Ad post date": '"Ad post date"',
+    "Scraped at": '"Scraped at"',
+}
+
+# Range filters accepted by query_ads: filter name -> (SQL expression, comparison)
+AD_RANGE_FILTERS = {
+    "min_price": (PRICE_SQL, ">="),
+    "max_price": (PRICE_SQL, "<="),
+    "min_mileage": ('"Mileage"', ">="),
+    "max_mileage": ('"Mileage"', "<="),
+    "min_year": (YEAR_SQL, ">="),
+    "max_year": (YEAR_SQL, "<="),
+    "min_distance": ('"Distance (miles)"', ">="),
+    "max_distance": ('"Distance (miles)"', "<="),
+}
 
 # Create SQLite table for storing scraped ad info
 def create_ads_table(table_name = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
+    def write(conn):
         cursor = conn.cursor()
         cursor.execute(f'''
                        CREATE TABLE IF NOT EXISTS {table_name} (
@@ -31,13 +80,159 @@ def create_ads_table(table_name = 'ads'):
                            "Ad post date" TEXT,
                            "Favourited" INTEGER DEFAULT 0,
                            "Excluded" INTEGER DEFAULT 0,
-                           "Scraped at" TEXT                           
+                           "Scraped at" TEXT,
+                           "Content hash" TEXT
                        )
                        ''')
-        conn.commit()
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+        if 'Content hash' not in columns:
+            # Existing rows get theirs (and a first snapshot) the next time a scrape sees them
+            cursor.execute(f'ALTER TABLE {table_name} ADD COLUMN "Content hash" TEXT')
+        create_ads_indexes(conn, table_name)
+        create_ads_change_log(conn, table_name)
+        create_ads_search_index(conn, table_name)
+    run_write(write)
+    # save_to_sql snapshots every ad it inserts
+    create_ad_snapshots_table()
+
+def create_ads_indexes(conn, table_name = 'ads'):
+    ''' Indexes backing the filters and sort keys of query_ads. '''
+    cursor = conn.cursor()
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_flags ON {table_name} ("Excluded", "Favourited")')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_price ON {table_name} ({PRICE_SQL})')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_year ON {table_name} ({YEAR_SQL})')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_mileage ON {table_name} ("Mileage")')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_distance ON {table_name} ("Distance (miles)")')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_post_date ON {table_name} ("Ad post date")')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_scraped_at ON {table_name} ("Scraped at")')
         
+def create_ads_change_log(conn, table_name = 'ads'):
+    '''
+    Every insert/update/delete on the ads table appends a row to `<table>_changes` via triggers.
+    The log's version column doubles as the table version used for ETags and `since=` deltas.
+    '''
+    cursor = conn.cursor()
+    cursor.execute(f'''
+                   CREATE TABLE IF NOT EXISTS {table_name}_changes (
+                       "version" INTEGER PRIMARY KEY AUTOINCREMENT,
+                       "ad_id" TEXT,
+                       "operation" TEXT NOT NULL,
+                       "changed_at" TEXT DEFAULT CURRENT_TIMESTAMP
+                   )
+                   ''')
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_log_insert AFTER INSERT ON {table_name}
+                   BEGIN
+                       INSERT INTO {table_name}_changes (ad_id, operation) VALUES (NEW."Ad ID", 'insert');
+                   END
+                   ''')
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_log_update AFTER UPDATE ON {table_name}
+                   BEGIN
+                       INSERT INTO {table_name}_changes (ad_id, operation) VALUES (NEW."Ad ID", 'update');
+                   END
+                   ''')
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_log_delete AFTER DELETE ON {table_name}
+                   BEGIN
+                       INSERT INTO {table_name}_changes (ad_id, operation) VALUES (OLD."Ad ID", 'delete');
+                   END
+                   ''')
+        
+class SearchUnavailable(Exception):
+    ''' Full-text search was asked for but the search index doesn't exist (SQLite built without FTS5). '''
+
+def create_ads_search_index(conn, table_name = 'ads'):
+    '''
+    FTS5 index `<table>_fts` over Title, Subtitle and Location, plus the make and model of a bound MOT history.
+    Index rows are keyed through `<table>_fts_keys`, which gives each Ad ID a stable integer key: the ads table's own
+    rowid isn't an alias of its (TEXT) primary key, so VACUUM may renumber it. Triggers keep the index in step with
+    the ads table and refresh_ads_search_vehicles fills in make/model when MOT histories are saved, bound or deleted.
+    Built from existing rows on first creation (and rebuilt once from an index keyed on the ads rowid).
+    '''
+    cursor = conn.cursor()
+    has_keys = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f'{table_name}_fts_keys',)).fetchone()
+    if not has_keys:
+        for trigger in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {table_name}_fts_{trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {table_name}_fts')
+    try:
+        cursor.execute(f'''
+                       CREATE VIRTUAL TABLE IF NOT EXISTS {table_name}_fts USING fts5(
+                           ad_id UNINDEXED, title, subtitle, location, make, model,
+                           tokenize = 'unicode61 remove_diacritics 2',
+                           prefix = '2 3'
+                       )
+                       ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text search unavailable (SQLite built without FTS5?): {e}")
+        return
+    cursor.execute(f'''
+                   CREATE TABLE IF NOT EXISTS {table_name}_fts_keys (
+                       fts_rowid INTEGER PRIMARY KEY,
+                       ad_id TEXT NOT NULL UNIQUE
+                   )
+                   ''')
+    key = f'(SELECT fts_rowid FROM {table_name}_fts_keys WHERE ad_id = {{}}."Ad ID")'
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_fts_insert AFTER INSERT ON {table_name}
+                   BEGIN
+                       INSERT OR IGNORE INTO {table_name}_fts_keys (ad_id) VALUES (NEW."Ad ID");
+                       INSERT INTO {table_name}_fts (rowid, ad_id, title, subtitle, location)
+                       VALUES ({key.format('NEW')}, NEW."Ad ID", NEW."Title", NEW."Subtitle", NEW."Location");
+                   END
+                   ''')
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_fts_update AFTER UPDATE OF "Title", "Subtitle", "Location" ON {table_name}
+                   BEGIN
+                       UPDATE {table_name}_fts SET title = NEW."Title", subtitle = NEW."Subtitle", location = NEW."Location"
+                       WHERE rowid = {key.format('NEW')};
+                   END
+                   ''')
+    cursor.execute(f'''
+                   CREATE TRIGGER IF NOT EXISTS {table_name}_fts_delete AFTER DELETE ON {table_name}
+                   BEGIN
+                       DELETE FROM {table_name}_fts WHERE rowid = {key.format('OLD')};
+                       DELETE FROM {table_name}_fts_keys WHERE ad_id = OLD."Ad ID";
+                   END
+                   ''')
+    if not has_keys:
+        cursor.execute(f'INSERT OR IGNORE INTO {table_name}_fts_keys (ad_id) SELECT "Ad ID" FROM {table_name} WHERE "Ad ID" IS NOT NULL')
+        cursor.execute(f'''
+                       INSERT INTO {table_name}_fts (rowid, ad_id, title, subtitle, location)
+                       SELECT k.fts_rowid, a."Ad ID", a."Title", a."Subtitle", a."Location"
+                       FROM {table_name} a JOIN {table_name}_fts_keys k ON k.ad_id = a."Ad ID"
+                       ''')
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'mot_vehicles'").fetchone():
+            refresh_ads_search_vehicles(conn, None, table_name)
+
+def refresh_ads_search_vehicles(conn, ad_ids, table_name = 'ads'):
+    ''' Copies the bound MOT vehicle's make and model into the search index for `ad_ids` (None: every ad). '''
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f'{table_name}_fts_keys',)).fetchone():
+        return
+    vehicle = '''
+        SELECT v.{column} FROM mot_history h JOIN mot_vehicles v ON v.registration = h.registration
+        WHERE h.ad_id = {table_name}_fts.ad_id LIMIT 1
+    '''
+    where, params = "", ()
+    if ad_ids is not None:
+        ad_ids = [ad_id for ad_id in ad_ids if ad_id]
+        if not ad_ids:
+            return
+        where = f'WHERE rowid IN (SELECT fts_rowid FROM {table_name}_fts_keys WHERE ad_id IN (SELECT value FROM json_each(?)))'
+        params = (json.dumps(ad_ids),)
+    conn.execute(
+        f'''
+        UPDATE {table_name}_fts
+        SET make = ({vehicle.format(column = 'make', table_name = table_name)}),
+            model = ({vehicle.format(column = 'model', table_name = table_name)})
+        {where}
+        ''',
+        params
+    )
+
 def create_mot_history_table(table_name = 'mot_history'):
-    with sqlite3.connect(DB_PATH) as conn:
+    def write(conn):
         cursor = conn.cursor()
         cursor.execute(f'''
                        CREATE TABLE IF NOT EXISTS {table_name} (
@@ -47,10 +242,141 @@ def create_mot_history_table(table_name = 'mot_history'):
                            "created_at" TEXT NOT NULL                           
                        )
                        ''')
-        conn.commit()
-        
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_ad_id ON {table_name} (ad_id)')
+        create_mot_detail_tables(conn)
+        migrate_mot_history(conn, table_name)
+    run_write(write)
+
+def create_mot_detail_tables(conn):
+    '''
+    Normalised copy of the saved MOT payloads: one row per vehicle, per test (with its mileage reading
+    and defect counts) and per defect/advisory. Rebuilt from the payload whenever a history is saved.
+    '''
+    cursor = conn.cursor()
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS mot_vehicles (
+                       registration TEXT PRIMARY KEY,
+                       make TEXT,
+                       model TEXT,
+                       fuel_type TEXT,
+                       primary_colour TEXT,
+                       engine_size TEXT,
+                       first_used_date TEXT,
+                       registration_date TEXT,
+                       manufacture_date TEXT
+                   )
+                   ''')
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS mot_tests (
+                       test_id INTEGER PRIMARY KEY,
+                       registration TEXT NOT NULL,
+                       test_number TEXT,
+                       completed_date TEXT,
+                       test_result TEXT,
+                       expiry_date TEXT,
+                       odometer_value INTEGER,
+                       odometer_unit TEXT,
+                       odometer_result_type TEXT,
+                       odometer_miles INTEGER,
+                       advisory_count INTEGER NOT NULL DEFAULT 0,
+                       failure_count INTEGER NOT NULL DEFAULT 0,
+                       dangerous_count INTEGER NOT NULL DEFAULT 0
+                   )
+                   ''')
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS mot_defects (
+                       test_id INTEGER NOT NULL,
+                       type TEXT,
+                       text TEXT,
+                       dangerous INTEGER NOT NULL DEFAULT 0
+                   )
+                   ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mot_tests_reg_date ON mot_tests (registration, completed_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mot_tests_result ON mot_tests (test_result, completed_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mot_defects_test ON mot_defects (test_id, type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_mot_vehicles_make_model ON mot_vehicles (make, model)')
+
+def migrate_mot_history(conn, table_name = 'mot_history'):
+    ''' Normalises saved histories that don't have rows in the MOT detail tables yet (no-op once done). '''
+    cursor = conn.cursor()
+    cursor.execute(f'''
+                   SELECT h.registration, h.mot_data FROM {table_name} h
+                   LEFT JOIN mot_vehicles v ON v.registration = h.registration
+                   WHERE v.registration IS NULL
+                   ''')
+    rows = cursor.fetchall()
+    for reg, mot_data in rows:
+        try:
+            store_mot_details(conn, reg, json.loads(mot_data))
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"⚠️ Could not migrate MOT history for {reg}: {e}")
+    if rows:
+        print(f"🔧 Normalised {len(rows)} saved MOT histories")
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def store_mot_details(conn, reg, data):
+    ''' Replaces the normalised rows for `reg` with those parsed from the API payload `data`. '''
+    reg = reg.upper()
+    delete_mot_details(conn, reg)
+    conn.execute(
+        '''
+        INSERT INTO mot_vehicles (registration, make, model, fuel_type, primary_colour, engine_size,
+                                  first_used_date, registration_date, manufacture_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        (reg, data.get('make'), data.get('model'), data.get('fuelType'), data.get('primaryColour'), data.get('engineSize'),
+         data.get('firstUsedDate'), data.get('registrationDate'), data.get('manufactureDate'))
+    )
+
+    for test in data.get('motTests') or []:
+        defects = test.get('defects') or []
+        odometer = _to_int(test.get('odometerValue'))
+        unit = (test.get('odometerUnit') or '').upper()
+        miles = odometer if unit != 'KM' or odometer is None else round(odometer * KM_TO_MILES)
+        cursor = conn.execute(
+            '''
+            INSERT INTO mot_tests (registration, test_number, completed_date, test_result, expiry_date,
+                                   odometer_value, odometer_unit, odometer_result_type, odometer_miles,
+                                   advisory_count, failure_count, dangerous_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (reg, test.get('motTestNumber'), test.get('completedDate'), test.get('testResult'), test.get('expiryDate'),
+             odometer, unit or None, test.get('odometerResultType'), miles,
+             sum(1 for d in defects if d.get('type') == 'ADVISORY'),
+             sum(1 for d in defects if d.get('type') in MOT_FAILURE_TYPES),
+             sum(1 for d in defects if d.get('dangerous')))
+        )
+        conn.executemany(
+            "INSERT INTO mot_defects (test_id, type, text, dangerous) VALUES (?, ?, ?, ?)",
+            [(cursor.lastrowid, d.get('type'), d.get('text'), int(bool(d.get('dangerous')))) for d in defects]
+        )
+
+def delete_mot_details(conn, reg):
+    conn.execute("DELETE FROM mot_defects WHERE test_id IN (SELECT test_id FROM mot_tests WHERE registration = ?)", (reg,))
+    conn.execute("DELETE FROM mot_tests WHERE registration = ?", (reg,))
+    conn.execute("DELETE FROM mot_vehicles WHERE registration = ?", (reg,))
+
+def create_mot_cache_table(table_name = 'mot_cache'):
+    ''' Raw DVSA responses (including 'not found'), so repeat lookups within the TTL skip the API. '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+                       CREATE TABLE IF NOT EXISTS {table_name} (
+                           "registration" TEXT PRIMARY KEY,
+                           "response" TEXT NOT NULL,
+                           "status" INTEGER NOT NULL,
+                           "fetched_at" REAL NOT NULL
+                       )
+                       ''')
+    run_write(write)
+
 def create_caz_table(table_name='caz'):
-    with sqlite3.connect(DB_PATH) as conn:
+    def write(conn):
         cursor = conn.cursor()
         cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS {table_name} (
@@ -63,22 +389,285 @@ def create_caz_table(table_name='caz'):
                 created_at TEXT
             )
         ''')
-        conn.commit()
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_registration ON {table_name} (registration, created_at)')
+    run_write(write)
+
+def create_jobs_table(table_name = 'jobs'):
+    ''' Background jobs (see utils/job_queue.py); unfinished ones are requeued when the server starts. '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                payload TEXT,
+                priority INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_state ON {table_name} (state, updated_at)')
+    run_write(write)
+
+def create_ocr_cache_table(table_name = 'ocr_cache'):
+    ''' Raw OCR text per image, keyed by the SHA-256 of the image bytes. '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                content_hash TEXT PRIMARY KEY,
+                texts TEXT NOT NULL,
+                created_at TEXT
+            )
+        ''')
+    run_write(write)
+
+def create_ad_snapshots_table(table_name = 'ad_snapshots'):
+    '''
+    Price and attribute history: one row when an ad is first saved and one each time a scrape finds it changed.
+    `changes` holds only the tracked fields that differ from the previous snapshot (all of them in the first).
+    '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                ad_id TEXT NOT NULL,
+                captured_at TEXT NOT NULL,
+                price INTEGER,
+                previous_price INTEGER,
+                mileage INTEGER,
+                changes TEXT NOT NULL,
+                PRIMARY KEY (ad_id, captured_at)
+            ) WITHOUT ROWID
+        ''')
+        # Partial index: only price drops are indexed, newest first for get_price_drops
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{table_name}_price_drops ON {table_name} (captured_at DESC)
+            WHERE price < previous_price
+        ''')
+    run_write(write)
+
+def create_scrape_runs_table(table_name = 'scrape_runs'):
+    ''' One row per scrape of a search; its last complete full sweep decides when the next one is due. '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                search TEXT NOT NULL DEFAULT 'default',
+                mode TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                finished_at TEXT NOT NULL,
+                cards_seen INTEGER,
+                new_ads INTEGER,
+                removed_ads INTEGER,
+                complete INTEGER NOT NULL
+            )
+        ''')
+        columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table_name})")}
+        if 'search' not in columns:
+            cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN search TEXT NOT NULL DEFAULT 'default'")
+        cursor.execute(f'DROP INDEX IF EXISTS idx_{table_name}_mode')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_search ON {table_name} (search, mode, complete, finished_at)')
+    run_write(write)
+
+def create_ad_searches_table(table_name = 'ad_searches'):
+    ''' Which saved searches (see utils/multi_search.py) have listed each ad; stale ads are removed per search. '''
+    def write(conn):
+        cursor = conn.cursor()
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                ad_id TEXT NOT NULL,
+                search TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                last_seen TEXT NOT NULL,
+                PRIMARY KEY (ad_id, search)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_search ON {table_name} (search)')
+        if not exists:
+            # Ads saved before searches were tracked came from the single default search
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO {table_name} (ad_id, search, first_seen, last_seen)
+                SELECT "Ad ID", 'default', "Scraped at", "Scraped at" FROM ads WHERE "Ad ID" IS NOT NULL
+            ''')
+    run_write(write)
+
+def create_file_tombstones_table(table_name = 'file_tombstones'):
+    ''' Ads deleted from the database whose images haven't been cleaned up yet (see utils/file_cleaner.py). '''
+    def write(conn):
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table_name} (
+                ad_id TEXT PRIMARY KEY,
+                deleted_at TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_attempt TEXT,
+                last_error TEXT
+            )
+        ''')
+    run_write(write)
+
+def _price_value(price):
+    ''' '£4,500' -> 4500; None when there's no number '''
+    digits = re.sub(r'[^0-9]', '', str(price or ''))
+    return int(digits) if digits else None
+
+def _mileage_value(mileage):
+    return mileage if isinstance(mileage, int) else None
+
+def content_hash(record):
+    ''' Short digest of an ad's TRACKED_AD_FIELDS, to spot changed listings without comparing every field. '''
+    values = json.dumps([record.get(field) for field in TRACKED_AD_FIELDS], default = str)
+    return hashlib.blake2b(values.encode(), digest_size = 8).hexdigest()
+
+def _snapshot_row(record, captured_at, changes, previous_price = None):
+    return (
+        record['Ad ID'], captured_at, _price_value(record.get('Price')), previous_price,
+        _mileage_value(record.get('Mileage')), json.dumps(changes, default = str)
+    )
+
+def _select_columns(prefix = ""):
+    return ", ".join(f'{prefix}"{column}"' for column in AD_PUBLIC_COLUMNS)
+
+def _stored_ads(conn, ad_ids, table_name = 'ads'):
+    ''' Returns: {Ad ID: (content hash, *TRACKED_AD_FIELDS)} for the saved ads among `ad_ids`, in one lookup '''
+    columns = ", ".join(f'"{field}"' for field in TRACKED_AD_FIELDS)
+    cursor = conn.execute(
+        f'SELECT "Ad ID", "Content hash", {columns} FROM {table_name} WHERE "Ad ID" IN (SELECT value FROM json_each(?))',
+        (json.dumps(list(ad_ids)),)
+    )
+    return {row[0]: row[1:] for row in cursor.fetchall()}
 
 # TODO: Rename to 'save_ads_data'        
-def save_to_sql(data, table_name = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.DataFrame(data)
-        df.to_sql(table_name, conn, if_exists = 'append', index = False)        
+def save_to_sql(data, table_name = 'ads', snapshot_table = 'ad_snapshots'):
+    '''
+    Inserts newly scraped ads and snapshots them. Ads that are saved already (by a concurrent scrape, or a
+    multi-search merge working from an older snapshot of known IDs) go through save_ad_changes' change detection
+    instead of failing the batch.
+    '''
+    if data is None or len(data) == 0:
+        return
+    captured_at = datetime.now().isoformat()
+    records = [{**record, 'Content hash': content_hash(record)} for record in data]
+    columns = [column for column in AD_COLUMNS if any(column in record for record in records)]
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    placeholders = ", ".join("?" for _ in columns)
+
+    def write(conn):
+        stored = _stored_ads(conn, (record['Ad ID'] for record in records), table_name)
+        new = [record for record in records if record['Ad ID'] not in stored]
+        conn.executemany(
+            f'INSERT INTO {table_name} ({column_list}) VALUES ({placeholders}) ON CONFLICT ("Ad ID") DO NOTHING',
+            [[record.get(column) for column in columns] for record in new]
+        )
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {snapshot_table} (ad_id, captured_at, price, previous_price, mileage, changes) VALUES (?, ?, ?, ?, ?, ?)",
+            [_snapshot_row(record, captured_at, {field: record.get(field) for field in TRACKED_AD_FIELDS}) for record in new]
+        )
+        existing = [record for record in records if record['Ad ID'] in stored]
+        if existing:
+            print(f"ℹ️ {len(existing)} ads were already saved; checking them for changes instead")
+            _apply_ad_changes(conn, existing, stored, captured_at, table_name, snapshot_table)
+        prune_ad_changes(conn, table_name)
+    run_write(write)
+
+def _apply_ad_changes(conn, records, stored, captured_at, table_name = 'ads', snapshot_table = 'ad_snapshots'):
+    '''
+    Rewrites and snapshots the `records` whose content hash differs from the `stored` one (see _stored_ads).
+    Returns: number of ads changed
+    '''
+    updates, snapshots = [], []
+    for record in records:
+        ad_id = record['Ad ID']
+        record_hash = record.get('Content hash') or content_hash(record)
+        if ad_id not in stored or stored[ad_id][0] == record_hash:
+            continue
+        old = dict(zip(TRACKED_AD_FIELDS, stored[ad_id][1:]))
+        if stored[ad_id][0] is None:
+            # Saved before hashes existed: this becomes its first snapshot
+            changes, previous_price = {field: record.get(field) for field in TRACKED_AD_FIELDS}, None
+        else:
+            changes = {field: record.get(field) for field in TRACKED_AD_FIELDS if record.get(field) != old[field]}
+            previous_price = _price_value(old['Price'])
+        updates.append([record.get(field) for field in TRACKED_AD_FIELDS] + [record_hash, ad_id])
+        snapshots.append(_snapshot_row(record, captured_at, changes, previous_price))
+        # A record listed twice in one batch is compared against its first copy
+        stored[ad_id] = (record_hash, *(record.get(field) for field in TRACKED_AD_FIELDS))
+    if not updates:
+        return 0
+
+    assignments = ", ".join(f'"{field}" = ?' for field in TRACKED_AD_FIELDS)
+    conn.executemany(f'UPDATE {table_name} SET {assignments}, "Content hash" = ? WHERE "Ad ID" = ?', updates)
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {snapshot_table} (ad_id, captured_at, price, previous_price, mileage, changes) VALUES (?, ?, ?, ?, ?, ?)",
+        snapshots
+    )
+    return len(updates)
+
+def save_ad_changes(records, table_name = 'ads', snapshot_table = 'ad_snapshots'):
+    '''
+    Change detection for ads that are already saved: `records` (freshly scraped) are hashed and compared with the
+    stored "Content hash" in one lookup; only the rows that differ are rewritten (one executemany) and snapshotted.
+    Returns: number of ads changed
+    '''
+    if not records:
+        return 0
+    records = [{**record, 'Content hash': content_hash(record)} for record in records]
+    captured_at = datetime.now().isoformat()
+
+    def write(conn):
+        stored = _stored_ads(conn, (record['Ad ID'] for record in records), table_name)
+        changed = _apply_ad_changes(conn, records, stored, captured_at, table_name, snapshot_table)
+        if changed:
+            prune_ad_changes(conn, table_name)
+        return changed
+    return run_write(write)
+
+def get_ad_history(ad_id, table_name = 'ad_snapshots'):
+    ''' Returns: the ad's snapshots, oldest first: [{'captured_at', 'price', 'previous_price', 'mileage', 'changes'}] '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(
+            f"SELECT captured_at, price, previous_price, mileage, changes FROM {table_name} WHERE ad_id = ? ORDER BY captured_at",
+            (ad_id,)
+        )
+        return [{**dict(row), 'changes': json.loads(row['changes'])} for row in cursor.fetchall()]
+
+def get_price_drops(since = None, min_drop = 0, limit = PRICE_DROPS_LIMIT, table_name = 'ad_snapshots', ads_table = 'ads'):
+    ''' Most recent price drops of saved ads (captured after `since`, by more than `min_drop` pounds), newest first. '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        # `price < previous_price` matches the partial index's WHERE clause so the planner can use it
+        cursor.execute(f'''
+            SELECT s.ad_id, s.captured_at, s.previous_price, s.price, s.previous_price - s.price AS drop_amount,
+                   a."Title" AS title, a."Ad URL" AS ad_url, a."Mileage" AS mileage
+            FROM {table_name} s
+            JOIN {ads_table} a ON a."Ad ID" = s.ad_id
+            WHERE s.price < s.previous_price AND s.captured_at >= ? AND s.previous_price - s.price > ?
+            ORDER BY s.captured_at DESC
+            LIMIT ?
+        ''', (since or '', min_drop, limit))
+        return [dict(row) for row in cursor.fetchall()]
         
 def save_caz_data(registration, caz_data, table_name='caz'):
-    with sqlite3.connect(DB_PATH) as conn:
+    def write(conn):
         cursor = conn.cursor()
         timestamp = datetime.now().isoformat()
 
         # Delete existing data for the registration to avoid duplicates
         cursor.execute(f"DELETE FROM {table_name} WHERE registration = ?", (registration.upper(),))
 
+        if not caz_data:
+            # No zones apply: a row without a zone records the check, so it's cached like any other result
+            cursor.execute(f"INSERT INTO {table_name} (registration, created_at) VALUES (?, ?)", (registration.upper(), timestamp))
+
         for entry in caz_data:
             cursor.execute(f'''
                 INSERT INTO {table_name} 
@@ -93,10 +682,10 @@ def save_caz_data(registration, caz_data, table_name='caz'):
                 entry.get('Exemptions URL'),
                 timestamp
             ))
-        conn.commit()
+    run_write(write)
         
 def check_ad_id_exists(ad_id, table_name = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute(f"SELECT 1 FROM {table_name} WHERE \"Ad ID\" = ?", (ad_id,))
         return cursor.fetchone() is not None
@@ -104,10 +693,9 @@ def check_ad_id_exists(ad_id, table_name = 'ads'):
 def update_flag(ad_id, column, value, table_name='ads'):
     if column not in ("Favourited", "Excluded"):
         raise ValueError("Invalid column")
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(f'UPDATE {table_name} SET "{column}" = ? WHERE "Ad ID" = ?', (value, ad_id))
-        conn.commit()
+    def write(conn):
+        conn.execute(f'UPDATE {table_name} SET "{column}" = ? WHERE "Ad ID" = ?', (value, ad_id))
+    run_write(write)
 
 def insert_test_ad(table_name='ads'):
     ad = {
@@ -128,46 +716,340 @@ def insert_test_ad(table_name='ads'):
     save_to_sql([ad], table_name)
     
 def load_ads(table = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
-        df = pd.read_sql_query(f'SELECT * FROM {table}', conn)
+    with transaction() as conn:
+        df = pd.read_sql_query(f'SELECT {_select_columns()} FROM {table}', conn)
         df = df.fillna("").replace({float("nan"): ""})
         return df.to_dict(orient='records')
     
+def query_ads(filters = None, sort_by = None, direction = 'asc', page = 1, limit = None, offset = None, table_name = 'ads'):
+    '''
+    Filters, sorts and paginates ads in SQL.
+    `filters`: optional dict with 'Favourited' / 'Excluded' (0 or 1) and any key of AD_RANGE_FILTERS.
+    `limit`: page size; None returns every matching row.
+    `offset`: rows to skip, used instead of `page` when given (lets clients resume after removing rows locally).
+    Returns: (list of ad dicts, total number of matching ads)
+    '''
+    filters = filters or {}
+    clauses, params = [], []
+    for column in ("Favourited", "Excluded"):
+        if filters.get(column) is not None:
+            clauses.append(f'"{column}" = ?')
+            params.append(int(filters[column]))
+    for name, (expression, comparison) in AD_RANGE_FILTERS.items():
+        if filters.get(name) is not None:
+            clauses.append(f'{expression} {comparison} ?')
+            params.append(filters[name])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    if sort_by is not None and sort_by not in AD_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort key '{sort_by}'")
+    if direction not in ('asc', 'desc'):
+        raise ValueError(f"Invalid sort direction '{direction}'")
+    order = f'ORDER BY {AD_SORT_COLUMNS[sort_by]} {direction.upper()}, "Ad ID"' if sort_by else ""
+
+    pagination = ""
+    if limit is not None:
+        pagination = "LIMIT ? OFFSET ?"
+        if offset is None:
+            offset = (max(int(page), 1) - 1) * int(limit)
+        page_params = [int(limit), max(int(offset), 0)]
+    else:
+        page_params = []
+
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'SELECT COUNT(*) FROM {table_name} {where}', params)
+        total = cursor.fetchone()[0]
+        cursor.execute(f'SELECT {_select_columns()} FROM {table_name} {where} {order} {pagination}', params + page_params)
+        ads = [
+            {key: ("" if row[key] is None else row[key]) for key in row.keys()}
+            for row in cursor.fetchall()
+        ]
+    return ads, total
+
+def get_ads_by_ids(ad_ids, table_name = 'ads'):
+    ''' Returns: list of ad dicts for the given IDs (missing IDs are ignored) '''
+    ad_ids = list(ad_ids)
+    ads = []
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        # Chunked to stay under SQLite's bound-parameter limit
+        for i in range(0, len(ad_ids), 500):
+            chunk = ad_ids[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(f'SELECT {_select_columns()} FROM {table_name} WHERE "Ad ID" IN ({placeholders})', chunk)
+            ads.extend(
+                {key: ("" if row[key] is None else row[key]) for key in row.keys()}
+                for row in cursor.fetchall()
+            )
+    return ads
+
+def build_search_query(text):
+    '''
+    Turns free text into an FTS5 query: every word must match, as a prefix ("Jazz auto" -> "jazz"* "auto"*).
+    Raises ValueError if there are no words.
+    '''
+    words = re.findall(r'[^\W_]+', text.lower())
+    if not words:
+        raise ValueError("Search query has no words")
+    return " ".join(f'"{word}"*' for word in words)
+
+def search_ads(text, limit = SEARCH_LIMIT, include_excluded = False, table_name = 'ads'):
+    '''
+    Full-text search over title, subtitle, location and MOT make/model, best matches first.
+    Returns: list of ad dicts, each with a `snippet` (matches wrapped in <mark>) and its bm25 `rank` (lower is better)
+    Raises ValueError for a query without words and SearchUnavailable without the FTS5 index.
+    '''
+    query = build_search_query(text)
+    excluded = "" if include_excluded else 'AND a."Excluded" = 0'
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    with transaction() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f'{table_name}_fts_keys',)).fetchone():
+            raise SearchUnavailable("Full-text search is unavailable: this SQLite build has no FTS5")
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            SELECT {_select_columns('a.')}, snippet({table_name}_fts, -1, '<mark>', '</mark>', '…', 12) AS snippet,
+                   bm25({table_name}_fts, {weights}) AS rank
+            FROM {table_name}_fts
+            JOIN {table_name} a ON a."Ad ID" = {table_name}_fts.ad_id
+            WHERE {table_name}_fts MATCH ? {excluded}
+            ORDER BY rank
+            LIMIT ?
+        ''', (query, limit))
+        return [
+            {key: ("" if row[key] is None else row[key]) for key in row.keys()}
+            for row in cursor.fetchall()
+        ]
+
+def get_ads_version(table_name = 'ads'):
+    ''' Returns: current version of the ads table (0 if it has never changed) '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MAX(version), 0) FROM {table_name}_changes")
+        return cursor.fetchone()[0]
+
+def get_ad_changes(since, table_name = 'ads'):
+    '''
+    Net changes to the ads table after version `since`.
+    Returns: {'version', 'inserted', 'updated', 'deleted'} (lists of Ad IDs),
+             or None if the log no longer reaches back to `since`.
+    '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MIN(version), 0), COALESCE(MAX(version), 0) FROM {table_name}_changes")
+        oldest, version = cursor.fetchone()
+        if since < oldest - 1 or since > version:
+            return None
+        cursor.execute(
+            f"SELECT ad_id, operation FROM {table_name}_changes WHERE version > ? ORDER BY version",
+            (since,)
+        )
+        rows = cursor.fetchall()
+
+    # Collapse each ad's operations into one net change
+    first_op, last_op = {}, {}
+    for ad_id, operation in rows:
+        first_op.setdefault(ad_id, operation)
+        last_op[ad_id] = operation
+
+    changes = {'version': version, 'inserted': [], 'updated': [], 'deleted': []}
+    for ad_id, operation in last_op.items():
+        existed_before = first_op[ad_id] != 'insert'
+        if operation == 'delete':
+            if existed_before:
+                changes['deleted'].append(ad_id)
+        elif existed_before:
+            changes['updated'].append(ad_id)
+        else:
+            changes['inserted'].append(ad_id)
+    return changes
+
+def prune_ad_changes(conn, table_name = 'ads', keep = MAX_CHANGE_LOG_ROWS):
+    cursor = conn.cursor()
+    cursor.execute(
+        f"DELETE FROM {table_name}_changes WHERE version <= (SELECT MAX(version) FROM {table_name}_changes) - ?",
+        (keep,)
+    )
+
+def get_ad_ids(table_name = 'ads'):
+    '''
+    Returns: set of every saved Ad ID (one query, for in-memory membership checks)
+    '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT "Ad ID" FROM {table_name}')
+        return {row[0] for row in cursor.fetchall()}
+    
 def get_saved_ad_ids(table_name = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute(f"SELECT `Ad ID`, `Ad URL` FROM {table_name}")
         return cursor.fetchall()
     
+def _bound_ad_id(conn, reg, table_name = 'mot_history'):
+    row = conn.execute(f"SELECT ad_id FROM {table_name} WHERE registration = ?", (reg.upper(),)).fetchone()
+    return row[0] if row else None
+
 def save_mot_history(reg, data, ad_id = None, table_name = 'mot_history'):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
+    def write(conn):
+        previous_ad_id = _bound_ad_id(conn, reg, table_name)
+        conn.execute(
             f'''
             INSERT OR REPLACE INTO {table_name} (registration, mot_data, ad_id, created_at)
             VALUES (?, ?, ?, ?)
             ''',
             (reg.upper(), json.dumps(data), ad_id, datetime.now().isoformat())
         )
-        conn.commit()
+        store_mot_details(conn, reg, data)
+        refresh_ads_search_vehicles(conn, [previous_ad_id, ad_id])
+    run_write(write)
 
 def get_mot_histories(ad_id = None, table_name = 'mot_history'):
-    with sqlite3.connect(DB_PATH) as conn:
+    '''
+    Lightweight summaries (vehicle details and the latest test), read from the normalised tables.
+    Returns: list of dicts, optionally only those bound to `ad_id`
+    '''
+    where, params = ("WHERE h.ad_id = ?", (ad_id,)) if ad_id is not None else ("", ())
+    with transaction() as conn:
         cursor = conn.cursor()
-        if ad_id is None: 
-            cursor.execute(f"SELECT registration, mot_data, ad_id FROM {table_name}")            
-        else:
-            cursor.execute(f"SELECT registration, mot_data, ad_id FROM {table_name} WHERE ad_id = ?", (ad_id,))
-        return [
-            {"registration": row[0], "data": json.loads(row[1]), "ad_id": row[2]}
-            for row in cursor.fetchall()
-        ]
-        
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            WITH latest AS (
+                SELECT registration, completed_date, test_result, odometer_miles, advisory_count, expiry_date,
+                       COUNT(*) OVER (PARTITION BY registration) AS test_count,
+                       ROW_NUMBER() OVER (PARTITION BY registration ORDER BY completed_date DESC) AS rn
+                FROM mot_tests
+            )
+            SELECT h.registration, h.ad_id, v.make, v.model, v.fuel_type, v.first_used_date,
+                   COALESCE(l.test_count, 0) AS test_count,
+                   l.completed_date AS last_test_date, l.test_result AS last_test_result,
+                   l.odometer_miles AS last_mileage, l.advisory_count AS last_advisory_count,
+                   l.expiry_date AS mot_expiry
+            FROM {table_name} h
+            LEFT JOIN mot_vehicles v ON v.registration = h.registration
+            LEFT JOIN latest l ON l.registration = h.registration AND l.rn = 1
+            {where}
+            ORDER BY h.registration
+        ''', params)
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_saved_mot_history(registration, table_name = 'mot_history'):
+    ''' Returns: {"registration", "data" (full API payload), "ad_id"} for one registration, or None '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT registration, mot_data, ad_id FROM {table_name} WHERE registration = ?", (registration.upper(),))
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return {"registration": row[0], "data": json.loads(row[1]), "ad_id": row[2]}
+
+def get_ads_with_advisories(min_advisories, table_name = 'mot_history'):
+    ''' Bound vehicles whose most recent MOT had more than `min_advisories` advisories, most first. '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            WITH latest AS (
+                SELECT registration, completed_date, test_result, advisory_count,
+                       ROW_NUMBER() OVER (PARTITION BY registration ORDER BY completed_date DESC) AS rn
+                FROM mot_tests
+            )
+            SELECT h.ad_id, h.registration, l.completed_date, l.test_result, l.advisory_count
+            FROM latest l
+            JOIN {table_name} h ON h.registration = l.registration
+            WHERE l.rn = 1 AND l.advisory_count > ? AND h.ad_id IS NOT NULL
+            ORDER BY l.advisory_count DESC
+        ''', (min_advisories,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_mileage_clocking_suspects(min_drop = 0, table_name = 'mot_history'):
+    '''
+    Vehicles with a recorded mileage lower than at an earlier MOT (by more than `min_drop` miles).
+    Only readings the tester marked as READ are compared.
+    '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f'''
+            WITH readings AS (
+                SELECT registration, completed_date, odometer_miles,
+                       LAG(odometer_miles) OVER (PARTITION BY registration ORDER BY completed_date) AS previous_miles,
+                       LAG(completed_date) OVER (PARTITION BY registration ORDER BY completed_date) AS previous_date
+                FROM mot_tests
+                WHERE odometer_miles IS NOT NULL AND odometer_result_type = 'READ'
+            )
+            SELECT h.ad_id, r.registration, r.previous_date, r.previous_miles, r.completed_date, r.odometer_miles,
+                   r.previous_miles - r.odometer_miles AS drop_miles
+            FROM readings r
+            JOIN {table_name} h ON h.registration = r.registration
+            WHERE r.odometer_miles < r.previous_miles - ?
+            ORDER BY drop_miles DESC
+        ''', (min_drop,))
+        return [dict(row) for row in cursor.fetchall()]
+
+def save_mot_histories(entries, table_name = 'mot_history'):
+    ''' Saves many MOT histories in one transaction. `entries`: list of (reg, data, ad_id) '''
+    if not entries:
+        return
+    timestamp = datetime.now().isoformat()
+    def write(conn):
+        previous_ad_ids = [_bound_ad_id(conn, reg, table_name) for reg, _, _ in entries]
+        conn.executemany(
+            f'''
+            INSERT OR REPLACE INTO {table_name} (registration, mot_data, ad_id, created_at)
+            VALUES (?, ?, ?, ?)
+            ''',
+            [(reg.upper(), json.dumps(data), ad_id, timestamp) for reg, data, ad_id in entries]
+        )
+        for reg, data, _ in entries:
+            store_mot_details(conn, reg, data)
+        refresh_ads_search_vehicles(conn, previous_ad_ids + [ad_id for _, _, ad_id in entries])
+    run_write(write)
+
+def get_mot_cache(registrations, max_age, table_name = 'mot_cache'):
+    ''' Returns: {registration: (status, response, fetched_at)} for entries fetched within the last `max_age` seconds '''
+    registrations = list(registrations)
+    cutoff = time.time() - max_age
+    cached = {}
+    with transaction() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(registrations), 500):
+            chunk = registrations[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(
+                f"SELECT registration, status, response, fetched_at FROM {table_name} WHERE registration IN ({placeholders}) AND fetched_at >= ?",
+                chunk + [cutoff]
+            )
+            cached.update((row[0], (row[1], json.loads(row[2]), row[3])) for row in cursor.fetchall())
+    return cached
+
+def save_mot_cache(results, table_name = 'mot_cache'):
+    ''' `results`: {registration: (status, response)} '''
+    if not results:
+        return
+    fetched_at = time.time()
+    def write(conn):
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {table_name} (registration, response, status, fetched_at) VALUES (?, ?, ?, ?)",
+            [(reg, json.dumps(response), status, fetched_at) for reg, (status, response) in results.items()]
+        )
+    run_write(write)
+
+def get_bound_mot_registrations(table_name = 'mot_history'):
+    ''' Returns: [(registration, ad_id)] for MOT histories bound to an ad '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT registration, ad_id FROM {table_name} WHERE ad_id IS NOT NULL")
+        return cursor.fetchall()
+
 def get_caz_data(registration, table_name="caz"):
-    with sqlite3.connect(DB_PATH) as conn:
+    with transaction() as conn:
         cursor = conn.cursor()
         cursor.execute(
-            f"SELECT zone, daily_charge, zone_live, map_url, exemptions_url FROM {table_name} WHERE registration = ?",
+            f"SELECT zone, daily_charge, zone_live, map_url, exemptions_url FROM {table_name} WHERE registration = ? AND zone IS NOT NULL",
             (registration.upper(),),
         )
         rows = cursor.fetchall()
@@ -183,38 +1065,239 @@ def get_caz_data(registration, table_name="caz"):
         ]
 
         
+def get_caz_data_bulk(registrations, fresh_since, table_name = "caz"):
+    ''' Returns: {registration: [zone dicts] (empty if no zones apply)} for registrations checked at or after `fresh_since` (a datetime) '''
+    registrations = [reg.upper() for reg in registrations]
+    results = {}
+    with transaction() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(registrations), 500):
+            chunk = registrations[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(
+                f'''
+                SELECT registration, zone, daily_charge, zone_live, map_url, exemptions_url FROM {table_name}
+                WHERE registration IN ({placeholders}) AND created_at >= ?
+                ''',
+                chunk + [fresh_since.isoformat()]
+            )
+            for row in cursor.fetchall():
+                zones = results.setdefault(row[0], [])
+                if row[1] is None:
+                    continue # Checked, no zones apply
+                zones.append({
+                    "Zone": row[1],
+                    "Daily Charge": row[2],
+                    "Zone Live": row[3],
+                    "Map URL": row[4],
+                    "Exemptions URL": row[5],
+                })
+    return results
+
 def delete_ads(ids_to_remove, table_name = 'ads'):
-    with sqlite3.connect(DB_PATH) as conn:
+    # A list, not the caller's iterable: the writer replays a write whose batch failed
+    params = [(ad_id,) for ad_id in ids_to_remove]
+    def write(conn):
         cursor = conn.cursor()
-        cursor.executemany(
-            f'DELETE FROM {table_name} WHERE "Ad ID" = ?',
-            [(ad_id,) for ad_id in ids_to_remove]
-        )
-        conn.commit()
+        cursor.executemany(f'DELETE FROM {table_name} WHERE "Ad ID" = ?', params)
+        cursor.executemany('DELETE FROM ad_searches WHERE ad_id = ?', params)
+        cursor.executemany('DELETE FROM ad_snapshots WHERE ad_id = ?', params)
+    run_write(write)
                 
 def delete_mot_history(reg, table_name = 'mot_history'):
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
-        cursor.execute(f"DELETE FROM {table_name} WHERE registration = ?", (reg.upper(),))
-        conn.commit()
+    def write(conn):
+        previous_ad_id = _bound_ad_id(conn, reg, table_name)
+        conn.execute(f"DELETE FROM {table_name} WHERE registration = ?", (reg.upper(),))
+        delete_mot_details(conn, reg.upper())
+        refresh_ads_search_vehicles(conn, [previous_ad_id])
+    run_write(write)
         
 def bind_mot_to_ad(reg, ad_id, table_name = 'mot_history'):
     '''
     Returns: ad_id, ad_url
     '''
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.cursor()
+    def write(conn):
+        previous_ad_id = _bound_ad_id(conn, reg, table_name)
         if ad_id is None:
-            cursor.execute(f"UPDATE {table_name} SET ad_id = NULL WHERE registration = ?", (reg.upper(),))
+            conn.execute(f"UPDATE {table_name} SET ad_id = NULL WHERE registration = ?", (reg.upper(),))
         else:
-            cursor.execute(f"UPDATE {table_name} SET ad_id = ? WHERE registration = ?", (ad_id, reg.upper()))
-        conn.commit()
+            conn.execute(f"UPDATE {table_name} SET ad_id = ? WHERE registration = ?", (ad_id, reg.upper()))
+        refresh_ads_search_vehicles(conn, [previous_ad_id, ad_id])
+    run_write(write)
         
+def get_ocr_cache(content_hashes, table_name = 'ocr_cache'):
+    ''' Returns: {content_hash: [texts]} for the hashes that have been OCR'd before '''
+    content_hashes = list(content_hashes)
+    cached = {}
+    with transaction() as conn:
+        cursor = conn.cursor()
+        for i in range(0, len(content_hashes), 500):
+            chunk = content_hashes[i:i + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(f"SELECT content_hash, texts FROM {table_name} WHERE content_hash IN ({placeholders})", chunk)
+            cached.update((row[0], json.loads(row[1])) for row in cursor.fetchall())
+    return cached
+
+def save_ocr_cache(results, table_name = 'ocr_cache'):
+    ''' `results`: {content_hash: [texts]} '''
+    if not results:
+        return
+    timestamp = datetime.now().isoformat()
+    def write(conn):
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {table_name} (content_hash, texts, created_at) VALUES (?, ?, ?)",
+            [(content_hash, json.dumps(texts), timestamp) for content_hash, texts in results.items()]
+        )
+    run_write(write)
+
+def save_job(job_id, kind, key, payload, priority, state, error, created_at, table_name = 'jobs'):
+    def write(conn):
+        conn.execute(
+            f'''
+            INSERT OR REPLACE INTO {table_name} (job_id, kind, key, payload, priority, state, error, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (job_id, kind, key, payload, priority, state, error, created_at, datetime.now().isoformat())
+        )
+    run_write(write)
+
+def get_unfinished_jobs(table_name = 'jobs'):
+    ''' Jobs still queued, or running when the last process stopped. Oldest first. '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(f"SELECT * FROM {table_name} WHERE state IN ('queued', 'running') ORDER BY priority, created_at")
+        return [dict(row) for row in cursor.fetchall()]
+
+def prune_jobs(finished_before, table_name = 'jobs'):
+    def write(conn):
+        conn.execute(
+            f"DELETE FROM {table_name} WHERE state NOT IN ('queued', 'running') AND updated_at < ?",
+            (finished_before.isoformat(),)
+        )
+    run_write(write)
+
+def save_scrape_run(mode, started_at, cards_seen, new_ads, removed_ads, complete, search = 'default', table_name = 'scrape_runs'):
+    def write(conn):
+        conn.execute(
+            f'''
+            INSERT INTO {table_name} (search, mode, started_at, finished_at, cards_seen, new_ads, removed_ads, complete)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (search, mode, started_at.isoformat(), datetime.now().isoformat(), cards_seen, new_ads, removed_ads, int(complete))
+        )
+    run_write(write)
+
+def get_last_full_sweep(search = 'default', table_name = 'scrape_runs'):
+    ''' Returns: datetime the last full sweep of `search` that reached the end of the results finished, or None '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT MAX(finished_at) FROM {table_name} WHERE search = ? AND mode = 'full' AND complete = 1", (search,))
+        row = cursor.fetchone()
+        return datetime.fromisoformat(row[0]) if row and row[0] else None
+
+def _load_live_ads(conn, ad_ids):
+    ''' Fills temp table `live_ads` with `ad_ids` for set-based statements on this connection. '''
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_ads (ad_id TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute("DELETE FROM temp.live_ads")
+    # One bound JSON array rather than a statement per ID; sorted so the B-tree inserts are sequential
+    conn.execute("INSERT OR IGNORE INTO temp.live_ads (ad_id) SELECT value FROM json_each(?)", (json.dumps(sorted(ad_ids)),))
+
+def _record_live_ads(conn, search, timestamp, table_name = 'ad_searches'):
+    conn.execute(
+        f'''
+        INSERT INTO {table_name} (ad_id, search, first_seen, last_seen)
+        SELECT ad_id, ?, ?, ? FROM temp.live_ads WHERE true
+        ON CONFLICT (ad_id, search) DO UPDATE SET last_seen = excluded.last_seen
+        ''',
+        (search, timestamp, timestamp)
+    )
+
+def save_ad_searches(search, ad_ids, table_name = 'ad_searches'):
+    ''' Records that `search` listed each of `ad_ids` now. '''
+    timestamp = datetime.now().isoformat()
+    def write(conn):
+        _load_live_ads(conn, ad_ids)
+        _record_live_ads(conn, search, timestamp, table_name)
+        conn.execute("DELETE FROM temp.live_ads")
+    run_write(write)
+
+def get_search_ad_ids(search, table_name = 'ad_searches'):
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT ad_id FROM {table_name} WHERE search = ?", (search,))
+        return {row[0] for row in cursor.fetchall()}
+
+def reconcile_search_ads(search, live_ad_ids, table_name = 'ads'):
+    '''
+    After a complete sweep of `search`, in one transaction: records its listings, anti-joins the ones recorded
+    before against `live_ad_ids` (loaded into a temp table) and forgets the stale ones, deletes the ads no search
+    lists any more and tombstones them so their files can be cleaned up (and the cleanup resumed) afterwards.
+    Returns: list of deleted Ad IDs
+    '''
+    timestamp = datetime.now().isoformat()
+    def write(conn):
+        _load_live_ads(conn, live_ad_ids)
+        _record_live_ads(conn, search, timestamp)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS stale_ads (ad_id TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("DELETE FROM temp.stale_ads")
+        conn.execute(
+            '''
+            INSERT INTO temp.stale_ads (ad_id)
+            SELECT s.ad_id FROM ad_searches s
+            WHERE s.search = ? AND NOT EXISTS (SELECT 1 FROM temp.live_ads l WHERE l.ad_id = s.ad_id)
+            ''',
+            (search,)
+        )
+        conn.execute("DELETE FROM ad_searches WHERE search = ? AND ad_id IN (SELECT ad_id FROM temp.stale_ads)", (search,))
+        # Ads another search still lists stay
+        conn.execute("DELETE FROM temp.stale_ads WHERE EXISTS (SELECT 1 FROM ad_searches s WHERE s.ad_id = stale_ads.ad_id)")
+
+        conn.execute("INSERT OR IGNORE INTO file_tombstones (ad_id, deleted_at) SELECT ad_id, ? FROM temp.stale_ads", (timestamp,))
+        conn.execute(f'DELETE FROM {table_name} WHERE "Ad ID" IN (SELECT ad_id FROM temp.stale_ads)')
+        conn.execute("DELETE FROM ad_snapshots WHERE ad_id IN (SELECT ad_id FROM temp.stale_ads)")
+        removed = [row[0] for row in conn.execute("SELECT ad_id FROM temp.stale_ads")]
+
+        conn.execute("DELETE FROM temp.live_ads")
+        conn.execute("DELETE FROM temp.stale_ads")
+        return removed
+    return run_write(write)
+
+def get_file_tombstones(limit, attempted_before, table_name = 'file_tombstones'):
+    ''' Up to `limit` tombstoned Ad IDs, oldest first, skipping ones already tried since `attempted_before`. '''
+    with transaction() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT ad_id FROM {table_name} WHERE last_attempt IS NULL OR last_attempt < ? ORDER BY deleted_at LIMIT ?",
+            (attempted_before.isoformat(), limit)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+def clear_file_tombstones(ad_ids, errors = None, table_name = 'file_tombstones'):
+    ''' Drops tombstones for `ad_ids` (files gone) and records failed attempts from `errors` ({ad_id: message}). '''
+    timestamp = datetime.now().isoformat()
+    def write(conn):
+        conn.executemany(f"DELETE FROM {table_name} WHERE ad_id = ?", [(ad_id,) for ad_id in ad_ids])
+        conn.executemany(
+            f"UPDATE {table_name} SET attempts = attempts + 1, last_attempt = ?, last_error = ? WHERE ad_id = ?",
+            [(timestamp, error, ad_id) for ad_id, error in (errors or {}).items()]
+        )
+    run_write(write)
+
 def ensure_tables_exist():
     create_ads_table()
     create_mot_history_table()
+    create_mot_cache_table()
     create_caz_table()
+    create_ocr_cache_table()
+    create_jobs_table()
+    create_scrape_runs_table()
+    create_ad_searches_table()
+    create_file_tombstones_table()
         
+# Per-function timings for /api/metrics and the slow-request log
+instrument_functions(globals(), exclude = ('content_hash', 'build_search_query'))
+
 if __name__ == "__main__":
     ensure_tables_exist()
     pass
\ No newline at end of file
@@ -0,0 +1,147 @@
+import os, queue, sqlite3, threading, time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+# SQLite location (AUTOTRADER_DB_PATH overrides it, e.g. for benchmarks against a scratch database)
+DATA_DIR = Path('data')
+DB_PATH = Path(os.getenv('AUTOTRADER_DB_PATH', DATA_DIR / 'autotrader_listings.db'))
+
+# Create dir if doesn't exist
+os.makedirs(DB_PATH.parent, exist_ok = True)
+
+JOURNAL_MODE = os.getenv('AUTOTRADER_DB_JOURNAL_MODE', 'WAL') # WAL lets readers run alongside the writer
+BUSY_TIMEOUT_MS = 30000 # Wait for locks held by the other process instead of failing with 'database is locked'
+CACHE_SIZE_KB = 16000
+
+# Writer queue batching
+WRITE_BATCH_SIZE = 50 # Max queued writes committed in one transaction
+WRITE_BATCH_WAIT = 0.01 # Seconds to wait for more writes before committing a batch
+
+_local = threading.local()
+
+
+def connect(db_path = None):
+    ''' Opens a new connection with the project's pragmas applied. '''
+    conn = sqlite3.connect(db_path or DB_PATH, timeout = BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL") # Safe with WAL; skips an fsync per commit
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    return conn
+
+def get_connection():
+    ''' Returns this thread's connection, opening it on first use. '''
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+    return conn
+
+def close_connection():
+    ''' Closes this thread's connection, if it has one. '''
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+@contextmanager
+def transaction():
+    ''' Yields this thread's connection; commits on success and rolls back on error. '''
+    conn = get_connection()
+    with conn:
+        yield conn
+
+
+class WriteQueue:
+    '''
+    Single writer thread for SQLite writes.
+    Callers submit `fn(conn)`; queued writes are committed together in batches, so many small
+    writes from request/download threads cost one transaction instead of one each.
+    '''
+    def __init__(self, batch_size = WRITE_BATCH_SIZE, batch_wait = WRITE_BATCH_WAIT):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _reset(self):
+        ''' Drops the queue and thread inherited over a fork: the parent's writer doesn't exist in the child. '''
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target = self._run, name = 'sqlite-writer', daemon = True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        ''' Queues `fn(conn, *args, **kwargs)`. Returns: Future resolving to its return value. '''
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Already on the writer thread (a write issued from inside a write): run it inline
+            try:
+                future.set_result(fn(get_connection(), *args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_started()
+        self._queue.put((fn, args, kwargs, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout = remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = get_connection()
+        while True:
+            batch = self._next_batch()
+            try:
+                with conn:
+                    results = [fn(conn, *args, **kwargs) for fn, args, kwargs, _ in batch]
+            except Exception:
+                # One bad write shouldn't sink the others: replay them one transaction each
+                for fn, args, kwargs, future in batch:
+                    try:
+                        with conn:
+                            future.set_result(fn(conn, *args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+
+            for (_, _, _, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def pending(self):
+        return self._queue.qsize()
+
+
+DB_WRITER = WriteQueue()
+
+def _after_fork_in_child():
+    # The scraper runs in a forked process: a queue copied while the parent's writer waited on it never
+    # wakes the child's writer, and SQLite connections mustn't be used across a fork
+    global _local
+    _local = threading.local()
+    DB_WRITER._reset()
+
+os.register_at_fork(after_in_child = _after_fork_in_child)
+
+def run_write(fn, *args, **kwargs):
+    ''' Runs `fn(conn, *args, **kwargs)` on the writer thread and waits for its result. '''
+    return DB_WRITER.submit(fn, *args, **kwargs).result()
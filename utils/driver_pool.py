@@ -0,0 +1,175 @@
+import atexit, threading, time
+from contextlib import contextmanager
+
+
+class _PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+
+class DriverPool:
+    '''
+    Pool of warm Selenium drivers that can be checked out and returned.
+
+    - `factory` is a zero-argument callable returning a ready (e.g. stealth-configured) driver.
+    - At most `max_size` drivers exist at once; `acquire` blocks when all are checked out.
+    - A driver is recycled after `max_uses` checkouts, or when it fails a health check.
+    - Drivers left idle for longer than `idle_timeout` seconds are quit by a background reaper.
+    '''
+    def __init__(self, factory, max_size = 2, max_uses = 25, idle_timeout = 300):
+        self.factory = factory
+        self.max_size = max_size
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+
+        self._idle = [] # _PooledDriver objects ready for checkout, most recently used last
+        self._in_use = {} # id(driver) -> _PooledDriver
+        self._cond = threading.Condition()
+        self._reaper = None
+        self._closed = False
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use)
+
+    @staticmethod
+    def _quit(entry):
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            print(f"⚠️ Error quitting pooled driver: {e}")
+
+    @staticmethod
+    def _is_healthy(entry):
+        try:
+            entry.driver.current_url # Round trip to the browser; fails if it has crashed
+            return len(entry.driver.window_handles) > 0
+        except Exception:
+            return False
+
+    def _start_reaper(self):
+        if self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target = self._reap_forever, daemon = True)
+        self._reaper.start()
+
+    def _reap_forever(self):
+        interval = max(self.idle_timeout / 2, 1)
+        while not self._closed:
+            time.sleep(interval)
+            self.evict_idle()
+
+    def acquire(self, timeout = None):
+        ''' Checks out a healthy driver, creating one if the pool has room. '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                while not self._idle and self._size() >= self.max_size:
+                    remaining = None if deadline is None else deadline - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("Timed out waiting for a browser from the pool")
+                    self._cond.wait(remaining)
+
+                # Whatever we take counts against max_size until it is released
+                entry = self._idle.pop() if self._idle else _PooledDriver(None)
+                self._in_use[id(entry)] = entry
+                self._start_reaper()
+
+            if entry.driver is not None and self._is_healthy(entry):
+                break
+
+            if entry.driver is not None:
+                print("♻️ Pooled browser failed health check. Replacing.")
+                self._quit(entry)
+            try:
+                entry.driver = self.factory()
+                entry.uses = 0
+                break
+            except BaseException:
+                with self._cond:
+                    self._in_use.pop(id(entry), None)
+                    self._cond.notify()
+                raise
+
+        entry.uses += 1
+        with self._cond:
+            # Re-key by the driver so release() can find it
+            self._in_use.pop(id(entry), None)
+            self._in_use[id(entry.driver)] = entry
+        return entry.driver
+
+    def release(self, driver, discard = False):
+        ''' Returns a driver to the pool. `discard` quits it instead (e.g. after an error). '''
+        with self._cond:
+            entry = self._in_use.pop(id(driver), None)
+        if entry is None:
+            return
+
+        if not discard and entry.uses < self.max_uses and not self._closed:
+            try:
+                driver.get("about:blank") # Drop the previous page so it doesn't hold memory
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        if discard:
+            self._quit(entry)
+        else:
+            entry.last_used = time.time()
+
+        with self._cond:
+            if not discard:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def driver(self, url = None, timeout = None):
+        ''' Context manager: checks out a driver, optionally navigates to `url`, and returns it afterwards. '''
+        driver = self.acquire(timeout = timeout)
+        discard = False
+        try:
+            if url:
+                driver.get(url)
+            yield driver
+        except BaseException:
+            discard = True
+            raise
+        finally:
+            self.release(driver, discard = discard)
+
+    def evict_idle(self):
+        ''' Quits drivers that have been idle for longer than `idle_timeout`. '''
+        cutoff = time.time() - self.idle_timeout
+        with self._cond:
+            expired = [entry for entry in self._idle if entry.last_used < cutoff]
+            self._idle = [entry for entry in self._idle if entry.last_used >= cutoff]
+            if expired:
+                self._cond.notify_all()
+        for entry in expired:
+            self._quit(entry)
+        return len(expired)
+
+    def close_all(self):
+        ''' Quits every idle driver and stops handing out new ones. '''
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry)
+
+    def stats(self):
+        with self._cond:
+            return {'idle': len(self._idle), 'in_use': len(self._in_use), 'max_size': self.max_size}
+
+
+def create_pool(factory, **kwargs):
+    ''' Creates a DriverPool that is shut down when the interpreter exits. '''
+    pool = DriverPool(factory, **kwargs)
+    atexit.register(pool.close_all)
+    return pool
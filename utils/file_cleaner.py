@@ -0,0 +1,56 @@
+'''
+Removes the images of ads deleted from the database, driven by the `file_tombstones` table.
+
+Reconciliation tombstones ads in the same transaction that deletes them, so if a run dies before (or while)
+their files are removed, the next `clean_tombstoned_files` picks up where it left off. Removing an ad's files
+is idempotent (`image_store.remove_ad_files`), so re-running a half-done batch is harmless.
+'''
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from utils.database_utils import create_file_tombstones_table, get_file_tombstones, clear_file_tombstones
+from utils.image_store import remove_ad_files
+
+CLEANUP_WORKERS = 8 # Mostly waiting on unlink/rmdir, so threads overlap well
+CLEANUP_BATCH = 200 # Tombstones read and cleared per DB round trip
+
+
+def _remove(ad_id):
+    try:
+        return ad_id, remove_ad_files(ad_id), None
+    except Exception as e:
+        return ad_id, 0, str(e)
+
+def clean_tombstoned_files(workers = CLEANUP_WORKERS, batch_size = CLEANUP_BATCH):
+    '''
+    Deletes the thumbnail, gallery and unshared blobs of every tombstoned ad, `batch_size` ads at a time.
+    Ads whose cleanup fails keep their tombstone (with the error) and are retried on the next run.
+    Returns: (ads cleaned, blobs freed, ads failed)
+    '''
+    create_file_tombstones_table()
+    started = datetime.now()
+    start = time.perf_counter()
+    cleaned = freed = failed = 0
+
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        while True:
+            batch = get_file_tombstones(batch_size, started)
+            if not batch:
+                break
+            done, errors = [], {}
+            for ad_id, blobs, error in executor.map(_remove, batch):
+                if error:
+                    errors[ad_id] = error
+                    print(f"⚠️ Could not delete images for {ad_id}: {error}")
+                else:
+                    done.append(ad_id)
+                    freed += blobs
+            clear_file_tombstones(done, errors)
+            cleaned += len(done)
+            failed += len(errors)
+
+    if cleaned or failed:
+        print(f"🗑️ Cleaned files of {cleaned} removed ads in {time.perf_counter() - start:.2f}s, freed {freed} stored image(s)"
+              + (f", {failed} failed" if failed else ""))
+    return cleaned, freed, failed
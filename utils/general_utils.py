@@ -1,8 +1,32 @@
-import re
+import re, threading, time
 from datetime import datetime
 
 def extract_post_date(ad_url):
     match = re.search(r'/car-details/(\d{8})', ad_url)
     if match:
         return datetime.strptime(match.group(1), '%Y%m%d').date()
-    return None                              
\ No newline at end of file
+    return None
+
+class TokenBucket:
+    '''
+    Thread-safe rate limiter: allows `rate` calls per second on average, with up to `capacity` in a burst.
+    `acquire()` blocks until a call is allowed.
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,180 @@
+'''
+Content-addressed store for downloaded images.
+
+Every image is written once to `images/_blobs/<k[:2]>/<key>.jpg`, keyed by the AutoTrader media hash
+(plus width) or, failing that, the SHA-256 of its bytes. The files the rest of the app reads
+(`thumbnails/<ad_id>.jpg`, `images/<ad_id>/NN.jpg`) are hard links to those blobs, so a relisted car
+or a dealer's stock photo is downloaded and stored once. The link count is the blob's refcount:
+when an ad is removed its links are deleted and any blob left with a single link is garbage-collected.
+The scraper and the server share the store, so the collector moves a blob out of the way before re-checking its
+link count (nothing can link to it from then on), and a link to a blob that was collected fails so the caller
+downloads it again.
+Per-ad manifests record which blob each file points at: `images/_manifests/<ad_id>.thumbnail.json` (written by the
+scraper) and `<ad_id>.images.json` (written by the server's download jobs) are separate files, so neither process
+can overwrite the other's entry.
+'''
+import hashlib, json, os, re, shutil, tempfile, threading
+from pathlib import Path
+
+from utils.image_variants import VARIANT_DIR, source_digest
+
+IMAGES_DIR = Path('images')
+THUMBNAIL_DIR = Path('thumbnails')
+BLOB_DIR = IMAGES_DIR / '_blobs'
+MANIFEST_DIR = IMAGES_DIR / '_manifests'
+
+MANIFEST_PARTS = ('thumbnail', 'images')
+
+_MEDIA_PATTERN = re.compile(r"/w(\d+)/([a-f0-9]+)\.jpg")
+
+
+def media_key(url):
+    ''' Stable key for an AutoTrader media URL ('<hash>-w<width>'), or None if the URL isn't recognised. '''
+    match = _MEDIA_PATTERN.search(url or "")
+    if not match:
+        return None
+    return f"{match.group(2)}-w{match.group(1)}"
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+def blob_path(key):
+    return BLOB_DIR / key[:2] / f"{key}.jpg"
+
+def has_blob(key):
+    return key is not None and blob_path(key).exists()
+
+def put_blob(key, data):
+    ''' Writes `data` as blob `key` (no-op if it already exists). '''
+    path = blob_path(key)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+def link_blob(key, dest):
+    '''
+    Points `dest` at blob `key` with a hard link (falls back to a copy where links aren't supported).
+    Returns: `dest`, or None if the blob has been garbage-collected since it was looked up.
+    '''
+    dest = Path(dest)
+    dest.parent.mkdir(parents = True, exist_ok = True)
+    tmp_dest = dest.with_suffix(f".{threading.get_ident()}.tmp")
+    try:
+        os.link(blob_path(key), tmp_dest)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        try:
+            shutil.copyfile(blob_path(key), tmp_dest)
+        except FileNotFoundError:
+            return None
+    os.replace(tmp_dest, dest)
+    return dest
+
+def store(data, dest, key = None):
+    ''' Saves downloaded bytes into the store and links them at `dest`. Returns the key used. '''
+    key = key or content_key(data)
+    put_blob(key, data)
+    while link_blob(key, dest) is None:
+        # Collected between the write and the link: write it again
+        put_blob(key, data)
+    return key
+
+def _manifest_path(ad_id, part = None):
+    ''' One file per part; no part is the single-file manifest older versions wrote. '''
+    return MANIFEST_DIR / (f"{ad_id}.{part}.json" if part else f"{ad_id}.json")
+
+def _read_json(path):
+    try:
+        with open(path, encoding = 'utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def read_manifest(ad_id):
+    manifest = {'thumbnail': None, 'images': {}}
+    manifest.update(_read_json(_manifest_path(ad_id)) or {})
+    for part in MANIFEST_PARTS:
+        value = _read_json(_manifest_path(ad_id, part))
+        if value is not None:
+            manifest[part] = value
+    return manifest
+
+def _write_manifest_part(ad_id, part, value):
+    # A unique temp file per writer, so the scraper and server can't replace each other's half-written file
+    MANIFEST_DIR.mkdir(parents = True, exist_ok = True)
+    with tempfile.NamedTemporaryFile('w', encoding = 'utf-8', dir = MANIFEST_DIR, suffix = '.tmp', delete = False) as f:
+        json.dump(value, f)
+    os.replace(f.name, _manifest_path(ad_id, part))
+
+def update_manifest(ad_id, thumbnail = None, images = None):
+    '''
+    Records the blob behind an ad's thumbnail and/or gallery files (`images`: {filename: key}).
+    Each part is replaced whole in its own file, so there's no read-modify-write to race on.
+    '''
+    if thumbnail is not None:
+        _write_manifest_part(ad_id, 'thumbnail', thumbnail)
+    if images is not None:
+        _write_manifest_part(ad_id, 'images', images)
+
+def collect_blobs(keys):
+    ''' Deletes blobs among `keys` that no longer have any links outside the store. Returns count freed. '''
+    freed = 0
+    for key in set(k for k in keys if k):
+        path = blob_path(key)
+        try:
+            if path.stat().st_nlink > 1:
+                continue
+            # Another process may link it between the check and the delete: move it off its path first,
+            # so no new link can be made, and only delete it if it's still unlinked
+            doomed = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.gc")
+            os.replace(path, doomed)
+        except FileNotFoundError:
+            continue
+        if doomed.stat().st_nlink > 1:
+            try:
+                os.link(doomed, path)
+            except FileExistsError:
+                pass # Stored again meanwhile; that copy serves new links
+            doomed.unlink()
+            continue
+        # Resized variants are keyed by the blob's inode, so they go with it
+        for variant in VARIANT_DIR.glob(f"{source_digest(doomed)}-*"):
+            variant.unlink(missing_ok = True)
+        doomed.unlink()
+        freed += 1
+    return freed
+
+def collect_all_blobs():
+    ''' Full sweep: deletes every unreferenced blob (e.g. after an interrupted cleanup). '''
+    if not BLOB_DIR.exists():
+        return 0
+    return collect_blobs(path.stem for path in BLOB_DIR.glob('*/*.jpg'))
+
+def remove_ad_files(ad_id):
+    '''
+    Deletes an ad's thumbnail, gallery folder and manifest, then frees blobs nothing else links to.
+    Safe to call repeatedly. Returns: number of blobs freed
+    '''
+    manifest = read_manifest(ad_id)
+    keys = [manifest.get('thumbnail')] + list(manifest.get('images', {}).values())
+
+    (THUMBNAIL_DIR / f"{ad_id}.jpg").unlink(missing_ok = True)
+
+    image_folder = IMAGES_DIR / ad_id
+    if image_folder.exists():
+        for file in image_folder.glob("*"):
+            file.unlink(missing_ok = True)
+        try:
+            image_folder.rmdir()
+        except FileNotFoundError:
+            pass
+
+    for part in (None,) + MANIFEST_PARTS:
+        _manifest_path(ad_id, part).unlink(missing_ok = True)
+    return collect_blobs(keys)
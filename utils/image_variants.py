@@ -0,0 +1,96 @@
+import hashlib, os, threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+# Resized copies of thumbnails and gallery images, generated at download time or on first request
+VARIANT_DIR = Path('cache') / 'variants'
+VARIANT_WIDTHS = (320, 640, 1280, 1920) # 1920: high-density gallery; a WebP copy of originals narrower than that
+VARIANT_QUALITY = 80
+VARIANT_WORKERS = 4
+PREGENERATE_FORMATS = ('webp',) # JPEG variants are only made when a client without WebP asks
+LOCK_STRIPES = 64 # Render locks, shared by hash of the variant path so the set never grows
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+
+_executor = ThreadPoolExecutor(max_workers = VARIANT_WORKERS, thread_name_prefix = 'variants')
+_key_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+
+def source_digest(src_path):
+    '''
+    Identifies one version of a source file; changes if the file is replaced.
+    Keyed by inode so hard links into the image store share their variants.
+    '''
+    stat = os.stat(src_path)
+    raw = f"{stat.st_dev}|{stat.st_ino}|{stat.st_mtime_ns}|{stat.st_size}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def pick_width(requested):
+    ''' Smallest variant width that covers `requested`; None means the original should be served. '''
+    if not requested:
+        return None
+    for width in VARIANT_WIDTHS:
+        if width >= requested:
+            return width
+    return None
+
+def variant_path(src_path, width, fmt):
+    return VARIANT_DIR / f"{source_digest(src_path)}-w{width}.{fmt}"
+
+def _lock_for(key):
+    # Two variants sharing a stripe just render one after the other
+    return _key_locks[hash(key) % LOCK_STRIPES]
+
+def get_variant(src_path, width, fmt = 'webp'):
+    '''
+    Returns the path of `src_path` resized to `width` in `fmt`, generating it if needed.
+    Returns `src_path` itself when the original is already no wider than `width`.
+    '''
+    out_path = variant_path(src_path, width, fmt)
+    if out_path.exists():
+        return out_path
+
+    # Only one thread renders a given variant; the rest wait and reuse it
+    with _lock_for(str(out_path)):
+        if out_path.exists():
+            return out_path
+
+        with Image.open(src_path) as img:
+            if img.width <= width and fmt == 'jpeg':
+                return Path(src_path)
+            img = img.convert('RGB')
+            if img.width > width:
+                img.thumbnail((width, width * 10), Image.LANCZOS)
+
+            VARIANT_DIR.mkdir(parents = True, exist_ok = True)
+            tmp_path = out_path.with_suffix(out_path.suffix + '.tmp')
+            pil_format, _ = FORMATS[fmt]
+            img.save(tmp_path, pil_format, quality = VARIANT_QUALITY)
+            os.replace(tmp_path, out_path) # Atomic, so readers never see a half-written file
+    return out_path
+
+def _pregenerate(src_path):
+    try:
+        with Image.open(src_path) as img:
+            source_width = img.width
+        for width in VARIANT_WIDTHS:
+            if width >= source_width:
+                break
+            for fmt in PREGENERATE_FORMATS:
+                get_variant(src_path, width, fmt)
+    except Exception as e:
+        print(f"⚠️ Could not generate variants for {src_path}: {e}")
+
+def schedule_variants(src_path):
+    ''' Queues the smaller-than-original variants of a freshly downloaded image on the background pool. '''
+    return _executor.submit(_pregenerate, Path(src_path))
+
+def negotiate_format(accept_header):
+    return 'webp' if accept_header and 'image/webp' in accept_header else 'jpeg'
+
+def mimetype_for(path):
+    return FORMATS['webp'][1] if Path(path).suffix == '.webp' else FORMATS['jpeg'][1]
@@ -0,0 +1,310 @@
+'''
+Bounded background job queue (picture downloads and similar slow work started from the server).
+
+- A fixed pool of worker threads takes jobs in priority order (lower number first, then oldest first),
+  so memory and CPU stay flat however many requests arrive.
+- Jobs are coalesced by (kind, key): asking again for an ad that's already queued or running returns
+  the existing job (bumping its priority if the new request is more urgent).
+- Cancellation is cooperative: a queued job is dropped; a running job's next progress update raises JobCancelled.
+- Every status change is written to the `jobs` table (in the order the changes happened), and queued/interrupted
+  jobs are requeued on start.
+- Each job keeps a short event log (state, status, progress, image) that listeners can block on with `wait_events`,
+  which is what the server's progress stream is built on. Only the last MAX_JOB_EVENTS are kept; a listener that
+  falls further behind gets a `snapshot` of the job instead of the events it missed.
+'''
+import heapq, itertools, json, threading, time, uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from utils.database_utils import create_jobs_table, save_job, get_unfinished_jobs, prune_jobs
+
+JOB_WORKERS = 2 # Matches the driver pool: more workers would only queue for a browser
+MAX_QUEUED_JOBS = 1000
+FINISHED_JOBS_KEPT = 200 # Finished jobs remembered in memory for progress lookups
+FINISHED_JOBS_RETENTION = timedelta(days = 7) # Finished rows kept in the jobs table
+MAX_JOB_EVENTS = 256 # Events kept per job for progress streams (a download emits ~2 per image)
+
+PRIORITY_INTERACTIVE = 0 # A user waiting on the result
+PRIORITY_BACKFILL = 10
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind, key, payload, priority, job_id = None, created_at = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.priority = priority
+        self.state = QUEUED
+        self.error = None
+        self.created_at = created_at or datetime.now().isoformat()
+        self.progress = {'status': 'Queued', 'current': 0, 'total': 0}
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+        self.events = deque(maxlen = MAX_JOB_EVENTS) # [(event, data)], the most recent only
+        self._events_dropped = 0 # Events that fell off the front, so cursors stay absolute
+        self._version = 0 # Bumped (under the queue's lock) for each row to persist
+        self._persisted = 0
+        self._persist_lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        return self.state in FINISHED_STATES
+
+    def emit(self, event, data):
+        with self._changed:
+            if len(self.events) == self.events.maxlen:
+                self._events_dropped += 1
+            self.events.append((event, data))
+            self._changed.notify_all()
+
+    def event_cursor(self):
+        ''' Cursor just past the latest event, for a listener that only wants what happens next. '''
+        with self._changed:
+            return self._events_dropped + len(self.events)
+
+    def wait_events(self, cursor, timeout):
+        '''
+        Blocks until there are events after `cursor` (or `timeout` seconds pass).
+        If some of those have already been dropped, the list starts with a ('snapshot', job dict) to resync from.
+        Returns: (new events, next cursor)
+        '''
+        with self._changed:
+            end = lambda: self._events_dropped + len(self.events)
+            self._changed.wait_for(lambda: end() > cursor, timeout)
+            start = cursor - self._events_dropped
+            if start < 0:
+                return [('snapshot', self.to_dict())] + list(self.events), end()
+            return list(itertools.islice(self.events, start, None)), end()
+
+    def set_state(self, state, error = None):
+        self.state = state
+        self.error = error
+        self.emit('state', {'state': state, 'error': error})
+
+    def update(self, current = None, total = None, image = None):
+        '''
+        Progress callback in the `download_pictures` style: a string sets the status text,
+        numbers set the image count, and `image` names the file that just finished.
+        Raises JobCancelled once the job has been cancelled.
+        '''
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+        if isinstance(current, str):
+            self.progress['status'] = current
+            self.emit('status', dict(self.progress))
+        elif current is not None and total is not None:
+            self.progress['current'] = current
+            self.progress['total'] = total
+            if 'Downloading' in self.progress['status']:
+                self.progress['status'] = f'Downloading {current}/{total}...'
+            self.emit('progress', dict(self.progress))
+            if image:
+                self.emit('image', {'file': image, 'current': current, 'total': total})
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'key': self.key,
+            'priority': self.priority,
+            'state': self.state,
+            'error': self.error,
+            'created_at': self.created_at,
+            **self.progress,
+        }
+
+
+class JobQueue:
+    def __init__(self, workers = JOB_WORKERS, max_queued = MAX_QUEUED_JOBS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self._handlers = {}
+        self._heap = []
+        self._order = itertools.count()
+        self._active = {} # (kind, key) -> Job, while queued or running
+        self._jobs = {} # job_id -> Job, while queued or running
+        self._finished = OrderedDict() # (kind, key) -> Job, most recent last
+        self._queued = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started = False
+
+    def register(self, kind, handler):
+        ''' `handler(job)` does the work; it should pass `job.update` as its progress callback. '''
+        self._handlers[kind] = handler
+
+    def start(self):
+        ''' Starts the workers and requeues jobs left queued or running by the last process. Safe to call twice. '''
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+
+        create_jobs_table()
+        prune_jobs(datetime.now() - FINISHED_JOBS_RETENTION)
+        restored = 0
+        for row in get_unfinished_jobs():
+            if row['kind'] not in self._handlers:
+                continue
+            job = Job(row['kind'], row['key'], json.loads(row['payload']), row['priority'], row['job_id'], row['created_at'])
+            with self._cond:
+                self._enqueue(job)
+            restored += 1
+        if restored:
+            print(f"🔁 Requeued {restored} unfinished job(s)")
+
+        for i in range(self.workers):
+            thread = threading.Thread(target = self._work, name = f'job-worker-{i}', daemon = True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, job):
+        self._active[(job.kind, job.key)] = job
+        self._jobs[job.id] = job
+        self._queued += 1
+        heapq.heappush(self._heap, (job.priority, next(self._order), job))
+        self._cond.notify()
+
+    def submit(self, kind, key, payload = None, priority = PRIORITY_INTERACTIVE):
+        '''
+        Queues a job, or returns the queued/running job for the same (kind, key).
+        Returns: (job, created). Raises JobQueueFull when `max_queued` jobs are already waiting.
+        '''
+        self.start()
+        with self._cond:
+            job = self._active.get((kind, key))
+            created = job is None
+            if job is None:
+                if self._queued >= self.max_queued:
+                    raise JobQueueFull(f"{self._queued} jobs already queued")
+                job = Job(kind, key, payload or {}, priority)
+                self._enqueue(job)
+            elif job.state == QUEUED and priority < job.priority:
+                # More urgent request for a waiting job: re-push it; the old heap entry is skipped
+                job.priority = priority
+                heapq.heappush(self._heap, (priority, next(self._order), job))
+                self._cond.notify()
+            else:
+                return job, False
+            row = self._row(job)
+        self._persist(job, row)
+        return job, created
+
+    def cancel(self, job_id):
+        ''' Returns: the job, or None if it isn't queued or running. '''
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job._cancel.set()
+            row = None
+            if job.state == QUEUED:
+                # Dropped here; its heap entry is skipped when popped
+                self._finish(job, CANCELLED)
+                self._queued -= 1
+                row = self._row(job)
+        if row:
+            self._persist(job, row)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job:
+                return job
+            return next((j for j in self._finished.values() if j.id == job_id), None)
+
+    def find(self, kind, key):
+        ''' The active job for (kind, key), else the most recent finished one, else None. '''
+        with self._cond:
+            return self._active.get((kind, key)) or self._finished.get((kind, key))
+
+    def active_jobs(self):
+        with self._cond:
+            return sorted(self._jobs.values(), key = lambda j: (j.priority, j.created_at))
+
+    def _finish(self, job, state, error = None):
+        ''' Moves `job` out of the active maps. Call with the lock held. '''
+        job.set_state(state, error)
+        self._active.pop((job.kind, job.key), None)
+        self._jobs.pop(job.id, None)
+        self._finished.pop((job.kind, job.key), None)
+        self._finished[(job.kind, job.key)] = job
+        while len(self._finished) > FINISHED_JOBS_KEPT:
+            self._finished.popitem(last = False)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                while not self._heap:
+                    self._cond.wait()
+                priority, _, job = heapq.heappop(self._heap)
+                # Skip cancelled jobs and stale entries left behind by a priority bump
+                if job.state != QUEUED or priority != job.priority:
+                    continue
+                job.progress['status'] = 'Starting...'
+                job.set_state(RUNNING)
+                self._queued -= 1
+                return job, self._row(job)
+
+    def _work(self):
+        while True:
+            job, row = self._next_job()
+            self._persist(job, row)
+            start = time.perf_counter()
+            state, error = DONE, None
+            try:
+                self._handlers[job.kind](job)
+                if job.cancelled:
+                    state = CANCELLED
+            except JobCancelled:
+                state = CANCELLED
+            except Exception as e:
+                state, error = FAILED, str(e)
+                print(f"❌ Job {job.kind} for {job.key} failed: {e}")
+            with self._cond:
+                self._finish(job, state, error)
+                row = self._row(job)
+            self._persist(job, row)
+            print(f"🧰 Job {job.kind} for {job.key}: {state} in {time.perf_counter() - start:.1f}s")
+
+    def _row(self, job):
+        ''' The job's row as of now, numbered so _persist never overwrites a newer one. Call with the lock held. '''
+        job._version += 1
+        return job._version, (job.id, job.kind, job.key, json.dumps(job.payload), job.priority, job.state, job.error, job.created_at)
+
+    def _persist(self, job, row):
+        '''
+        Saves a row taken by _row. Rows are taken under the lock but saved outside it, so a worker can save
+        'running' before the submitting thread saves 'queued'; the older row is then skipped.
+        '''
+        version, values = row
+        with job._persist_lock:
+            if version <= job._persisted:
+                return
+            try:
+                save_job(*values)
+                job._persisted = version
+            except Exception as e:
+                # The queue keeps working from memory; only restart recovery is affected
+                print(f"⚠️ Could not save job {job.id}: {e}")
+
+    def stats(self):
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job.state == RUNNING)
+            return {'queued': self._queued, 'running': running, 'finished': len(self._finished), 'workers': self.workers}
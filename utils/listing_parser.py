@@ -0,0 +1,135 @@
+import re, hashlib
+from datetime import datetime
+from lxml import etree, html as lxml_html
+
+from utils.general_utils import extract_post_date
+
+AUTOTRADER_BASE_URL = "https://www.autotrader.co.uk"
+
+# Compiled once; each mirrors a CSS selector used by the Selenium (per-element) path
+_CARDS = etree.XPath("//div[@data-testid='advertCard']")
+_TITLE_LINK = etree.XPath(".//a[@data-testid='search-listing-title']")
+_TITLE = etree.XPath(".//*[@data-testid='search-listing-title']")
+_THUMBNAIL = etree.XPath(".//img[contains(concat(' ', normalize-space(@class), ' '), ' main-image ')]")
+_PRICE = etree.XPath(".//div[contains(@class, 'at__sc-u4ap7c-12')]//span")
+_SUBTITLE = etree.XPath(".//*[@data-testid='search-listing-subtitle']")
+_MILEAGE = etree.XPath(".//*[@data-testid='mileage']")
+_REG_YEAR = etree.XPath(".//*[@data-testid='registered_year']")
+_LOCATION = etree.XPath(".//*[@data-testid='search-listing-location']")
+
+_LOCATION_PATTERN = re.compile(r"(.+?)\s*\((\d+)\s*miles\)")
+
+
+def _first(xpath, node):
+    found = xpath(node)
+    return found[0] if found else None
+
+def _text(xpath, node):
+    elem = _first(xpath, node)
+    if elem is None:
+        return ""
+    return " ".join(elem.text_content().split())
+
+def parse_listings(page_source):
+    '''
+    Parses every advert card out of a search results page in a single pass.
+    Pure function: works on `driver.page_source` or on saved HTML.
+    Returns: list of raw field dicts (href, thumbnail_url, title, subtitle, price, mileage, reg_year, location)
+    '''
+    if not page_source:
+        return []
+    tree = lxml_html.fromstring(page_source)
+
+    listings = []
+    for card in _CARDS(tree):
+        link = _first(_TITLE_LINK, card)
+        thumb = _first(_THUMBNAIL, card)
+        thumbnail_url = None
+        if thumb is not None:
+            thumbnail_url = thumb.get("src") or thumb.get("data-src")
+
+        listings.append({
+            'href': link.get("href") if link is not None else None,
+            'thumbnail_url': thumbnail_url,
+            'title': _text(_TITLE, card),
+            'subtitle': _text(_SUBTITLE, card),
+            'price': _text(_PRICE, card),
+            'mileage': _text(_MILEAGE, card),
+            'reg_year': _text(_REG_YEAR, card),
+            'location': _text(_LOCATION, card),
+        })
+    return listings
+
+def make_ad_url(href):
+    ''' Strips the query string and makes the ad link absolute. '''
+    if not href:
+        return ""
+    base_href = href.split("?")[0]  # Remove everything after '?'
+    return AUTOTRADER_BASE_URL + base_href if base_href.startswith("/") else base_href
+
+def make_ad_id(ad_url):
+    ''' Stable 10 character ad ID derived from the ad URL. '''
+    return hashlib.md5(ad_url.encode('utf-8')).hexdigest()[:10] if ad_url else ""
+
+def build_ad_record(fields):
+    '''
+    Converts raw listing fields (from `parse_listings` or the Selenium path) into the row stored in `ads`.
+    '''
+    ad_url = make_ad_url(fields.get('href'))
+    ad_id = make_ad_id(ad_url)
+
+    try:
+        post_date = extract_post_date(ad_url)
+    except:
+        post_date = ""
+
+    title = fields.get('title') or ""
+    subtitle = fields.get('subtitle') or ""
+    price = (fields.get('price') or "").strip()
+    mileage = fields.get('mileage') or ""
+    reg_year = fields.get('reg_year') or ""
+    location = fields.get('location') or ""
+
+    # Convert mileage to numeric
+    mileage_numeric = ""
+    if mileage:
+        try:
+            mileage_numeric = int(mileage.lower().replace("miles", "").replace(",", "").strip())
+        except:
+            pass
+
+    loc_match = _LOCATION_PATTERN.match(location)
+    if loc_match:
+        city, dist = loc_match.groups()
+        try:
+            dist = int(dist)
+        except ValueError:
+            dist = None
+    else:
+        city, dist = None, None
+
+    # Remove subtitle and price from title if present
+    cleaned_title = title
+    if subtitle and subtitle in cleaned_title:
+        cleaned_title = cleaned_title.replace(subtitle, "")
+    if price and price in cleaned_title:
+        cleaned_title = cleaned_title.replace(price, "")
+    cleaned_title = cleaned_title.strip()
+    # Remove trailing newline and comma if present
+    cleaned_title = re.sub(r'[\n\r]+,?$', '', cleaned_title).strip()
+
+    return {
+        'Ad URL': ad_url,
+        'Ad ID': ad_id,
+        'Title': cleaned_title,
+        'Subtitle': subtitle,
+        'Price': price,
+        'Mileage': mileage_numeric,
+        'Registered Year': reg_year,
+        'Distance (miles)': dist,
+        'Location': city,
+        'Ad post date': post_date,
+        'Favourited': 0,
+        'Excluded': 0,
+        'Scraped at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
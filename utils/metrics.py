@@ -0,0 +1,288 @@
+'''
+In-process metrics in the Prometheus text format, served by the Flask server at /api/metrics.
+
+- Counters, gauges and histograms with labels, kept in one registry. Gauges can read their value from
+  a callback when scraped (e.g. the job queue's length).
+- `instrument_app` times every request per route, tracks requests in flight and prints a slow-request log line
+  (with the time spent in SQLite) above SLOW_REQUEST_SECONDS.
+- `instrument_functions` wraps a module's public functions in timers (used for database_utils).
+- `instrument_session` times every request a `requests` session sends to an upstream service.
+
+No client library: the exposition format is a few lines of text, and this module has to be importable
+from the scraper and pool worker processes without extra dependencies.
+'''
+import bisect, functools, os, threading, time
+
+SLOW_REQUEST_SECONDS = float(os.getenv('AUTOTRADER_SLOW_REQUEST_SECONDS', '1.0')) # 0 turns the log off
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+_local = threading.local()
+
+
+def _label_text(names, values):
+    if not names:
+        return ""
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, labels = (), callback = None):
+        '''
+        `callback()`: called on every scrape; returns a number, or {label value tuple: number} for a labelled gauge.
+        '''
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback:
+            try:
+                value = self.callback()
+            except Exception as e:
+                print(f"⚠️ Metric {self.name} unavailable: {e}")
+                return self.header()
+            items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels = (), buckets = REQUEST_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        ''' Context manager observing the time spent inside it. '''
+        return _Timer(self, labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = self.header()
+        names = self.labels + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(names, key + (_format_value(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {total!r}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        ''' Returns: the metric already registered under the same name, else `metric` '''
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def counter(name, help_text, labels = ()):
+    return REGISTRY.register(Counter(name, help_text, labels))
+
+def gauge(name, help_text, labels = (), callback = None):
+    return REGISTRY.register(Gauge(name, help_text, labels, callback))
+
+def histogram(name, help_text, labels = (), buckets = REQUEST_BUCKETS):
+    return REGISTRY.register(Histogram(name, help_text, labels, buckets))
+
+def render():
+    return REGISTRY.render()
+
+
+# SQLite calls
+DB_CALL_SECONDS = histogram('autotrader_db_call_seconds', "Time in database_utils calls (including waiting for the writer)",
+                            ('function',), DB_BUCKETS)
+DB_CALL_ERRORS = counter('autotrader_db_call_errors_total', "database_utils calls that raised", ('function',))
+
+def instrument_functions(namespace, exclude = (), histogram = DB_CALL_SECONDS, errors = DB_CALL_ERRORS):
+    '''
+    Replaces each public function defined in the module whose globals() is `namespace` with a timed wrapper,
+    so importers and the module's own calls are measured. Call at the bottom of the module; `exclude` names
+    pure helpers that don't touch the database.
+    Only the outermost call on a thread counts towards the current request's database time.
+    '''
+    module = namespace['__name__']
+    for name, fn in list(namespace.items()):
+        if name.startswith('_') or name in exclude or not callable(fn) or getattr(fn, '__module__', None) != module or isinstance(fn, type):
+            continue
+        namespace[name] = _timed(fn, histogram, errors)
+
+def _timed(fn, histogram, errors):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        depth = getattr(_local, 'db_depth', 0)
+        _local.db_depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            errors.inc(function = name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            _local.db_depth = depth
+            histogram.observe(elapsed, function = name)
+            if depth == 0:
+                _local.db_seconds = getattr(_local, 'db_seconds', 0.0) + elapsed
+    return wrapper
+
+
+# Upstream HTTP
+UPSTREAM_SECONDS = histogram('autotrader_upstream_request_seconds', "Requests to upstream services (MOT, CAZ, AutoTrader)",
+                             ('service', 'outcome'), UPSTREAM_BUCKETS)
+
+def instrument_session(session, service):
+    ''' Times every request `session` sends, labelled with `service` and the status class (or 'error'). '''
+    send = session.send
+
+    @functools.wraps(send)
+    def timed_send(request, **kwargs):
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = send(request, **kwargs)
+            outcome = f"{response.status_code // 100}xx"
+            return response
+        finally:
+            UPSTREAM_SECONDS.observe(time.perf_counter() - start, service = service, outcome = outcome)
+    session.send = timed_send
+    return session
+
+
+# Flask requests
+REQUEST_SECONDS = histogram('autotrader_http_request_seconds', "Server response time (to the first byte for streams)",
+                            ('method', 'route', 'status'))
+REQUEST_DB_SECONDS = histogram('autotrader_http_request_db_seconds', "Time each request spent in database_utils calls",
+                               ('method', 'route'), DB_BUCKETS)
+REQUESTS_IN_FLIGHT = gauge('autotrader_http_requests_in_flight', "Requests being handled")
+
+def instrument_app(app, slow_seconds = SLOW_REQUEST_SECONDS):
+    ''' Times every request to `app` by route and logs the ones slower than `slow_seconds` (0: never). '''
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+        _local.db_seconds = 0.0
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.after_request
+    def record_timing(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        REQUESTS_IN_FLIGHT.dec()
+        elapsed = time.perf_counter() - start
+        db_seconds = getattr(_local, 'db_seconds', 0.0)
+        # The URL rule, not the path, so per-ad URLs share one series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, method = request.method, route = route, status = response.status_code)
+        REQUEST_DB_SECONDS.observe(db_seconds, method = request.method, route = route)
+        if slow_seconds and elapsed >= slow_seconds:
+            print(f"🐢 Slow request: {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                  f"in {elapsed:.2f}s (db {db_seconds:.2f}s)")
+        return response
+
+    @app.teardown_request
+    def unfinished(error):
+        # after_request doesn't run when a view raises
+        if g.pop('metrics_start', None) is not None:
+            REQUESTS_IN_FLIGHT.dec()
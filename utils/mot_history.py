@@ -1,7 +1,15 @@
 import os
 import requests
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.general_utils import TokenBucket
+from utils.metrics import instrument_session
+from utils.database_utils import get_mot_cache, save_mot_cache, save_mot_histories, get_bound_mot_registrations
 
 load_dotenv()
 
@@ -11,57 +19,151 @@ MOT_API_KEY = os.getenv('MOT_API_KEY')
 TOKEN_URL = os.getenv('TOKEN_URL')
 SCOPE_URL = os.getenv('SCOPE_URL')
 
-BASE_URL = 'https://history.mot.api.gov.uk/v1/trade/vehicles/registration/'
+BASE_URL = os.getenv('MOT_BASE_URL', 'https://history.mot.api.gov.uk/v1/trade/vehicles/registration/')
+
+# DVSA quota for the MOT History API is 15 requests/second with bursts of up to 10
+MOT_RATE_LIMIT = 14 # Just under the quota, so network jitter bunching requests doesn't trip 429s
+MOT_BURST = 8
+MOT_BULK_WORKERS = 8
+MOT_TIMEOUT = 15
+MOT_CACHE_TTL = 24 * 60 * 60 # Seconds a fetched history is reused before asking the API again
+MOT_NOT_FOUND_TTL = 60 * 60 # Shorter for 'no MOT found', in case the registration was mistyped or is new
+
+# Pooled session; 429s and 5xxs are retried with backoff (honouring Retry-After)
+_session = requests.Session()
+_retry = Retry(total = 3, backoff_factor = 0.5, status_forcelist = (429, 500, 502, 503, 504), allowed_methods = None)
+_adapter = HTTPAdapter(pool_connections = 2, pool_maxsize = MOT_BULK_WORKERS, max_retries = _retry)
+_session.mount('https://', _adapter)
+_session.mount('http://', _adapter)
+instrument_session(_session, 'mot')
+
+_rate_limiter = TokenBucket(MOT_RATE_LIMIT, MOT_BURST)
 
 # Cache the token (they expire every 60 minutes)
 _token_cache = {
     'access_token': None,
     'expires_at': 0
 }
+_token_lock = threading.Lock()
 
-def get_access_token():
-    ''' Fetches and caches the access token if expires. '''
-    now = time.time()
-    if _token_cache['access_token'] and _token_cache['expires_at'] > now + 60:
-        return _token_cache['access_token']
-    
-    print('🔄 Fetching new MOT API token...')
-    data = {
-        'grant_type': 'client_credentials',
-        'client_id': MOT_CLIENT_ID,
-        'client_secret': MOT_CLIENT_SECRET,
-        'scope': SCOPE_URL
-    }
-    
-    try:
-        response = requests.post(TOKEN_URL, data = data)
-        response.raise_for_status()
-        token_data = response.json()
-        _token_cache['access_token'] = token_data['access_token']
-        _token_cache['expires_at'] = now + int(token_data.get('expires_in', 3600)) 
+def _cached_token():
+    if _token_cache['access_token'] and _token_cache['expires_at'] > time.time() + 60:
         return _token_cache['access_token']
-    except Exception as e:
-        print('❌ Error retrieving access token:', e)
-        return None
+    return None
 
-def get_mot_history(reg):
+def get_access_token(rejected_token = None):
+    '''
+    Fetches and caches the access token if expires (or if the API rejected `rejected_token`).
+    Only one thread refreshes at a time; the rest wait for it and reuse the new token.
+    '''
+    token = _cached_token()
+    if token and token != rejected_token:
+        return token
+
+    with _token_lock:
+        # Another thread may have refreshed while we waited for the lock
+        token = _cached_token()
+        if token and token != rejected_token:
+            return token
+
+        print('🔄 Fetching new MOT API token...')
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': MOT_CLIENT_ID,
+            'client_secret': MOT_CLIENT_SECRET,
+            'scope': SCOPE_URL
+        }
+
+        try:
+            response = _session.post(TOKEN_URL, data = data, timeout = MOT_TIMEOUT)
+            response.raise_for_status()
+            token_data = response.json()
+            _token_cache['access_token'] = token_data['access_token']
+            _token_cache['expires_at'] = time.time() + int(token_data.get('expires_in', 3600))
+            return _token_cache['access_token']
+        except Exception as e:
+            print('❌ Error retrieving access token:', e)
+            return None
+
+def _fetch(reg):
+    '''
+    Returns: (status, result). status is the HTTP status, or 0 if the request never completed.
+    '''
     token = get_access_token()
-    
     if not token:
-        return {'error': 'Unable to authenticate'}
-    
-    headers = {
-        'Accept': 'application/json+v6',
-        'x-api-key': MOT_API_KEY,
-        'Authorization': f'Bearer {token}',       
-    }
-    
-    try:        
-        response = requests.get(f'{BASE_URL}{reg}', headers = headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {'error': f'API error {response.status_code}', 'details': response.text}
-    except Exception as e:
-        return {'error': str(e)}
-    
\ No newline at end of file
+        return 0, {'error': 'Unable to authenticate'}
+
+    for attempt in range(2):
+        headers = {
+            'Accept': 'application/json+v6',
+            'x-api-key': MOT_API_KEY,
+            'Authorization': f'Bearer {token}',
+        }
+        _rate_limiter.acquire()
+        try:
+            response = _session.get(f'{BASE_URL}{reg}', headers = headers, timeout = MOT_TIMEOUT)
+        except Exception as e:
+            return 0, {'error': str(e)}
+
+        if response.status_code == 401 and attempt == 0:
+            # Token revoked or expired early: refresh once and retry
+            token = get_access_token(rejected_token = token)
+            if not token:
+                return 0, {'error': 'Unable to authenticate'}
+            continue
+        break
+
+    if response.status_code == 200:
+        return 200, response.json()
+    return response.status_code, {'error': f'API error {response.status_code}', 'details': response.text}
+
+def normalise_reg(reg):
+    return reg.replace(" ", "").strip().upper()
+
+def get_mot_history(reg):
+    ''' Queries the API directly (no cache). '''
+    return _fetch(reg)[1]
+
+def get_mot_histories_bulk(regs, max_age = MOT_CACHE_TTL, workers = MOT_BULK_WORKERS):
+    '''
+    Looks up many registrations at once, reusing cached responses younger than `max_age` seconds
+    (0 always asks the API). Misses are fetched concurrently within the DVSA rate limit.
+    Returns: {registration: MOT history or {'error': ...}}
+    '''
+    regs = list(dict.fromkeys(normalise_reg(reg) for reg in regs if reg and reg.strip()))
+    results = {}
+
+    now = time.time()
+    for reg, (status, response, fetched_at) in (get_mot_cache(regs, max_age) if max_age else {}).items():
+        ttl = max_age if status == 200 else min(max_age, MOT_NOT_FOUND_TTL)
+        if now - fetched_at <= ttl:
+            results[reg] = response
+
+    misses = [reg for reg in regs if reg not in results]
+    if misses:
+        with ThreadPoolExecutor(max_workers = min(workers, len(misses))) as executor:
+            fetched = dict(zip(misses, executor.map(_fetch, misses)))
+        # Only definitive answers are cached; auth/network/quota failures are retried next time
+        save_mot_cache({reg: (status, result) for reg, (status, result) in fetched.items() if status in (200, 404)})
+        results.update((reg, result) for reg, (_, result) in fetched.items())
+
+    return results
+
+def get_mot_history_cached(reg, max_age = MOT_CACHE_TTL):
+    return get_mot_histories_bulk([reg], max_age)[normalise_reg(reg)]
+
+def refresh_bound_mot_histories(max_age = MOT_CACHE_TTL, workers = MOT_BULK_WORKERS):
+    '''
+    Re-fetches the MOT history of every registration bound to an ad and saves the results in one batch.
+    Returns: (number refreshed, number failed)
+    '''
+    bound = get_bound_mot_registrations()
+    start = time.perf_counter()
+    results = get_mot_histories_bulk([reg for reg, _ in bound], max_age, workers)
+
+    entries = [(reg, results[normalise_reg(reg)], ad_id) for reg, ad_id in bound if 'error' not in results[normalise_reg(reg)]]
+    save_mot_histories(entries)
+
+    failed = len(bound) - len(entries)
+    print(f"🔧 Refreshed {len(entries)} MOT histories ({failed} failed) in {time.perf_counter() - start:.1f}s")
+    return len(entries), failed
@@ -0,0 +1,151 @@
+'''
+Several saved searches (regions, price bands, ...) scraped concurrently, one process and browser per worker.
+
+Searches are defined in a JSON file, each with a unique name and either a full results URL or
+query parameters laid over AUTOTRADER_URL:
+
+    [
+        {"name": "caerphilly-under-5k", "url": "https://www.autotrader.co.uk/car-search?postcode=CF83%208TF&price-to=5000"},
+        {"name": "bristol-5k-8k", "params": {"postcode": "BS1 4DJ", "price-from": "5000", "price-to": "8000"}}
+    ]
+
+Workers only read listings and fetch thumbnails. The parent merges every search's new ads, de-duplicated by
+Ad ID, into one DB write, checks the already-saved ones for changes in one more, then records which searches
+listed each ad and removes stale ads per search.
+'''
+import json, re, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing.util import Finalize
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from utils.database_utils import get_ad_ids, save_to_sql, save_ad_changes, create_scrape_runs_table, create_ad_searches_table, save_ad_searches, save_scrape_run
+from utils.scrape_utils import (
+    AUTOTRADER_URL, DEFAULT_PARSER, DEFAULT_SOURCE, DEFAULT_MAX_SCROLLS, FULL_SWEEP_INTERVAL, KNOWN_RUN_TO_STOP, MAX_API_PAGES, TABLE_NAME,
+    choose_scrape_mode, collect_search, reconcile_search,
+)
+
+MULTI_SEARCH_WORKERS = 2 # Processes, each driving its own Chrome
+_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def load_searches(path):
+    '''
+    Reads a search definition file.
+    Returns: [{'name', 'url'}]. Raises ValueError on a malformed file.
+    '''
+    with open(path, encoding = 'utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path}: expected a non-empty list of searches")
+
+    searches, names = [], set()
+    for entry in entries:
+        name = entry.get('name', '')
+        if not _NAME_PATTERN.match(name):
+            raise ValueError(f"{path}: search names must be letters, digits, '-' or '_' (got {name!r})")
+        if name in names:
+            raise ValueError(f"{path}: duplicate search name {name!r}")
+        if name == 'default':
+            raise ValueError(f"{path}: 'default' is reserved for the single AUTOTRADER_URL search")
+        names.add(name)
+
+        if entry.get('url'):
+            url = entry['url']
+        elif entry.get('params'):
+            parts = urlparse(AUTOTRADER_URL)
+            query = dict(parse_qsl(parts.query))
+            query.update({k: str(v) for k, v in entry['params'].items()})
+            url = parts._replace(query = urlencode(query)).geturl()
+        else:
+            raise ValueError(f"{path}: search {name!r} needs a 'url' or 'params'")
+        searches.append({'name': name, 'url': url})
+    return searches
+
+def _init_worker():
+    # Pool workers exit without running atexit hooks, so quit this process's browsers explicitly
+    from utils.scrape_utils import DRIVER_POOL
+    Finalize(None, DRIVER_POOL.close_all, exitpriority = 10)
+
+def _scrape_one(search, mode, known_ad_ids, options):
+    ''' Runs in a worker process. Returns: summary dict with the search's new and already-saved records and live Ad IDs '''
+    start = time.perf_counter()
+    known_records = []
+    def keep_known(records):
+        known_records.extend(records)
+    try:
+        car_data, live_ad_ids, stats, outcome = collect_search(
+            search['url'], mode, known_ad_ids, search = search['name'], update_rows = keep_known, **options
+        )
+        error = None
+    except Exception as e:
+        car_data, live_ad_ids, stats, outcome, error = [], set(), None, 'failed', str(e)
+    return {
+        'name': search['name'],
+        'mode': mode,
+        'records': car_data,
+        'known_records': known_records,
+        'live_ad_ids': live_ad_ids,
+        'outcome': outcome,
+        'error': error,
+        'summary': stats.summary() if stats else None,
+        'seconds': time.perf_counter() - start,
+    }
+
+def scrape_searches(searches, workers = MULTI_SEARCH_WORKERS, full_sweep = False, full_sweep_every = FULL_SWEEP_INTERVAL,
+                    known_run = KNOWN_RUN_TO_STOP, source = DEFAULT_SOURCE, parser = DEFAULT_PARSER,
+                    max_scrolls = DEFAULT_MAX_SCROLLS, max_pages = MAX_API_PAGES):
+    '''
+    Scrapes every search in `searches` (from `load_searches`) with up to `workers` processes.
+    Each search is incremental unless `full_sweep` or its last complete full sweep is older than `full_sweep_every`.
+    Returns: {search name: result summary}
+    '''
+    create_scrape_runs_table()
+    create_ad_searches_table()
+    started = datetime.now()
+    known_ad_ids = frozenset(get_ad_ids(TABLE_NAME))
+    modes = {s['name']: 'full' if full_sweep else choose_scrape_mode(full_sweep_every, s['name']) for s in searches}
+    options = {'known_run': known_run, 'source': source, 'parser': parser, 'max_scrolls': max_scrolls, 'max_pages': max_pages}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers = min(workers, len(searches)), initializer = _init_worker) as executor:
+        futures = [executor.submit(_scrape_one, s, modes[s['name']], known_ad_ids, options) for s in searches]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result['name']] = result
+            if result['error']:
+                print(f"❌ Search '{result['name']}' failed: {result['error']}")
+            else:
+                print(f"✅ '{result['name']}' ({result['mode']}): {len(result['live_ad_ids'])} listed, "
+                      f"{len(result['records'])} new in {result['seconds']:.1f}s")
+
+    # Ads listed by several searches are only written once
+    new_records = {}
+    for result in results.values():
+        for record in result['records']:
+            new_records.setdefault(record['Ad ID'], record)
+    save_to_sql(list(new_records.values()), TABLE_NAME)
+    found = sum(len(r['records']) for r in results.values())
+    print(f"🆕 {len(new_records)} new ads across {len(searches)} searches ({found - len(new_records)} duplicates merged)")
+
+    seen_records = {}
+    for result in results.values():
+        for record in result['known_records']:
+            seen_records.setdefault(record['Ad ID'], record)
+    changed = save_ad_changes(list(seen_records.values()), TABLE_NAME)
+    print(f"✏️ {changed} of {len(seen_records)} already-saved ads changed")
+
+    # Record every search's listings before removing anything, so an ad that moved between searches is kept
+    for result in results.values():
+        if not result['error']:
+            save_ad_searches(result['name'], result['live_ad_ids'])
+    removed = 0
+    for result in results.values():
+        if result['error']:
+            continue
+        result['removed'] = reconcile_search(result['name'], result['mode'], result['outcome'], result['live_ad_ids'])
+        removed += result['removed']
+        save_scrape_run(result['mode'], started, len(result['live_ad_ids']), len(result['records']), result['removed'],
+                        result['outcome'] == 'end', result['name'])
+    print(f"⏱️ {len(searches)} searches in {(datetime.now() - started).total_seconds():.1f}s, {removed} ads removed")
+    return results
@@ -0,0 +1,171 @@
+'''
+Cheap number plate region proposals, used to pick what to OCR before running the full model.
+
+Each image is decoded at reduced size, and plate-shaped windows are scored on
+vertical edge density (character strokes) and local contrast (dark text on a light plate),
+with a penalty for mostly-horizontal texture such as grilles and dashboards.
+Images are ranked by their best window, so interior and wheel shots sink to the bottom.
+'''
+import numpy as np
+from PIL import Image
+
+ANALYSIS_WIDTH = 320 # Images are scored at this width
+EDGE_THRESHOLD = 40 # Min neighbouring-pixel difference (0-255) counted as an edge
+WINDOW_HEIGHTS = (8, 12, 16, 22, 30) # At ANALYSIS_WIDTH
+WINDOW_ASPECTS = (3.0, 4.5) # UK plates are ~4.7:1, but angled shots look squarer
+WINDOW_STRIDE = 2
+NMS_OVERLAP = 0.3
+CROP_PADDING = (0.15, 0.35) # Fraction of box width/height added around each crop
+MIN_CROP_HEIGHT = 64 # Crops are upscaled to at least this height before OCR
+
+
+def _load_grey(path):
+    with Image.open(path) as img:
+        full_size = img.size
+        # JPEG decodes straight to a smaller scale (DCT scaling), skipping most of the decode work
+        img.draft('L', (ANALYSIS_WIDTH * 2, ANALYSIS_WIDTH * 2))
+        img = img.convert('L')
+        scale = ANALYSIS_WIDTH / img.width
+        small = img.resize((ANALYSIS_WIDTH, max(int(img.height * scale), 1)), Image.BILINEAR)
+    return np.asarray(small, dtype = np.float32), full_size
+
+def _integral(a):
+    ''' Summed-area table with a zero row/column, so window sums are four lookups. '''
+    out = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype = np.float64)
+    out[1:, 1:] = a.cumsum(0).cumsum(1)
+    return out
+
+def _window_sums(ii, h, w):
+    return ii[h::WINDOW_STRIDE, w::WINDOW_STRIDE] \
+        - ii[:-h:WINDOW_STRIDE, w::WINDOW_STRIDE] \
+        - ii[h::WINDOW_STRIDE, :-w:WINDOW_STRIDE] \
+        + ii[:-h:WINDOW_STRIDE, :-w:WINDOW_STRIDE]
+
+def _overlap(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    if not inter:
+        return 0.0
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+def _grow_box(v_edges, box):
+    '''
+    Windows tend to lock onto a few characters; grow the box sideways across the rest of the text
+    (gaps up to one box height, i.e. the space between character groups) and up/down across rows of strokes.
+    '''
+    x0, y0, x1, y1 = box
+    rows, cols = v_edges.shape
+    gap = max(y1 - y0, 2)
+    while x0 > 0 and v_edges[y0:y1, max(x0 - gap, 0):x0].any():
+        x0 -= 1
+    while x1 < cols and v_edges[y0:y1, x1:x1 + gap].any():
+        x1 += 1
+
+    row_strokes = v_edges[:, x0:x1].sum(axis = 1)
+    threshold = max(row_strokes[y0:y1].mean() * 0.3, 1)
+    while y0 > 0 and row_strokes[y0 - 1] >= threshold:
+        y0 -= 1
+    while y1 < rows and row_strokes[y1] >= threshold:
+        y1 += 1
+    return x0, y0, x1, y1
+
+def score_windows(grey):
+    '''
+    Scores every plate-shaped window of a greyscale array.
+    Returns: (list of (score, (x0, y0, x1, y1)) in `grey`'s coordinates best first, vertical edge map)
+    '''
+    v_edges = np.zeros_like(grey)
+    v_edges[:, 1:] = np.abs(np.diff(grey, axis = 1)) > EDGE_THRESHOLD
+    h_edges = np.zeros_like(grey)
+    h_edges[1:, :] = np.abs(np.diff(grey, axis = 0)) > EDGE_THRESHOLD
+
+    ii_v, ii_h = _integral(v_edges), _integral(h_edges)
+    ii_x, ii_xx = _integral(grey), _integral(grey * grey)
+
+    candidates = []
+    rows, cols = grey.shape
+    for h in WINDOW_HEIGHTS:
+        for aspect in WINDOW_ASPECTS:
+            w = int(h * aspect)
+            if h >= rows or w >= cols:
+                continue
+            area = h * w
+            v_density = _window_sums(ii_v, h, w) / area
+            h_density = _window_sums(ii_h, h, w) / area
+            mean = _window_sums(ii_x, h, w) / area
+            std = np.sqrt(np.maximum(_window_sums(ii_xx, h, w) / area - mean * mean, 0))
+
+            scores = v_density * np.minimum(std / 64, 1) - 0.5 * np.maximum(h_density - v_density, 0)
+            # Keep the best few positions per window size; NMS below picks across sizes
+            flat = scores.ravel()
+            top = np.argpartition(flat, -min(8, flat.size))[-min(8, flat.size):]
+            for idx in top:
+                y, x = divmod(int(idx), scores.shape[1])
+                y0, x0 = y * WINDOW_STRIDE, x * WINDOW_STRIDE
+                candidates.append((float(flat[idx]), (x0, y0, x0 + w, y0 + h)))
+
+    candidates.sort(key = lambda c: c[0], reverse = True)
+    return candidates, v_edges
+
+def propose_regions(path, max_regions = 2):
+    '''
+    Returns: list of (score, (x0, y0, x1, y1)) plate candidates in `path`'s pixel coordinates, best first.
+    Boxes are padded so characters at the plate edge aren't clipped.
+    '''
+    grey, (full_w, full_h) = _load_grey(path)
+    scale = full_w / grey.shape[1]
+
+    candidates, v_edges = score_windows(grey)
+    picked = []
+    for score, box in candidates:
+        if score <= 0:
+            break
+        box = _grow_box(v_edges, box)
+        if any(_overlap(box, other) > NMS_OVERLAP for _, other in picked):
+            continue
+        picked.append((score, box))
+        if len(picked) >= max_regions:
+            break
+
+    regions = []
+    for score, (x0, y0, x1, y1) in picked:
+        pad_x, pad_y = (x1 - x0) * CROP_PADDING[0], (y1 - y0) * CROP_PADDING[1]
+        regions.append((round(score, 4), (
+            max(int((x0 - pad_x) * scale), 0),
+            max(int((y0 - pad_y) * scale), 0),
+            min(int((x1 + pad_x) * scale), full_w),
+            min(int((y1 + pad_y) * scale), full_h),
+        )))
+    return regions
+
+def rank_plate_crops(paths, top_images = 4, crops_per_image = 2):
+    '''
+    Ranks images by their best plate candidate and returns the crops worth OCR'ing.
+    Returns: list of (path, box), best image first. Unreadable images are skipped.
+    '''
+    ranked = []
+    for path in paths:
+        try:
+            regions = propose_regions(path, crops_per_image)
+        except Exception as e:
+            print(f"⚠️ Could not score {path} for plates: {e}")
+            continue
+        if regions:
+            ranked.append((regions[0][0], path, regions))
+
+    ranked.sort(key = lambda r: r[0], reverse = True)
+    return [(path, box) for _, path, regions in ranked[:top_images] for _, box in regions]
+
+def crop_region(path, box, height = None):
+    '''
+    Returns the greyscale crop `box` of `path` as a uint8 array, upscaled to MIN_CROP_HEIGHT if smaller,
+    or scaled to exactly `height` if given (so crops can be stacked into one OCR batch).
+    '''
+    with Image.open(path) as img:
+        crop = img.convert('L').crop(box)
+    target = height or max(crop.height, MIN_CROP_HEIGHT)
+    if crop.height != target:
+        scale = target / crop.height
+        crop = crop.resize((max(int(crop.width * scale), 1), target), Image.BICUBIC)
+    return np.asarray(crop, dtype = np.uint8)
@@ -0,0 +1,178 @@
+import asyncio, time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.listing_parser import build_ad_record
+
+THUMBNAIL_FETCHERS = 8 # Concurrent thumbnail downloads
+DB_BATCH_SIZE = 50 # Rows per commit
+QUEUE_SIZE = 100 # Max records waiting between stages; a full queue pauses the stage feeding it
+
+_DONE = object() # Sentinel closing a stage's input queue
+
+
+class PipelineStats:
+    ''' Per-stage counters and busy time for one pipeline run. '''
+    def __init__(self):
+        self.parsed = 0
+        self.duplicates = 0
+        self.known = 0
+        self.thumbnails_fetched = 0
+        self.thumbnails_failed = 0
+        self.written = 0
+        self.write_batches = 0
+        self.changed = 0 # Already-saved ads whose listing changed
+        self.update_seconds = 0.0
+        self.parse_seconds = 0.0
+        self.fetch_seconds = 0.0 # Summed across fetchers
+        self.write_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def summary(self):
+        return (
+            f"parse: {self.parsed} cards ({self.known} known, {self.duplicates} duplicate) in {self.parse_seconds:.1f}s | "
+            f"thumbnails: {self.thumbnails_fetched} ok, {self.thumbnails_failed} failed, {self.fetch_seconds:.1f}s busy | "
+            f"db: {self.written} rows in {self.write_batches} batches, {self.write_seconds:.1f}s, "
+            f"{self.changed} of {self.known} known changed in {self.update_seconds:.1f}s | "
+            f"wall: {self.wall_seconds:.1f}s"
+        )
+
+
+async def _produce(listing_fields, known_ad_ids, live_ad_ids, known_records, thumb_queue, stats):
+    ''' Stage 1: turn raw listing fields into records, drop duplicates and set already-saved ads aside. '''
+    iterator = iter(listing_fields)
+    # Lazy sources may block (e.g. WebDriver calls in dom mode), so pull from them off the event loop.
+    # A dedicated thread keeps the source from queueing behind thumbnail downloads in the default executor.
+    blocking = not isinstance(listing_fields, (list, tuple))
+    loop = asyncio.get_running_loop()
+    source_executor = ThreadPoolExecutor(max_workers = 1) if blocking else None
+    try:
+        await _consume_source(iterator, blocking, loop, source_executor, known_ad_ids, live_ad_ids, known_records, thumb_queue, stats)
+    finally:
+        if source_executor:
+            source_executor.shutdown(wait = False)
+
+async def _consume_source(iterator, blocking, loop, source_executor, known_ad_ids, live_ad_ids, known_records, thumb_queue, stats):
+    while True:
+        start = time.perf_counter()
+        if blocking:
+            fields = await loop.run_in_executor(source_executor, next, iterator, _DONE)
+        else:
+            fields = next(iterator, _DONE)
+        if fields is _DONE:
+            break
+        record = build_ad_record(fields)
+        stats.parse_seconds += time.perf_counter() - start
+        stats.parsed += 1
+
+        ad_id = record['Ad ID']
+        if not ad_id or ad_id in live_ad_ids:
+            stats.duplicates += 1
+            continue
+        live_ad_ids.add(ad_id)
+
+        if ad_id in known_ad_ids:
+            stats.known += 1
+            known_records.append(record)
+            continue
+
+        if not fields.get('title'):
+            print("⚠️ Skipped listing with missing title or fields.")
+        await thumb_queue.put((record, fields.get('thumbnail_url')))
+
+async def _fetch_thumbnails(fetch_thumbnail, thumb_queue, write_queue, stats):
+    ''' Stage 2: download the thumbnail for each new record, then pass the record on. '''
+    while True:
+        item = await thumb_queue.get()
+        if item is _DONE:
+            break
+        record, thumbnail_url = item
+        if thumbnail_url:
+            start = time.perf_counter()
+            ok = await asyncio.to_thread(fetch_thumbnail, record['Ad ID'], thumbnail_url)
+            stats.fetch_seconds += time.perf_counter() - start
+            if ok:
+                stats.thumbnails_fetched += 1
+            else:
+                stats.thumbnails_failed += 1
+        await write_queue.put(record)
+
+async def _write(write_rows, write_queue, batch_size, new_records, stats):
+    ''' Stage 3: commit records in batches of `batch_size`. '''
+    batch = []
+
+    async def flush():
+        if not batch:
+            return
+        if write_rows:
+            start = time.perf_counter()
+            await asyncio.to_thread(write_rows, list(batch))
+            stats.write_seconds += time.perf_counter() - start
+            stats.written += len(batch)
+            stats.write_batches += 1
+        new_records.extend(batch)
+        batch.clear()
+
+    while True:
+        record = await write_queue.get()
+        if record is _DONE:
+            break
+        batch.append(record)
+        if len(batch) >= batch_size:
+            await flush()
+    await flush()
+
+async def _run(listing_fields, known_ad_ids, fetch_thumbnail, write_rows, update_rows, fetchers, batch_size, queue_size):
+    stats = PipelineStats()
+    live_ad_ids, new_records, known_records = set(), [], []
+    thumb_queue = asyncio.Queue(maxsize = queue_size)
+    write_queue = asyncio.Queue(maxsize = queue_size)
+
+    async def produce_then_close():
+        try:
+            await _produce(listing_fields, known_ad_ids, live_ad_ids, known_records, thumb_queue, stats)
+        finally:
+            for _ in range(fetchers):
+                await thumb_queue.put(_DONE)
+
+    async def fetch_then_close():
+        await asyncio.gather(*(
+            _fetch_thumbnails(fetch_thumbnail, thumb_queue, write_queue, stats) for _ in range(fetchers)
+        ))
+        await write_queue.put(_DONE)
+
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(produce_then_close()),
+        asyncio.create_task(fetch_then_close()),
+        asyncio.create_task(_write(write_rows, write_queue, batch_size, new_records, stats)),
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    if update_rows and known_records:
+        # One batch for the whole scrape; only the changed rows get written
+        start_update = time.perf_counter()
+        stats.changed = await asyncio.to_thread(update_rows, known_records) or 0
+        stats.update_seconds = time.perf_counter() - start_update
+    stats.wall_seconds = time.perf_counter() - start
+    return new_records, live_ad_ids, stats
+
+def run_scrape_pipeline(listing_fields, known_ad_ids, fetch_thumbnail, write_rows = None,
+                        fetchers = THUMBNAIL_FETCHERS, batch_size = DB_BATCH_SIZE, queue_size = QUEUE_SIZE, update_rows = None):
+    '''
+    Runs parse -> thumbnail fetch -> DB write as concurrent stages connected by bounded queues.
+
+    - `listing_fields`: iterable of raw field dicts (see listing_parser.parse_listings); may block between items
+    - `known_ad_ids`: Ad IDs already saved; these are counted as live but not fetched or written
+    - `fetch_thumbnail(ad_id, url)`: returns truthy on success
+    - `write_rows(records)`: persists a batch; None skips the DB stage (records are still returned)
+    - `update_rows(records)`: receives every already-saved ad's fresh record once parsing is done, for change
+      detection; returns how many changed. None skips it.
+
+    Returns: (new records, set of every live Ad ID seen, PipelineStats)
+    '''
+    return asyncio.run(_run(listing_fields, known_ad_ids, fetch_thumbnail, write_rows, update_rows, fetchers, batch_size, queue_size))
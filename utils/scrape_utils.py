@@ -1,7 +1,10 @@
 import pandas as pd
-import os, time, re, requests, hashlib
-from datetime import datetime
+import os, time, re, requests, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from pathlib import Path
+from urllib.parse import urlparse, parse_qsl, urlencode
+from requests.adapters import HTTPAdapter
 
 # Silence warnings/errors
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # Silence Tensorflow warnings: 0 = all logs, 1 = filter INFO, 2 = filter WARNING, 3 = filter ERROR
@@ -12,22 +15,86 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium_stealth import stealth
 
 # Database functions
-from utils.database_utils import check_ad_id_exists, get_saved_ad_ids, delete_ads, load_ads
-from utils.general_utils import extract_post_date
+from utils.database_utils import get_ad_ids, get_saved_ad_ids, save_to_sql, save_ad_changes, create_scrape_runs_table, save_scrape_run, get_last_full_sweep
+from utils.database_utils import create_ad_searches_table, create_file_tombstones_table, save_ad_searches, reconcile_search_ads
+from utils.file_cleaner import clean_tombstoned_files
+from utils.listing_parser import parse_listings, make_ad_url, make_ad_id
+from utils.search_api import fetch_search_results, load_template, template_path, SearchAPIError
+from utils.scrape_pipeline import run_scrape_pipeline
+from utils.image_variants import schedule_variants
+from utils.image_store import media_key, has_blob, link_blob, store, update_manifest
+from utils.caz_client import save_debug_page
+from utils.driver_pool import create_pool
+from utils.metrics import instrument_session
 
 
 # TODO: Avoid needing these parameters here. Add to scraper.py instead, or when implementing changing search filters
 # With filters: Under £5k, within 50 miles of Caerphilly, Automatic transmission, <125k miles
 AUTOTRADER_URL = "https://www.autotrader.co.uk/car-search?maximum-mileage=125000&postcode=CF83%208TF&price-to=5000&radius=50&sort=relevance&transmission=Automatic"  
 DEFAULT_MAX_SCROLLS = 1 # Maybe default should be all ads possible?
+DEFAULT_PARSER = 'html' # 'html' (single page_source snapshot) or 'dom' (per-element WebDriver calls)
+DEFAULT_SOURCE = 'browser' # 'browser' (scroll the results page) or 'api' (replay the site's search API, see search_api.py)
+CARD_SELECTOR = "div[data-testid='advertCard']"
+
+# Scrolling and incremental scrapes
+SCROLL_PAUSE = 2.5 # Longest wait for more cards after a scroll; returns as soon as they appear
+SCROLL_POLL = 0.25
+NEWEST_FIRST_SORT = 'datedesc' # Listing order for incremental scrapes, so new ads come first
+KNOWN_RUN_TO_STOP = 20 # Incremental scrapes stop once this many consecutive cards are already saved
+FULL_SWEEP_INTERVAL = timedelta(hours = 24) # How often a full sweep (and stale ad removal) is due
+MAX_API_PAGES = 100 # Search API pages fetched per scrape
 TABLE_NAME = 'ads'
 DATA_DIR = Path('data')
 
-def create_stealth_driver(headless=True, url = AUTOTRADER_URL):
+# Gallery download concurrency
+IMAGE_DOWNLOAD_WORKERS = 8 # Total threads downloading images for one ad
+MAX_CONNECTIONS_PER_HOST = 6 # Cap on simultaneous requests to any single image host
+IMAGE_TIMEOUT = 10
+
+# Warm browser pool shared by scraping, picture downloads and CAZ checks
+DRIVER_POOL_SIZE = 2 # Max concurrent Chrome instances per process
+DRIVER_MAX_USES = 25 # Recycle a browser after this many checkouts
+DRIVER_IDLE_TIMEOUT = 300 # Seconds before an unused browser is quit
+
+# Shared keep-alive session so image requests reuse TCP/TLS connections
+_http_session = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections = 4, pool_maxsize = IMAGE_DOWNLOAD_WORKERS)
+_http_session.mount('https://', _http_adapter)
+_http_session.mount('http://', _http_adapter)
+instrument_session(_http_session, 'images')
+
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def _host_semaphore(url):
+    ''' Returns the semaphore limiting concurrent requests to the host of `url`. '''
+    host = urlparse(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(MAX_CONNECTIONS_PER_HOST)
+        return _host_semaphores[host]
+
+def fetch_image(url, timeout = IMAGE_TIMEOUT):
+    ''' GET an image through the shared session, respecting the per-host limit. Returns the response. '''
+    with _host_semaphore(url):
+        return _http_session.get(url, timeout = timeout)
+
+_chromedriver_path = None
+
+def get_chromedriver_path():
+    ''' Resolves the chromedriver binary once per process rather than on every browser launch. '''
+    global _chromedriver_path
+    if _chromedriver_path is None:
+        _chromedriver_path = ChromeDriverManager().install()
+    return _chromedriver_path
+
+def create_stealth_driver(headless=True, url = AUTOTRADER_URL, performance_log = False):
+    ''' `performance_log`: record DevTools network events, readable with driver.get_log('performance'). '''
     options = Options()
     if headless:
         options.add_argument("--headless=new")      
@@ -39,8 +106,10 @@ def create_stealth_driver(headless=True, url = AUTOTRADER_URL):
     options.add_argument("--disable-features=UseModernMediaControls,SyncService")
     options.add_argument("--disable-gl-drawing-for-tests")
     options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    if performance_log:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
     
-    service = Service(ChromeDriverManager().install(), log_path = os.devnull)
+    service = Service(get_chromedriver_path(), log_path = os.devnull)
     driver = webdriver.Chrome(service=service, options=options)
 
     # Apply stealth settings
@@ -53,11 +122,25 @@ def create_stealth_driver(headless=True, url = AUTOTRADER_URL):
         fix_hairline=True,
     )    
     
-    driver.get(url)
+    if url:
+        driver.get(url)
     
     return driver
 
+DRIVER_POOL = create_pool(
+    lambda: create_stealth_driver(headless = True, url = None),
+    max_size = DRIVER_POOL_SIZE,
+    max_uses = DRIVER_MAX_USES,
+    idle_timeout = DRIVER_IDLE_TIMEOUT
+)
+
 def reject_cookies(driver, timeout=15):
+    # Pooled browsers keep their cookies, so the consent modal only appears once per site
+    host = urlparse(driver.current_url).netloc
+    consent_handled = getattr(driver, 'consent_handled', set())
+    if host in consent_handled:
+        return
+
     try:
         # Wait for iframe containing the cookie modal
         WebDriverWait(driver, timeout).until(
@@ -76,6 +159,9 @@ def reject_cookies(driver, timeout=15):
 
         # Important: switch back to main content
         driver.switch_to.default_content()
+        
+        consent_handled.add(host)
+        driver.consent_handled = consent_handled
 
     except Exception as e:
         print("⚠️ Failed to handle cookie popup:", e)
@@ -94,186 +180,237 @@ def extract_highest_res_images(ad_urls):
     
     return [info[1] for info in best_images.values()]
 
-def scrape_autotrader(save_to_excel = True, max_scrolls = DEFAULT_MAX_SCROLLS):
-    DATA_DIR.mkdir(parents=True, exist_ok=True)    
-    driver = create_stealth_driver(headless = True, url = AUTOTRADER_URL)    
+def extract_listing_fields(listing):
+    '''
+    Reads the raw fields of one advert card through WebDriver (one round trip per field).
+    Returns the same dict shape as `parse_listings`.
+    '''
+    def text_of(selector):
+        try:
+            return listing.find_element(By.CSS_SELECTOR, selector).text
+        except:
+            return ""
+
+    try:
+        title_elem = listing.find_element(By.CSS_SELECTOR, "a[data-testid='search-listing-title']")
+        thumbnail_elem = listing.find_element(By.CSS_SELECTOR, "img.main-image")
+        thumbnail_url = thumbnail_elem.get_attribute("src")
+        href = title_elem.get_attribute("href")
+    except:
+        href = None
+        thumbnail_url = None
+
+    return {
+        'href': href,
+        'thumbnail_url': thumbnail_url,
+        'title': text_of("[data-testid='search-listing-title']"),
+        'subtitle': text_of("[data-testid='search-listing-subtitle']"),
+        'price': text_of("div[class*='at__sc-u4ap7c-12'] span"),
+        'mileage': text_of("[data-testid='mileage']"),
+        'reg_year': text_of("[data-testid='registered_year']"),
+        'location': text_of("[data-testid='search-listing-location']"),
+    }
+
+def with_sort(url, sort):
+    ''' `url` with its `sort=` query parameter replaced. '''
+    parts = urlparse(url)
+    query = dict(parse_qsl(parts.query))
+    query['sort'] = sort
+    return parts._replace(query = urlencode(query)).geturl()
+
+def count_cards(driver):
+    return len(driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR))
+
+def card_ad_ids(driver):
+    ''' Ad IDs of the loaded cards in listing order, read in one WebDriver round trip. '''
+    hrefs = driver.execute_script(f'''
+        return Array.from(document.querySelectorAll("{CARD_SELECTOR}"), card => {{
+            const link = card.querySelector("a[data-testid='search-listing-title']");
+            return link ? link.getAttribute("href") : null;
+        }});
+    ''')
+    return [make_ad_id(make_ad_url(href)) for href in hrefs if href]
+
+def longest_known_run(ad_ids, known_ad_ids):
+    ''' Length of the longest stretch of consecutive `ad_ids` that are already saved. '''
+    run = longest = 0
+    for ad_id in ad_ids:
+        run = run + 1 if ad_id in known_ad_ids else 0
+        longest = max(longest, run)
+    return longest
+
+def load_search_results(driver, max_scrolls = DEFAULT_MAX_SCROLLS, stop_when = None):
+    '''
+    Waits for the search results page to render, then scrolls to load more cards.
+    `stop_when(driver)`: checked before each scroll; returning True stops scrolling.
+    Returns: 'empty' (no listings appeared), 'end' (no more cards load), 'stopped' (by `stop_when`) or 'max_scrolls'
+    '''
     reject_cookies(driver)
-    time.sleep(3) # Give the page time to render listings
 
     # Wait until at least one car listing is loaded
     try:
         WebDriverWait(driver, 15).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "div[data-testid='advertCard']"))
+            EC.presence_of_element_located((By.CSS_SELECTOR, CARD_SELECTOR))
         )
         print("Listings loaded.")
     except:
         print("Still couldn't find any listings.")
         print(driver.page_source[:2000])
-        driver.quit()
-        return
+        return 'empty'
 
-    # Scroll to bottom until no new content appears (stop at MAX_SCROLLS)
-    scroll_pause_time = 2.5
+    # Scroll to bottom until no new content appears (stop at max_scrolls)
     for i in range(max_scrolls):
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        
-        prev_count = len(driver.find_elements(By.CSS_SELECTOR, "div[data-testid='advertCard']"))
-        time.sleep(scroll_pause_time)
-        new_count = len(driver.find_elements(By.CSS_SELECTOR, "div[data-testid='advertCard']"))
-
-        if new_count == prev_count:
-            print(f"🔄 No new listings detected after scroll #{i+1}. Stopping.")
-            break
-    else:
-        print("⚠️ Max scrolls reached, may still be incomplete.")
-
-    car_data = []
-    listings = driver.find_elements(By.CSS_SELECTOR, "div[data-testid='advertCard']")
-    print(f"🛻 Found {len(listings)} car listings after scrolling.")
-    
-    # Extract listings info
-    for listing in listings: 
-        try:
-            title_elem = listing.find_element(By.CSS_SELECTOR, "a[data-testid='search-listing-title']")
-            thumbnail_elem = listing.find_element(By.CSS_SELECTOR, "img.main-image")
-            thumbnail_url = thumbnail_elem.get_attribute("src")
-            href = title_elem.get_attribute("href")
-            base_href = href.split("?")[0]  # Remove everything after '?'
-            ad_url = "https://www.autotrader.co.uk" + base_href if base_href.startswith("/") else base_href
-        except:
-            ad_url = ""        
-            thumbnail_url = None            
-            
-            
-        # Generate stable ad_id
-        ad_id = hashlib.md5(ad_url.encode('utf-8')).hexdigest()[:10] if ad_url else ""
-        
-        if check_ad_id_exists(ad_id, TABLE_NAME):
-            continue        
-        
-        if thumbnail_url:
-            print(f'📸 Attempting thumbnail download for {ad_id}')
-            download_thumbnail(ad_id, thumbnail_url)
-            
-        try:
-            post_date = extract_post_date(ad_url)
-        except:
-            post_date = ""
-        
-        try:
-            title = listing.find_element(By.CSS_SELECTOR, "[data-testid='search-listing-title']").text
-        except:
-            title = ""
-                    
-        try:
-            price_elem = listing.find_element(By.CSS_SELECTOR, "div[class*='at__sc-u4ap7c-12'] span")
-            price = price_elem.text.strip()
-        except:
-            price = ""
+        if stop_when and stop_when(driver):
+            print(f"⏹️ Stopped scrolling after {i} scroll(s): the rest of the listings are already saved.")
+            return 'stopped'
 
+        prev_count = count_cards(driver)
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
         try:
-            subtitle = listing.find_element(By.CSS_SELECTOR, "[data-testid='search-listing-subtitle']").text
-        except:
-            subtitle = ""
+            # Carry on as soon as more cards render rather than always sleeping the full pause
+            WebDriverWait(driver, SCROLL_PAUSE, poll_frequency = SCROLL_POLL).until(lambda d: count_cards(d) > prev_count)
+        except TimeoutException:
+            print(f"🔄 No new listings detected after scroll #{i+1}. Stopping.")
+            return 'end'
 
-        try:
-            mileage = listing.find_element(By.CSS_SELECTOR, "[data-testid='mileage']").text
-        except:
-            mileage = ""
-            
-        # Convert mileage to numeric
-        mileage_numeric = ""
-        if mileage:
-            try:
-                mileage_numeric = int(mileage.lower().replace("miles", "").replace(",", "").strip())
-            except:
-                pass
+    print("⚠️ Max scrolls reached, may still be incomplete.")
+    return 'max_scrolls'
 
-        try:
-            reg_year = listing.find_element(By.CSS_SELECTOR, "[data-testid='registered_year']").text
-        except:
-            reg_year = ""
+def _scrape_browser(url, max_scrolls, stop_when, parser, known_ad_ids, write_rows, update_rows):
+    ''' Returns: (new records, live Ad IDs, PipelineStats, load_search_results outcome) '''
+    with DRIVER_POOL.driver(url) as driver:
+        outcome = load_search_results(driver, max_scrolls, stop_when)
+        if outcome == 'empty':
+            return [], set(), None, outcome
 
-        try:
-            location = listing.find_element(By.CSS_SELECTOR, "[data-testid='search-listing-location']").text
-        except:
-            location = ""
-            
-        loc_match = re.match(r"(.+?)\s*\((\d+)\s*miles\)", location)
-        if loc_match:
-            city, dist = loc_match.groups()
-            try:
-                dist = int(dist)
-            except ValueError:
-                dist = None
+        if parser == 'html':
+            # One page_source snapshot instead of ~10 WebDriver round trips per card
+            page_source = driver.page_source
         else:
-            city, dist = None, None
-            
-        # Remove subtitle and price from title if present
-        cleaned_title = title
-        if subtitle and subtitle in cleaned_title:
-            cleaned_title = cleaned_title.replace(subtitle, "")
-        if price and price in cleaned_title:
-            cleaned_title = cleaned_title.replace(price, "")
-        cleaned_title = cleaned_title.strip()
-        # Remove trailing newline and comma if present
-        cleaned_title = re.sub(r'[\n\r]+,?$', '', cleaned_title).strip()
-
-        car_data.append({
-            'Ad URL': ad_url,
-            'Ad ID': ad_id,
-            'Title': cleaned_title,
-            'Subtitle': subtitle,
-            'Price': price,
-            'Mileage': mileage_numeric,
-            'Registered Year': reg_year,
-            'Distance (miles)': dist,
-            'Location': city,
-            'Ad post date': post_date,
-            'Favourited': 0,
-            'Excluded': 0,
-            'Scraped at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")                                
-        })
-        
-        if not title:
-            print("⚠️ Skipped listing with missing title or fields.")
-            
-    driver.quit()
-
-    df = pd.DataFrame(car_data)
-    df = df.drop_duplicates(subset = 'Ad ID')
-    
-    # Remove any ads no longer listed
-    live_ad_ids = set(df['Ad ID'])
-    saved_ads = load_ads(TABLE_NAME)
-    saved_ad_ids = set(ad['Ad ID'] for ad in saved_ads)
-    to_remove = saved_ad_ids - live_ad_ids
-    
-    if to_remove:
-        print(f'🗑️ Removing {len(to_remove)} ads no longer listed.')
-        delete_ads(to_remove, TABLE_NAME)
+            # Cards are read lazily so WebDriver calls overlap with thumbnail downloads
+            cards = driver.find_elements(By.CSS_SELECTOR, CARD_SELECTOR)
+            print(f"🛻 Found {len(cards)} car listings after scrolling.")
+            car_data, live_ad_ids, stats = run_scrape_pipeline(
+                (extract_listing_fields(card) for card in cards), known_ad_ids, download_thumbnail, write_rows,
+                update_rows = update_rows
+            )
 
-        # Remove associated thumbnail and image folders
-        for ad_id in to_remove:
-            thumb_path = Path("thumbnails") / f"{ad_id}.jpg"
-            image_folder = Path("images") / ad_id
+    if parser == 'html':
+        listing_fields = parse_listings(page_source)
+        print(f"🛻 Found {len(listing_fields)} car listings after scrolling.")
+        car_data, live_ad_ids, stats = run_scrape_pipeline(
+            listing_fields, known_ad_ids, download_thumbnail, write_rows, update_rows = update_rows
+        )
+    return car_data, live_ad_ids, stats, outcome
+
+def _fetch_api_listings(url, mode, known_ad_ids, known_run, max_pages, search):
+    '''
+    Listings from the search API, recapturing the request once if the saved one is refused.
+    Returns: (raw field dicts, outcome as in load_search_results)
+    '''
+    # Captured from the newest-first search so incremental runs can stop early; order doesn't matter to full sweeps
+    url = with_sort(url, NEWEST_FIRST_SORT)
+    path = template_path(search)
+    kwargs = {'known_ad_ids': known_ad_ids, 'known_run': known_run} if mode == 'incremental' else {}
+    try:
+        return fetch_search_results(load_template(url = url, path = path), max_pages = max_pages, **kwargs)
+    except SearchAPIError as e:
+        print(f"⚠️ {e}; capturing a new search API request")
+        return fetch_search_results(load_template(recapture = True, url = url, path = path), max_pages = max_pages, **kwargs)
+
+def choose_scrape_mode(full_sweep_every = FULL_SWEEP_INTERVAL, search = 'default'):
+    ''' 'full' if no complete full sweep of `search` has finished within `full_sweep_every`, else 'incremental'. '''
+    create_scrape_runs_table()
+    last_full = get_last_full_sweep(search)
+    if last_full is None or datetime.now() - last_full >= full_sweep_every:
+        return 'full'
+    return 'incremental'
+
+def collect_search(url, mode, known_ad_ids, known_run = KNOWN_RUN_TO_STOP, source = DEFAULT_SOURCE, parser = DEFAULT_PARSER,
+                   max_scrolls = DEFAULT_MAX_SCROLLS, max_pages = MAX_API_PAGES, write_rows = None, search = 'default',
+                   update_rows = None):
+    '''
+    Reads one search's listings and downloads thumbnails for the new ones (see `scrape_autotrader` for the options).
+    `write_rows` gets batches of new records, `update_rows` the already-saved ones (see run_scrape_pipeline).
+    Returns: (new records, live Ad IDs, PipelineStats or None, outcome as in load_search_results)
+    '''
+    print(f"🔎 {mode.capitalize()} scrape of '{search}' ({source})")
+    if source == 'api':
+        listing_fields, outcome = _fetch_api_listings(url, mode, known_ad_ids, known_run, max_pages, search)
+        if not listing_fields:
+            return [], set(), None, 'empty'
+        car_data, live_ad_ids, stats = run_scrape_pipeline(
+            listing_fields, known_ad_ids, download_thumbnail, write_rows, update_rows = update_rows
+        )
+        return car_data, live_ad_ids, stats, outcome
 
-            if thumb_path.exists():
-                try:
-                    thumb_path.unlink()
-                    print(f"🗑️ Deleted thumbnail for {ad_id}")
-                except Exception as e:
-                    print(f"⚠️ Could not delete thumbnail for {ad_id}: {e}")
+    if mode == 'incremental':
+        url = with_sort(url, NEWEST_FIRST_SORT)
+        stop_when = lambda driver: longest_known_run(card_ad_ids(driver), known_ad_ids) >= known_run
+    else:
+        stop_when = None
+    return _scrape_browser(url, max_scrolls, stop_when, parser, known_ad_ids, write_rows, update_rows)
+
+def reconcile_search(search, mode, outcome, live_ad_ids):
+    '''
+    Records which ads `search` listed. After a full sweep that reached the end, ads it no longer lists are
+    dropped from it, and those no other search lists either are deleted with their images.
+    Returns: number of ads deleted
+    '''
+    create_ad_searches_table()
+    create_file_tombstones_table()
+    if mode != 'full' or outcome != 'end' or not live_ad_ids:
+        save_ad_searches(search, live_ad_ids)
+        if mode == 'full':
+            print(f"⚠️ Full sweep of '{search}' didn't reach the end of the results; not removing unseen ads.")
+        return 0
+
+    start = time.perf_counter()
+    to_remove = reconcile_search_ads(search, live_ad_ids, TABLE_NAME)
+    if to_remove:
+        print(f'🗑️ Removed {len(to_remove)} ads no longer listed by any search ({(time.perf_counter() - start) * 1000:.0f} ms)')
+
+    # Thumbnails and image links go in parallel; blobs go once nothing references them.
+    # Also finishes any cleanup an earlier run left behind.
+    clean_tombstoned_files()
+    return len(to_remove)
+
+def scrape_autotrader(save_to_excel = True, max_scrolls = DEFAULT_MAX_SCROLLS, parser = DEFAULT_PARSER, save_to_db = False,
+                      mode = 'full', known_run = KNOWN_RUN_TO_STOP, source = DEFAULT_SOURCE, max_pages = MAX_API_PAGES,
+                      url = AUTOTRADER_URL, search = 'default'):
+    '''
+    `source`: 'browser' scrolls the results page in Chrome; 'api' fetches the JSON pages the results page itself loads
+              (up to `max_pages`; `parser` and `max_scrolls` only apply to the browser).
+    `parser`: 'html' parses a single page_source snapshot with lxml; 'dom' reads each card through WebDriver.
+    `save_to_db`: write new ads to SQLite in batches while scraping (otherwise only the returned DataFrame has them),
+                  and rewrite saved ads whose listing changed, recording each change in ad_snapshots.
+    `mode`: 'incremental' sorts newest first and stops once `known_run` consecutive listings are already saved;
+            'full' reads the whole result set and, if it reached the end, removes ads `search` no longer lists
+            (unless another search still does).
+    `url`, `search`: the search to scrape and the name its ads and runs are recorded under.
+    '''
+    DATA_DIR.mkdir(parents=True, exist_ok=True)    
+    create_scrape_runs_table()
+    started = datetime.now()
+
+    # Snapshot of saved ads, taken once so each card is classified in memory
+    known_ad_ids = get_ad_ids(TABLE_NAME)
+    write_rows = (lambda rows: save_to_sql(rows, TABLE_NAME)) if save_to_db else None
+    update_rows = (lambda rows: save_ad_changes(rows, TABLE_NAME)) if save_to_db else None
+
+    car_data, live_ad_ids, stats, outcome = collect_search(
+        url, mode, known_ad_ids, known_run, source, parser, max_scrolls, max_pages, write_rows, search, update_rows
+    )
+    if outcome == 'empty':
+        return
 
-            if image_folder.exists():
-                try:
-                    for file in image_folder.glob("*"):
-                        file.unlink()
-                    image_folder.rmdir()
-                    print(f"🗑️ Deleted image folder for {ad_id}")
-                except Exception as e:
-                    print(f"⚠️ Could not delete image folder for {ad_id}: {e}")
+    df = pd.DataFrame(car_data)
+    print(f"🆕 {len(car_data)} new, {len(live_ad_ids & known_ad_ids)} already saved ({stats.changed} changed).")
+    print(f"⏱️ {stats.summary()}")
 
+    removed = reconcile_search(search, mode, outcome, live_ad_ids)
+    save_scrape_run(mode, started, len(live_ad_ids), len(car_data), removed, outcome == 'end', search)
+    print(f"⏱️ {mode.capitalize()} scrape took {(datetime.now() - started).total_seconds():.1f}s")
     
     if save_to_excel:
         file_path = DATA_DIR / f"cars_{datetime.now().date()}.xlsx"
@@ -283,37 +420,44 @@ def scrape_autotrader(save_to_excel = True, max_scrolls = DEFAULT_MAX_SCROLLS):
 
 def download_thumbnail(ad_id, thumbnail_url, save_dir = 'thumbnails'):
     Path(save_dir).mkdir(parents = True, exist_ok = True)
+    save_path = Path(save_dir) / f"{ad_id}.jpg"
     try:
-        response = requests.get(thumbnail_url, timeout = 10)
+        # Already stored for another ad (e.g. a relisted car): just link it
+        key = media_key(thumbnail_url)
+        if has_blob(key) and link_blob(key, save_path):
+            update_manifest(ad_id, thumbnail = key)
+            print(f'♻️ Reused stored thumbnail for {ad_id}')
+            return True
+
+        response = fetch_image(thumbnail_url)
         if response.status_code == 200:
-            save_path = Path(save_dir) / f"{ad_id}.jpg"
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
+            key = store(response.content, save_path, key)
+            update_manifest(ad_id, thumbnail = key)
+            schedule_variants(save_path)
             print(f'✅ Saved thumbnail to {save_path}')
+            return True
         else:
             print(f'❌ Failed to download image for {ad_id}, status {response.status_code}')     
     except Exception as e:
         print(f"❌ Error downloading thumbnail for {ad_id}: {e}")
+    return False
         
-def download_missing_images(limit = None):
-    ad_ids = get_saved_ad_ids()
-
-    # Maybe sort according to time saved
-    if limit:
-        ad_ids = ad_ids[:limit]
-            
-    for ad_id, ad_url in ad_ids:
-        
+def find_ads_missing_images(limit = None):
+    ''' Returns: [(ad_id, ad_url)] for saved ads whose gallery hasn't been downloaded yet '''
+    missing = []
+    for ad_id, ad_url in get_saved_ad_ids():
         if not ad_url or not ad_id:
             print(f'⚠️ Skipping entry with missing ad_id or ad_url')
             continue
-    
-        folder = Path("images") / ad_id
-        
-        if (folder / "01.jpg").exists():
-            print(f'✅ Images already downloaded for {ad_id}. Skipping.')
+        if (Path("images") / ad_id / "01.jpg").exists():
             continue
-        
+        missing.append((ad_id, ad_url))
+        if limit and len(missing) >= limit:
+            break
+    return missing
+
+def download_missing_images(limit = None):
+    for ad_id, ad_url in find_ads_missing_images(limit):
         print(f'Downloading images for {ad_id}')
         try:
             download_pictures(ad_id, ad_url)
@@ -322,14 +466,11 @@ def download_missing_images(limit = None):
             with open('failed_downloads.log', 'a', encoding='utf-8') as log:
                 log.write(f'{ad_id}, {ad_url}\n')
 
-def download_pictures(ad_id, ad_url, progress_callback = None):
-    folder = Path("images") / ad_id
-    folder.mkdir(parents=True, exist_ok=True)
-    
-    if progress_callback:
-        progress_callback('Launching browser...')    
-    driver = create_stealth_driver(headless = True, url = ad_url)
-    
+def extract_gallery_urls(driver, ad_id, progress_callback = None):
+    '''
+    Opens the gallery on an already-loaded ad page and collects the highest resolution image URLs.
+    Returns: list of image URLs, or None if the gallery couldn't be opened
+    '''
     if progress_callback:
         progress_callback('Rejecting cookies...')
     reject_cookies(driver)
@@ -359,8 +500,7 @@ def download_pictures(ad_id, ad_url, progress_callback = None):
     except Exception as e:
         print(f"⚠️ Failed to click thumbnail for {ad_id}: {e}")
         driver.save_screenshot(f"screenshots/error_click_{ad_id}.png")
-        driver.quit()
-        return
+        return None
     
     # Extract image URLs    
     try:   
@@ -400,31 +540,93 @@ def download_pictures(ad_id, ad_url, progress_callback = None):
     except Exception as e:
         print(f"⚠️ Could not extract image URLs for {ad_id}: {e}")
         img_urls = []
+
+    return img_urls
+
+def download_pictures(ad_id, ad_url, progress_callback = None):
+    folder = Path("images") / ad_id
+    folder.mkdir(parents=True, exist_ok=True)
+    
+    if progress_callback:
+        progress_callback('Launching browser...')    
+    with DRIVER_POOL.driver(ad_url) as driver:
+        img_urls = extract_gallery_urls(driver, ad_id, progress_callback)
+    
+    if img_urls is None:
+        return
         
     total_images = len(img_urls)        
     
     if progress_callback:
         progress_callback(f'Downloading {total_images} image(s)...')
 
-    # Download images with progress
-    for i, img_url in enumerate(img_urls):
-        try:
-            img_data = requests.get(img_url, timeout=10).content
-            with open(folder / f"{i+1:02}.jpg", "wb") as f:
-                f.write(img_data)
-                
-            # Call progress callback to get how many images downloaded out of total
-            if progress_callback:
-                progress_callback(i + 1, total_images)
-                
-        except Exception as e:
-            print(f"❌ Failed to download image {i+1} for {ad_id}: {e}")
+    # Download images concurrently with progress
+    saved = download_images(ad_id, img_urls, folder, progress_callback = progress_callback)
 
-    driver.quit()
-    print(f"✅ Downloaded {len(img_urls)} images for {ad_id}")
+    print(f"✅ Downloaded {saved}/{total_images} images for {ad_id}")
     
+def download_images(ad_id, img_urls, folder, progress_callback = None, max_workers = IMAGE_DOWNLOAD_WORKERS):
+    '''
+    Downloads `img_urls` into `folder` as 01.jpg, 02.jpg, ... using a bounded thread pool.
+    `progress_callback(current, total, filename)` is called as each image completes (in completion order).
+    Returns: number of images saved
+    '''
+    total_images = len(img_urls)
+    if not total_images:
+        return 0
+
+    completed = 0
+    reused = 0
+    manifest = {}
+    progress_lock = threading.Lock()
+
+    def fetch_one(i, img_url):
+        nonlocal reused
+        filename = f"{i+1:02}.jpg"
+        save_path = folder / filename
+        key = media_key(img_url)
+        if has_blob(key) and link_blob(key, save_path):
+            # Same photo already stored for another ad: linked instead of downloading
+            with progress_lock:
+                reused += 1
+        else:
+            response = fetch_image(img_url)
+            response.raise_for_status()
+            key = store(response.content, save_path, key)
+            schedule_variants(save_path)
+        manifest[filename] = key
+        return filename
+
+    with ThreadPoolExecutor(max_workers = min(max_workers, total_images)) as executor:
+        futures = {executor.submit(fetch_one, i, img_url): i for i, img_url in enumerate(img_urls)}
+        try:
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    filename = future.result()
+                except Exception as e:
+                    print(f"❌ Failed to download image {i+1} for {ad_id}: {e}")
+                    continue
+
+                # Call progress callback to get how many images downloaded out of total
+                with progress_lock:
+                    completed += 1
+                    if progress_callback:
+                        progress_callback(completed, total_images, filename)
+        except BaseException:
+            # e.g. JobCancelled from the callback: drop the downloads that haven't started instead of
+            # waiting for all of them on the way out of the `with`
+            executor.shutdown(cancel_futures = True)
+            raise
+
+    update_manifest(ad_id, images = manifest)
+    if reused:
+        print(f"♻️ Reused {reused} stored image(s) for {ad_id}")
+    return completed
+
 def check_caz(registration="FL56DPZ"):    
-    driver = create_stealth_driver(headless = True, url = "https://multiple-vehiclecheck-pay.drive-clean-air-zone.service.gov.uk/what_would_you_like_to_do")
+    driver = DRIVER_POOL.acquire()
+    discard = False
 
     try:
         wait = WebDriverWait(driver, 15)
@@ -509,14 +711,17 @@ def check_caz(registration="FL56DPZ"):
                 })                    
         except Exception as e:
             print("❌ Could not scrape results table")
-            with open("debug_page.html", "w", encoding="utf-8") as f:
-                f.write(driver.page_source)
+            save_debug_page(registration, driver.page_source)
             raise e       
 
         return results
 
+    except Exception:
+        discard = True
+        raise
+
     finally:
-        driver.quit()
+        DRIVER_POOL.release(driver, discard = discard)
 
 
 if __name__ == '__main__':
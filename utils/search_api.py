@@ -0,0 +1,357 @@
+'''
+Search results from AutoTrader's own JSON (the GraphQL gateway the results page calls), without scrolling.
+
+- `capture_search_template` loads the results page once in Chrome with DevTools performance logging, finds the
+  search request the page makes and saves its URL, headers, body and cookies (data/search_api_template.json).
+- `fetch_search_results` replays that request with `requests` for every page, several pages at once,
+  and maps each listing to the raw field dict `listing_parser.parse_listings` returns, so the rest of the
+  scrape (build_ad_record, thumbnails, DB writes) is unchanged.
+- `parse_page_state` reads the same listings from state embedded in a results page's HTML.
+
+The payload's exact shape isn't documented, so listings are found by walking the JSON for advert-like objects
+and fields are read from a few candidate keys. `record_dir` saves raw pages so they can be replayed offline.
+'''
+import copy, json, os, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.db_connection import DATA_DIR
+from utils.general_utils import TokenBucket
+from utils.metrics import instrument_session
+from utils.listing_parser import make_ad_url, make_ad_id
+
+SEARCH_API_PATH = os.getenv('AUTOTRADER_SEARCH_API_PATH', '/at-gateway') # Requests to this path are the search API
+TEMPLATE_PATH = DATA_DIR / 'search_api_template.json'
+SEARCH_API_WORKERS = 6 # Pages fetched at once
+SEARCH_API_RATE_LIMIT = 5 # Pages per second
+SEARCH_API_TIMEOUT = 20
+MAX_PAGES = 100
+
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections = 1, pool_maxsize = SEARCH_API_WORKERS))
+_session.mount('http://', HTTPAdapter(pool_connections = 1, pool_maxsize = SEARCH_API_WORKERS))
+instrument_session(_session, 'search_api')
+_rate_limiter = TokenBucket(SEARCH_API_RATE_LIMIT, SEARCH_API_WORKERS)
+_template_lock = threading.Lock()
+
+_MILEAGE_PATTERN = re.compile(r"^[\d,]+\s*miles$", re.IGNORECASE)
+_YEAR_PATTERN = re.compile(r"^(19|20)\d{2}(\s*\(.+reg\))?$")
+_PAGE_STATE_PATTERNS = [
+    re.compile(r'<script[^>]*id="__NEXT_DATA__"[^>]*>(.*?)</script>', re.DOTALL),
+    re.compile(r'window\.__(?:PRELOADED|INITIAL)_STATE__\s*=\s*(\{.*?\})\s*;?\s*</script>', re.DOTALL),
+]
+# Headers the browser sets itself; replaying them breaks the request
+_SKIP_HEADERS = {'content-length', 'host', 'cookie', 'accept-encoding', 'connection'}
+
+
+class SearchAPIError(Exception):
+    ''' The search API answered with something we can't use (e.g. the captured request has expired). '''
+
+
+# ----------------------------
+# Capturing the request template
+# ----------------------------
+def template_path(search = 'default'):
+    ''' Each saved search replays its own captured request (its filters are in the request body). '''
+    return TEMPLATE_PATH if search == 'default' else TEMPLATE_PATH.with_name(f"search_api_template_{search}.json")
+
+def capture_search_template(url = None, headless = True, save = True, path = TEMPLATE_PATH):
+    '''
+    Opens `url` (default: scrape_utils.AUTOTRADER_URL) in Chrome and records the search API request it makes.
+    Returns: {'url', 'headers', 'body', 'cookies', 'first_page'} (first_page is the raw response, if available)
+    '''
+    # Imported here: scrape_utils imports this module
+    from utils.scrape_utils import create_stealth_driver, reject_cookies, AUTOTRADER_URL
+
+    driver = create_stealth_driver(headless = headless, url = None, performance_log = True)
+    try:
+        driver.get(url or AUTOTRADER_URL)
+        reject_cookies(driver)
+        time.sleep(3) # Let the results request complete
+        template = _find_search_request(driver)
+        if template is None:
+            raise SearchAPIError(f"No request to {SEARCH_API_PATH} seen while loading the results page")
+        template['cookies'] = {c['name']: c['value'] for c in driver.get_cookies()}
+        template['headers'].setdefault('User-Agent', driver.execute_script("return navigator.userAgent"))
+    finally:
+        driver.quit()
+
+    if save:
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_text(json.dumps(template, indent = 2), encoding = 'utf-8')
+        print(f"📼 Saved search API template to {path}")
+    return template
+
+def _find_search_request(driver):
+    ''' Scans the DevTools performance log for a POST to the search API that returned listings. '''
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if message.get('method') != 'Network.requestWillBeSent':
+            continue
+        request = message['params']['request']
+        if SEARCH_API_PATH not in request['url'] or not request.get('postData'):
+            continue
+        try:
+            body = json.loads(request['postData'])
+            response = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+            first_page = json.loads(response['body'])
+        except Exception:
+            continue
+        if extract_listings(first_page):
+            headers = {k: v for k, v in request['headers'].items() if k.lower() not in _SKIP_HEADERS}
+            return {'url': request['url'], 'headers': headers, 'body': body, 'first_page': first_page}
+    return None
+
+def load_template(recapture = False, url = None, path = TEMPLATE_PATH):
+    ''' Saved template, capturing one from `url` first if there isn't one (or `recapture`). '''
+    with _template_lock:
+        if not recapture and path.exists():
+            return json.loads(path.read_text(encoding = 'utf-8'))
+        return capture_search_template(url, path = path)
+
+
+# ----------------------------
+# Reading listings out of payloads
+# ----------------------------
+def _walk(node):
+    ''' Yields every dict in a JSON document, depth first. '''
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+def _first_value(item, *keys):
+    for key in keys:
+        value = item.get(key)
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+def _is_listing(item):
+    return bool(_first_value(item, 'advertId', 'advert_id', 'fpaLink')) and 'title' in item
+
+def extract_listings(payload):
+    ''' Returns: advert-like dicts in `payload`, in document order (nested adverts aren't repeated) '''
+    listings, seen = [], set()
+    for item in _walk(payload):
+        if not _is_listing(item):
+            continue
+        key = _first_value(item, 'advertId', 'advert_id', 'fpaLink')
+        if key not in seen:
+            seen.add(key)
+            listings.append(item)
+    return listings
+
+def extract_page_count(payload):
+    ''' Total pages of results, if the payload says. '''
+    for item in _walk(payload):
+        value = _first_value(item, 'totalPages', 'pageCount', 'numberOfPages')
+        if isinstance(value, int):
+            return value
+        page = item.get('page')
+        if isinstance(page, dict) and isinstance(page.get('count'), int):
+            return page['count']
+    return None
+
+def _texts(value):
+    ''' Strings from a spec/badge list whose items are strings or {label/text/value} dicts. '''
+    if isinstance(value, str):
+        return [value]
+    texts = []
+    for item in value or []:
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, dict):
+            text = _first_value(item, 'displayText', 'text', 'label', 'value')
+            if isinstance(text, str):
+                texts.append(text)
+    return texts
+
+def _image_url(value):
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = _first_value(value, 'url', 'src', 'href')
+    if isinstance(value, str):
+        return value.replace('{resize}', 'w300') # Image URLs come as templates with a size placeholder
+    return None
+
+def _money(value):
+    if isinstance(value, dict):
+        value = _first_value(value, 'formatted', 'displayValue', 'value', 'amount')
+    if isinstance(value, (int, float)):
+        return f"£{int(value):,}"
+    return value or ""
+
+def map_listing(item):
+    ''' Maps one API listing to the raw field dict produced by `listing_parser.parse_listings`. '''
+    href = _first_value(item, 'fpaLink', 'url', 'href', 'link')
+    if not href and _first_value(item, 'advertId', 'advert_id'):
+        href = f"/car-details/{_first_value(item, 'advertId', 'advert_id')}"
+
+    specs = []
+    for key in ('specs', 'keySpecs', 'keySpecifications', 'vehicleSpecs', 'badges'):
+        specs += _texts(item.get(key))
+
+    mileage = _first_value(item, 'mileage', 'formattedMileage')
+    if isinstance(mileage, dict):
+        mileage = _first_value(mileage, 'mileage', 'value')
+    if isinstance(mileage, (int, float)):
+        mileage = f"{int(mileage):,} miles"
+    mileage = mileage or next((s for s in specs if _MILEAGE_PATTERN.match(s.strip())), "")
+
+    reg_year = _first_value(item, 'registeredYear', 'yearAndPlate', 'year')
+    reg_year = str(reg_year) if reg_year else next((s for s in specs if _YEAR_PATTERN.match(s.strip())), "")
+
+    location = _first_value(item, 'location', 'vehicleLocation', 'sellerLocation') or ""
+    if isinstance(location, dict):
+        location = _first_value(location, 'town', 'name', 'displayName') or ""
+    distance = _first_value(item, 'formattedDistance', 'distance')
+    if isinstance(distance, (int, float)):
+        distance = f"{int(distance)} miles"
+    if location and distance and '(' not in location:
+        location = f"{location} ({distance})"
+
+    return {
+        'href': href,
+        'thumbnail_url': _image_url(_first_value(item, 'images', 'imageUrl', 'mainImage', 'image')),
+        'title': item.get('title') or "",
+        'subtitle': _first_value(item, 'subTitle', 'subtitle', 'attentionGrabber') or "",
+        'price': _money(_first_value(item, 'price', 'formattedPrice')),
+        'mileage': mileage,
+        'reg_year': reg_year,
+        'location': location,
+    }
+
+def parse_page_state(page_source):
+    ''' Raw field dicts from JSON state embedded in a results page (empty if there is none). '''
+    for pattern in _PAGE_STATE_PATTERNS:
+        match = pattern.search(page_source or "")
+        if match:
+            try:
+                return [map_listing(item) for item in extract_listings(json.loads(match.group(1)))]
+            except ValueError:
+                continue
+    return []
+
+
+# ----------------------------
+# Replaying pages
+# ----------------------------
+def _set_page(body, page):
+    ''' Copy of the request body with its page number(s) set to `page`. '''
+    body = copy.deepcopy(body)
+    found = False
+    for item in _walk(body):
+        if isinstance(item.get('page'), int):
+            item['page'] = page
+            found = True
+    if not found:
+        for item in (body if isinstance(body, list) else [body]):
+            item.setdefault('variables', {})['page'] = page
+    return body
+
+def fetch_page(template, page):
+    ''' Returns: the decoded JSON for results page `page` (1-based) '''
+    _rate_limiter.acquire()
+    response = _session.post(
+        template['url'], json = _set_page(template['body'], page), headers = template['headers'],
+        cookies = template.get('cookies'), timeout = SEARCH_API_TIMEOUT,
+    )
+    if response.status_code in (401, 403):
+        raise SearchAPIError(f"Search API refused page {page} ({response.status_code}); the captured session may have expired")
+    response.raise_for_status()
+    payload = response.json()
+    # GraphQL reports failures (including throttling) with a 200 and an `errors` list
+    errors = [item['errors'] for item in (payload if isinstance(payload, list) else [payload]) if isinstance(item, dict) and item.get('errors')]
+    if errors:
+        raise SearchAPIError(f"Search API returned errors for page {page}: {json.dumps(errors)[:200]}")
+    return payload
+
+def fetch_search_results(template = None, max_pages = MAX_PAGES, workers = SEARCH_API_WORKERS,
+                         known_ad_ids = None, known_run = None, record_dir = None):
+    '''
+    Fetches every results page (up to `max_pages`) from the search API, `workers` pages at a time.
+    With `known_ad_ids` and `known_run`, stops after the wave of pages in which `known_run` consecutive
+    listings were already saved (the incremental scrape's rule).
+    `record_dir`: also save each raw page there as page_NNN.json.
+    Returns: (raw field dicts in listing order, outcome: 'end', 'stopped' or 'max_scrolls' as in load_search_results)
+    Raises SearchAPIError for a page with errors, or an empty page before the last one: 'end' would let
+    reconcile_search delete every ad on the missing pages.
+    '''
+    template = template or load_template()
+    record_dir = Path(record_dir) if record_dir else None
+    if record_dir:
+        record_dir.mkdir(parents = True, exist_ok = True)
+
+    def get(page):
+        payload = fetch_page(template, page)
+        if record_dir:
+            (record_dir / f"page_{page:03}.json").write_text(json.dumps(payload), encoding = 'utf-8')
+        return payload
+
+    start = time.perf_counter()
+    first = get(1)
+    total_pages = extract_page_count(first)
+    last_page = min(total_pages or max_pages, max_pages)
+    fields = [map_listing(item) for item in extract_listings(first)]
+    run = 0
+
+    def reached_known_run(page_fields):
+        nonlocal run
+        if not (known_ad_ids and known_run):
+            return False
+        for f in page_fields:
+            run = run + 1 if make_ad_id(make_ad_url(f['href'])) in known_ad_ids else 0
+            if run >= known_run:
+                return True
+        return False
+
+    def check_empty(page, later_pages):
+        ''' An empty page only ends the search at the real end; anywhere else it's a failed page. '''
+        if total_pages and page < total_pages:
+            raise SearchAPIError(f"Search API returned no listings for page {page} of {total_pages}")
+        if any(extract_listings(payload) for payload in later_pages):
+            raise SearchAPIError(f"Search API returned no listings for page {page}, but later pages have some")
+
+    pages, stopped, exhausted = 1, reached_known_run(fields), not fields
+    if exhausted:
+        check_empty(1, [])
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        while pages < last_page and not (stopped or exhausted):
+            wave = range(pages + 1, min(pages + workers, last_page) + 1)
+            payloads = list(executor.map(get, wave))
+            for i, (page, payload) in enumerate(zip(wave, payloads)):
+                page_fields = [map_listing(item) for item in extract_listings(payload)]
+                if not page_fields:
+                    check_empty(page, payloads[i + 1:])
+                    exhausted = True # Ran past the last page
+                    break
+                pages = page
+                fields += page_fields
+                if reached_known_run(page_fields):
+                    stopped = True
+                    break
+
+    if stopped:
+        outcome = 'stopped'
+    elif exhausted or (total_pages and pages >= total_pages):
+        outcome = 'end'
+    else:
+        outcome = 'max_scrolls'
+    elapsed = time.perf_counter() - start
+    print(f"📡 Search API: {len(fields)} listings from {pages} page(s) in {elapsed:.1f}s ({outcome})")
+    return fields, outcome
+
+def load_recorded_pages(folder):
+    ''' Raw field dicts from pages saved with `record_dir`, for offline checks of the mapping. '''
+    fields = []
+    for path in sorted(Path(folder).glob("page_*.json")):
+        fields += [map_listing(item) for item in extract_listings(json.loads(path.read_text(encoding = 'utf-8')))]
+    return fields